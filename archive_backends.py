@@ -0,0 +1,503 @@
+import contextlib
+import hashlib
+import io
+import os
+import pathlib
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Callable, Iterator, NamedTuple, Optional, Union
+
+import py7zr
+from py7zr.callbacks import ExtractCallback
+from py7zr.io import Py7zIO, WriterFactory
+
+from extraction_budget import ExtractionBudget, BudgetedWriterFactory, DeadlineReader
+from logger import getLogger
+
+l = getLogger("main")
+
+# which backend reads each archive type: auto, or the name of a backend
+ARCHIVE_BACKEND_7Z = os.getenv('ARCHIVE_BACKEND_7Z', 'auto')
+ARCHIVE_BACKEND_ZIP = os.getenv('ARCHIVE_BACKEND_ZIP', 'auto')
+# the 7-Zip executable, found on the PATH as 7zz, 7z or 7za if not set
+SEVEN_ZIP_PATH = os.getenv('SEVEN_ZIP_PATH', '')
+
+# an archive path, or for the backends that support it, the archive as a file object
+ArchiveSource = Union[str, BinaryIO]
+# called with how many of the members are extracted out of how many
+ExtractProgressCallback = Callable[[int, int], None]
+
+
+def no_extract_progress(done: int, total: int):
+    pass
+
+
+class ArchiveMember(NamedTuple):
+    name: str
+    is_dir: bool
+    # uncompressed size as declared by the archive headers
+    size: int
+    crc32: Optional[int]
+
+
+class ArchiveBackendError(Exception):
+    pass
+
+
+def get_archive_type(filename: str) -> str:
+    suffix = pathlib.Path(filename).suffix[1:].lower()
+    return suffix if suffix in ("7z", "zip", "rar") else "other"
+
+
+class ArchiveBackend(ABC):
+    name: str
+    formats: frozenset[str]
+    # whether the archive can be read from a file object rather than a path
+    reads_file_objects: bool = False
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def list_members(self, source: ArchiveSource) -> list[ArchiveMember]:
+        pass
+
+    @abstractmethod
+    def stream(self, source: ArchiveSource, member: str, budget: Optional[ExtractionBudget] = None,
+               chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Yields the contents of a member in chunks, each counted against the budget before it is yielded."""
+        pass
+
+    def read_member(self, source: ArchiveSource, member: str, budget: Optional[ExtractionBudget] = None) -> bytes:
+        return b"".join(self.stream(source, member, budget))
+
+    def read_members(self, source: ArchiveSource, members: list[str], budget: Optional[ExtractionBudget] = None,
+                     progress: ExtractProgressCallback = no_extract_progress) -> dict[str, bytes]:
+        """Reads the members into memory by name, raises ExtractionBudgetExceeded once over the budget."""
+        contents = {}
+        for done, member in enumerate(members, 1):
+            contents[member] = self.read_member(source, member, budget)
+            progress(done, len(members))
+        return contents
+
+    def hash_members(self, source: ArchiveSource, members: list[str],
+                     budget: Optional[ExtractionBudget] = None) -> dict[str, bytes]:
+        """Returns the BLAKE2b digest of each member by name, hashing them while they are decompressed."""
+        return {member: hash_chunks(self.stream(source, member, budget)) for member in members}
+
+    def extract(self, source: ArchiveSource, members: list[str], destination: str, budget: ExtractionBudget,
+                progress: ExtractProgressCallback = no_extract_progress):
+        """Extracts the members to `destination + member`, raises ExtractionBudgetExceeded once over the budget."""
+        for done, member in enumerate(members, 1):
+            write_member(self.stream(source, member, budget), destination, member)
+            progress(done, len(members))
+
+
+def hash_chunks(chunks: Iterator[bytes]) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.digest()
+
+
+def member_path(destination: str, member: str) -> str:
+    target = os.path.realpath(os.path.join(destination, member))
+    if not target.startswith(os.path.realpath(destination) + os.sep):
+        raise ArchiveBackendError(f"archive member '{member}' is outside of the extraction directory")
+    return target
+
+
+def write_member(chunks: Iterator[bytes], destination: str, member: str):
+    target = member_path(destination, member)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+class ZipfileBackend(ArchiveBackend):
+    name = "zipfile"
+    formats = frozenset(["zip"])
+    reads_file_objects = True
+
+    def list_members(self, source: ArchiveSource) -> list[ArchiveMember]:
+        with zipfile.ZipFile(source, mode='r') as archive:
+            return [ArchiveMember(zinfo.filename, zinfo.is_dir(), zinfo.file_size, zinfo.CRC)
+                    for zinfo in archive.filelist]
+
+    def stream(self, source: ArchiveSource, member: str, budget: Optional[ExtractionBudget] = None,
+               chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        with zipfile.ZipFile(source, mode='r') as archive:
+            yield from self.stream_member(archive, member, budget, chunk_size)
+
+    @staticmethod
+    def stream_member(archive: zipfile.ZipFile, member: str, budget: Optional[ExtractionBudget],
+                      chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        with archive.open(member) as f:
+            while chunk := f.read(chunk_size):
+                if budget is not None:
+                    budget.add(len(chunk))
+                yield chunk
+
+    def read_members(self, source: ArchiveSource, members: list[str], budget: Optional[ExtractionBudget] = None,
+                     progress: ExtractProgressCallback = no_extract_progress) -> dict[str, bytes]:
+        contents = {}
+        with zipfile.ZipFile(source, mode='r') as archive:
+            for done, member in enumerate(members, 1):
+                contents[member] = b"".join(self.stream_member(archive, member, budget))
+                progress(done, len(members))
+        return contents
+
+    def hash_members(self, source: ArchiveSource, members: list[str],
+                     budget: Optional[ExtractionBudget] = None) -> dict[str, bytes]:
+        with zipfile.ZipFile(source, mode='r') as archive:
+            return {member: hash_chunks(self.stream_member(archive, member, budget)) for member in members}
+
+    def extract(self, source: ArchiveSource, members: list[str], destination: str, budget: ExtractionBudget,
+                progress: ExtractProgressCallback = no_extract_progress):
+        # the central directory is only read once for all the members
+        with zipfile.ZipFile(source, mode='r') as archive:
+            for done, member in enumerate(members, 1):
+                write_member(self.stream_member(archive, member, budget), destination, member)
+                progress(done, len(members))
+
+
+class Py7zrBackend(ArchiveBackend):
+    name = "py7zr"
+    formats = frozenset(["7z"])
+    reads_file_objects = True
+
+    def list_members(self, source: ArchiveSource) -> list[ArchiveMember]:
+        with py7zr.SevenZipFile(source, mode='r') as archive:
+            return [ArchiveMember(info.filename, info.is_directory, info.uncompressed, info.crc32)
+                    for info in archive.list()]
+
+    def stream(self, source: ArchiveSource, member: str, budget: Optional[ExtractionBudget] = None,
+               chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        # py7zr only pushes data into writers, so it extracts in a thread and hands the chunks over through a queue
+        chunks: queue.Queue = queue.Queue(maxsize=max(1, 16 * 1024 * 1024 // chunk_size))
+        closed = threading.Event()
+        end = object()
+
+        def put(item):
+            while not closed.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+            raise StreamClosed
+
+        def extract():
+            try:
+                with open_7z(source, budget) as archive:
+                    archive.extract(targets=[member], factory=QueueWriterFactory(put, budget))
+                put(end)
+            except StreamClosed:
+                pass
+            except BaseException as e:
+                try:
+                    put(e)
+                except StreamClosed:
+                    pass
+
+        thread = threading.Thread(target=extract, name="py7zr-stream", daemon=True)
+        thread.start()
+        try:
+            while (item := chunks.get()) is not end:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            closed.set()
+            thread.join()
+
+    def read_members(self, source: ArchiveSource, members: list[str], budget: Optional[ExtractionBudget] = None,
+                     progress: ExtractProgressCallback = no_extract_progress) -> dict[str, bytes]:
+        # all the members are decompressed in a single pass over the archive
+        factory = BytesWriterFactory(budget)
+        with open_7z(source, budget) as archive:
+            archive.extract(targets=members, callback=ExtractProgress(progress, members), factory=factory)
+        return {member: factory.products[member].getvalue() for member in members}
+
+    def hash_members(self, source: ArchiveSource, members: list[str],
+                     budget: Optional[ExtractionBudget] = None) -> dict[str, bytes]:
+        factory = BytesWriterFactory(budget, hashed=True)
+        with open_7z(source, budget) as archive:
+            archive.extract(targets=members, factory=factory)
+        return {member: factory.products[member].getvalue() for member in members}
+
+    def extract(self, source: ArchiveSource, members: list[str], destination: str, budget: ExtractionBudget,
+                progress: ExtractProgressCallback = no_extract_progress):
+        factory = BudgetedWriterFactory(budget)
+        try:
+            with open_7z(source, budget) as archive:
+                archive.extract(path=destination, targets=members, callback=ExtractProgress(progress, members),
+                                factory=factory)
+        finally:
+            factory.close()
+
+
+@contextlib.contextmanager
+def open_7z(source: ArchiveSource, budget: Optional[ExtractionBudget]) -> Iterator[py7zr.SevenZipFile]:
+    """Opens a 7z archive for py7zr, reading it from a path through the deadline of the budget if there is one."""
+    if isinstance(source, str) and budget is not None:
+        with open(source, "rb") as f, py7zr.SevenZipFile(DeadlineReader(f, budget), mode='r') as archive:
+            yield archive
+    else:
+        with py7zr.SevenZipFile(source, mode='r') as archive:
+            yield archive
+
+
+class StreamClosed(Exception):
+    pass
+
+
+class QueueWriter(Py7zIO):
+    def __init__(self, put: Callable[[bytes], None], budget: Optional[ExtractionBudget]):
+        self.put = put
+        self.budget = budget
+        self.written = 0
+
+    def write(self, s) -> int:
+        if self.budget is not None:
+            self.budget.add(len(s))
+        self.put(bytes(s))
+        self.written += len(s)
+        return len(s)
+
+    def read(self, size: Optional[int] = None) -> bytes:
+        return b""
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0
+
+    def flush(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return self.written
+
+
+class QueueWriterFactory(WriterFactory):
+    def __init__(self, put: Callable[[bytes], None], budget: Optional[ExtractionBudget]):
+        self.put = put
+        self.budget = budget
+
+    def create(self, filename: str) -> Py7zIO:
+        return QueueWriter(self.put, self.budget)
+
+
+class BytesWriter(Py7zIO):
+    """Keeps what py7zr writes in memory, or with `hashed` only its BLAKE2b digest."""
+
+    def __init__(self, budget: Optional[ExtractionBudget], hashed: bool = False):
+        self.budget = budget
+        self.buffer = io.BytesIO()
+        self.digest = hashlib.blake2b(digest_size=16) if hashed else None
+
+    def write(self, s) -> int:
+        if self.budget is not None:
+            self.budget.add(len(s))
+        if self.digest is not None:
+            self.digest.update(s)
+            return len(s)
+        return self.buffer.write(s)
+
+    def read(self, size: Optional[int] = None) -> bytes:
+        return self.buffer.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.buffer.seek(offset, whence)
+
+    def flush(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return self.buffer.getbuffer().nbytes
+
+    def getvalue(self) -> bytes:
+        return self.digest.digest() if self.digest is not None else self.buffer.getvalue()
+
+
+class BytesWriterFactory(WriterFactory):
+    """Makes py7zr extract members into memory, counting them against the budget."""
+
+    def __init__(self, budget: Optional[ExtractionBudget], hashed: bool = False):
+        self.budget = budget
+        self.hashed = hashed
+        self.products: dict[str, BytesWriter] = {}
+
+    def create(self, filename: str) -> Py7zIO:
+        product = BytesWriter(self.budget, self.hashed)
+        self.products[filename] = product
+        return product
+
+
+class ExtractProgress(ExtractCallback):
+    """Reports every member py7zr finished writing as extraction progress."""
+
+    def __init__(self, progress: ExtractProgressCallback, members: list[str]):
+        self.progress = progress
+        self.remaining = set(members)
+        self.total = len(members)
+
+    def report_start_preparation(self):
+        pass
+
+    def report_start(self, processing_file_path, processing_bytes):
+        pass
+
+    def report_update(self, decompressed_bytes):
+        pass
+
+    def report_end(self, processing_file_path, wrote_bytes):
+        # py7zr reports the members it skips as well
+        if processing_file_path in self.remaining:
+            self.remaining.remove(processing_file_path)
+            self.progress(self.total - len(self.remaining), self.total)
+
+    def report_warning(self, message):
+        pass
+
+    def report_postprocess(self):
+        pass
+
+
+class SevenZipBackend(ArchiveBackend):
+    """
+    Runs the 7-Zip executable, which decompresses LZMA2 several times faster than py7zr and with multiple threads.
+    Extracted files are measured on disk every `poll_interval` seconds, so the budget can be overshot by as much
+    as 7-Zip writes in that time before it is killed.
+    """
+    name = "7z"
+    formats = frozenset(["7z", "zip"])
+    poll_interval = 0.05
+
+    def __init__(self, executable: str = SEVEN_ZIP_PATH):
+        self.executable = executable or next(filter(None, map(shutil.which, ["7zz", "7z", "7za"])), None)
+
+    def available(self) -> bool:
+        return self.executable is not None
+
+    def command(self, *args: str) -> list[str]:
+        # -spd turns off wildcard matching so that member names are taken literally
+        return [self.executable, *args, "-sccUTF-8", "-scsUTF-8", "-spd", "-bd", "-y"]
+
+    def list_members(self, source: ArchiveSource) -> list[ArchiveMember]:
+        result = subprocess.run(self.command("l", "-slt") + ["--", source], capture_output=True)
+        if result.returncode != 0:
+            raise ArchiveBackendError(f"7-Zip could not list '{source}': {result.stderr.decode(errors='replace')}")
+        return parse_technical_listing(result.stdout.decode("utf-8", errors="surrogateescape"))
+
+    def stream(self, source: ArchiveSource, member: str, budget: Optional[ExtractionBudget] = None,
+               chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        process = subprocess.Popen(self.command("x", "-so") + ["--", source, member],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # nothing is read while 7-Zip decompresses the data in front of the member, so the deadline kills it
+        timer = threading.Timer(budget.deadline - time.monotonic(), process.kill) if budget is not None else None
+        if timer is not None:
+            timer.start()
+        try:
+            while chunk := process.stdout.read(chunk_size):
+                if budget is not None:
+                    budget.add(len(chunk))
+                yield chunk
+            if budget is not None:
+                budget.check_deadline()
+            if process.wait() != 0:
+                raise ArchiveBackendError(
+                    f"7-Zip could not extract '{member}': {process.stderr.read().decode(errors='replace')}")
+        finally:
+            if timer is not None:
+                timer.cancel()
+            stop(process)
+
+    def extract(self, source: ArchiveSource, members: list[str], destination: str, budget: ExtractionBudget,
+                progress: ExtractProgressCallback = no_extract_progress):
+        targets = [member_path(destination, member) for member in members]
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt") as list_file:
+            list_file.write("".join(f"{member}\n" for member in members))
+            list_file.flush()
+            process = subprocess.Popen(self.command("x", f"-o{destination}", f"-i@{list_file.name}") + ["--", source],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            try:
+                counted = 0
+                while True:
+                    try:
+                        process.wait(self.poll_interval)
+                    except subprocess.TimeoutExpired:
+                        pass
+                    finished = process.returncode is not None
+                    sizes = [os.path.getsize(target) for target in targets if os.path.exists(target)]
+                    budget.add(sum(sizes) - counted)
+                    counted = sum(sizes)
+                    progress(len(sizes) if finished else max(0, len(sizes) - 1), len(members))
+                    if finished:
+                        break
+                if process.returncode != 0:
+                    raise ArchiveBackendError(
+                        f"7-Zip could not extract '{source}': {process.stderr.read().decode(errors='replace')}")
+            finally:
+                stop(process)
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+    for pipe in (process.stdout, process.stderr):
+        if pipe is not None:
+            pipe.close()
+
+
+def parse_technical_listing(output: str) -> list[ArchiveMember]:
+    """Parses the members out of the output of `7z l -slt`, they come after a line of dashes, one block each."""
+    members = []
+    _, _, listing = output.partition("\n----------\n")
+    for block in listing.split("\n\n"):
+        properties = dict(line.split(" = ", 1) for line in block.splitlines() if " = " in line)
+        if "Path" not in properties:
+            continue
+        crc = properties.get("CRC")
+        # 7z archives mark folders only in the attributes, zip archives with Folder as well
+        is_dir = properties.get("Folder") == "+" or "D" in properties.get("Attributes", "").partition(" ")[0]
+        members.append(ArchiveMember(properties["Path"], is_dir,
+                                     int(properties.get("Size") or 0), int(crc, 16) if crc else None))
+    return members
+
+
+BACKENDS: dict[str, ArchiveBackend] = {backend.name: backend
+                                       for backend in [ZipfileBackend(), Py7zrBackend(), SevenZipBackend()]}
+# the backends tried in order when a type is set to auto
+AUTO_BACKENDS = {
+    "7z": ["7z", "py7zr"],
+    "zip": ["zipfile"],
+}
+
+
+def get_backend(archive_type: str, file_object: bool = False) -> ArchiveBackend:
+    """
+    Returns the backend configured for the archive type, or the first available one if it's set to auto.
+    With `file_object`, only backends that can read an archive from a file object are considered.
+    """
+    configured = {"7z": ARCHIVE_BACKEND_7Z, "zip": ARCHIVE_BACKEND_ZIP}.get(archive_type)
+    if configured is None:
+        raise ArchiveBackendError(f"there is no backend for archive type '{archive_type}'")
+    names = AUTO_BACKENDS[archive_type] if configured == "auto" else [configured, *AUTO_BACKENDS[archive_type]]
+    for name in names:
+        backend = BACKENDS.get(name)
+        if backend is None:
+            raise ArchiveBackendError(f"unknown archive backend '{name}'")
+        if archive_type in backend.formats and backend.available() \
+                and (backend.reads_file_objects or not file_object):
+            return backend
+        if name == configured:
+            l.debug("archive backend '%s' can't read this %s archive, falling back to auto", name, archive_type)
+    raise ArchiveBackendError(f"no archive backend is available for archive type '{archive_type}'")
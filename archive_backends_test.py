@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import archive_backends
+from archive_backends import BACKENDS, ArchiveMember, get_backend, parse_technical_listing
+from extraction_budget import ExtractionBudget, ExtractionBudgetExceeded
+
+UUID = "e647a839-c4d8-4c51-8f04-4cf142f1718c"
+LISTING = f"""
+7-Zip (z) 24.09 (x64) : Copyright (c) 1999-2024 Igor Pavlov : 2024-11-29
+
+Listing archive: test_curation_valid.7z
+
+--
+Path = test_curation_valid.7z
+Type = 7z
+Physical Size = 11501
+
+----------
+Path = {UUID}
+Size = 0
+Packed Size = 0
+Modified = 2021-02-14 15:11:33
+Attributes = D
+CRC =
+Encrypted = -
+Method =
+Block =
+Folder = +
+
+Path = {UUID}/meta.yaml
+Size = 699
+Packed Size = 418
+Modified = 2021-05-25 00:25:06
+Attributes = A
+CRC = 1A2B3C4D
+Encrypted = -
+Method = LZMA2:24k
+Block = 1
+Folder = -
+
+"""
+
+
+class TestArchiveBackends(unittest.TestCase):
+
+    def backends(self, extension: str):
+        return [backend for backend in BACKENDS.values() if extension in backend.formats and backend.available()]
+
+    def test_backends_agree(self):
+        for extension in ["7z", "zip"]:
+            path = f"test_curations/test_curation_valid.{extension}"
+            listings = {}
+            for backend in self.backends(extension):
+                members = backend.list_members(path)
+                listings[backend.name] = sorted((member.name.rstrip("/"), member.is_dir, member.size)
+                                                for member in members)
+                meta = backend.read_member(path, f"{UUID}/meta.yaml")
+                self.assertTrue(meta.startswith(b"Title:"), backend.name)
+                destination = tempfile.mkdtemp()
+                try:
+                    backend.extract(path, [f"{UUID}/meta.yaml", f"{UUID}/logo.png"], destination,
+                                    ExtractionBudget(os.path.getsize(path)))
+                    with open(os.path.join(destination, UUID, "meta.yaml"), "rb") as f:
+                        self.assertEqual(f.read(), meta)
+                    self.assertTrue(os.path.exists(os.path.join(destination, UUID, "logo.png")))
+                finally:
+                    shutil.rmtree(destination)
+            self.assertEqual(len(set(map(tuple, listings.values()))), 1, listings.keys())
+
+    def test_stream_over_budget(self):
+        for extension in ["7z", "zip"]:
+            path = f"test_curations/test_curation_valid.{extension}"
+            for backend in self.backends(extension):
+                with self.assertRaises(ExtractionBudgetExceeded, msg=backend.name):
+                    backend.read_member(path, f"{UUID}/meta.yaml", ExtractionBudget(1000, max_bytes=10))
+
+    def test_stream_closed_early(self):
+        stream = BACKENDS["py7zr"].stream("test_curations/test_curation_valid.7z", f"{UUID}/ss.png", chunk_size=16)
+        self.assertTrue(next(stream))
+        # closing the stream stops the extracting thread
+        stream.close()
+
+    @patch.object(archive_backends, "ARCHIVE_BACKEND_ZIP", "auto")
+    @patch.object(archive_backends, "ARCHIVE_BACKEND_7Z", "auto")
+    def test_get_backend(self):
+        with patch.object(archive_backends, "ARCHIVE_BACKEND_7Z", "py7zr"):
+            self.assertEqual(get_backend("7z").name, "py7zr")
+        with patch.object(archive_backends.BACKENDS["7z"], "executable", None):
+            self.assertEqual(get_backend("7z").name, "py7zr")
+        # the 7-Zip executable needs a path
+        self.assertEqual(get_backend("7z", file_object=True).name, "py7zr")
+        self.assertEqual(get_backend("zip").name, "zipfile")
+
+    def test_parse_technical_listing(self):
+        self.assertEqual(parse_technical_listing(LISTING), [ArchiveMember(UUID, True, 0, None),
+                                                            ArchiveMember(f"{UUID}/meta.yaml", False, 699,
+                                                                          0x1A2B3C4D)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Compares the archive backends on the test_curations corpus, and optionally on the generated stress archives, timing
+listing an archive, extracting the members validate_curation extracts and reading its largest member.
+Run from the project root with `python -m benchmarks.archive_backend_benchmark --output backends.json`.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from archive_backends import BACKENDS, ArchiveBackend, get_archive_type
+from benchmarks.validation_benchmark import CORPUS_DIR, GENERATED_DIR, generate
+from curation_validator import classify_filenames, get_bad_system_files_file
+from extraction_budget import ExtractionBudget
+
+
+def timed(operation, runs: int) -> float:
+    """The median seconds of `runs` calls after a warm-up call."""
+    operation()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def benchmark(backend: ArchiveBackend, path: str, runs: int) -> dict:
+    members = backend.list_members(path)
+    classified = classify_filenames([member.name for member in members], get_bad_system_files_file())
+    subset = classified.meta[:1] + classified.logo + classified.ss
+    largest = max((member for member in members if not member.is_dir), key=lambda member: member.size)
+
+    def extract():
+        destination = tempfile.mkdtemp(prefix="archive_backend_benchmark_")
+        try:
+            backend.extract(path, subset, destination, ExtractionBudget(os.path.getsize(path)))
+        finally:
+            shutil.rmtree(destination)
+
+    return {
+        "list": timed(lambda: backend.list_members(path), runs),
+        "extract": timed(extract, runs),
+        "read_member": timed(lambda: backend.read_member(path, largest.name), runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--runs", type=int, default=3, help="how many times each operation is timed")
+    parser.add_argument("--filter", default="", help="only benchmark archives whose name matches this regex")
+    parser.add_argument("--generated", action="store_true", help="also benchmark the generated stress archives")
+    parser.add_argument("--scale", type=float, default=1.0, help="scales the size of the generated archives")
+    args = parser.parse_args()
+    name_filter = re.compile(args.filter)
+
+    paths = [os.path.join(CORPUS_DIR, name) for name in sorted(os.listdir(CORPUS_DIR)) if name_filter.search(name)]
+    if args.generated:
+        paths += generate(GENERATED_DIR, args.scale, name_filter)
+    backends = [backend for backend in BACKENDS.values() if backend.available()]
+    print(f"backends: {', '.join(backend.name for backend in backends)}", file=sys.stderr)
+
+    results: dict[str, dict[str, dict]] = {}
+    totals: dict[str, dict[str, float]] = {}
+    for path in paths:
+        name = os.path.basename(path)
+        archive_type = get_archive_type(path)
+        for backend in backends:
+            if archive_type not in backend.formats:
+                continue
+            try:
+                result = benchmark(backend, path, args.runs)
+            except Exception as e:
+                # the corpus has broken archives on purpose
+                print(f"{name:<60} {backend.name:<8} failed: {e}", file=sys.stderr)
+                continue
+            results.setdefault(name, {})[backend.name] = result
+            total = totals.setdefault(f"{archive_type}/{backend.name}", {})
+            for operation, seconds in result.items():
+                total[operation] = total.get(operation, 0.0) + seconds
+            print(f"{name:<60} {backend.name:<8} " + " ".join(f"{operation} {seconds * 1000:9.2f} ms"
+                                                               for operation, seconds in result.items()),
+                  file=sys.stderr)
+
+    print("\ntotal per archive type and backend:")
+    for key, total in sorted(totals.items()):
+        print(f"{key:<16} " + " ".join(f"{operation} {seconds * 1000:10.2f} ms" for operation, seconds in total.items()))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "totals": totals}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Compares the single pass filename classifier against the previous per-regex list scans.
+Run from the project root with `python -m benchmarks.classifier_benchmark`.
+"""
+import re
+import timeit
+
+from curation_validator import classify_filenames, get_bad_system_files_file
+
+UUID = "e647a839-c4d8-4c51-8f04-4cf142f1718c"
+
+
+def synthetic_listing(file_count: int) -> list[str]:
+    filenames = [f"{UUID}/", f"{UUID}/content/", f"{UUID}/meta.yaml", f"{UUID}/logo.png", f"{UUID}/ss.png"]
+    for i in range(file_count):
+        folder = f"{UUID}/content/www.example.com/folder{i // 100}"
+        if i % 100 == 0:
+            filenames.append(folder + "/")
+        filenames.append(f"{folder}/file{i}.swf")
+    return filenames
+
+
+def per_regex_scans(filenames: list[str], bad_system_files: list[str]):
+    """The file checks of validate_curation before the classifier, kept here as the baseline."""
+    uuid_folder_regex = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}/?$")
+    uuid_folder = [match for match in filenames if uuid_folder_regex.match(match) is not None]
+    uuid = r"[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}" if uuid_folder else r"[^/]+"
+    regexes = [re.compile(rf"^{uuid}/content/?$"), re.compile(rf"^{uuid}/meta\.(yaml|yml|txt)$"),
+               re.compile(rf"^{uuid}/logo\.png$"), re.compile(rf"(?i)^{uuid}/logo\.(png)$"),
+               re.compile(rf"^{uuid}/ss\.png$"), re.compile(rf"(?i)^{uuid}/ss\.(png)$")]
+    matches = [[match for match in filenames if regex.match(match) is not None] for regex in regexes]
+    found = [name for name in bad_system_files if any(name in s for s in filenames)]
+    return uuid_folder, matches, found
+
+
+def main():
+    bad_system_files = get_bad_system_files_file()
+    for file_count in [1000, 10000, 100000]:
+        filenames = synthetic_listing(file_count)
+        repeat = max(1, 100000 // file_count)
+        before = min(timeit.repeat(lambda: per_regex_scans(filenames, bad_system_files), number=repeat, repeat=3))
+        after = min(timeit.repeat(lambda: classify_filenames(filenames, bad_system_files), number=repeat, repeat=3))
+        print(f"{len(filenames):>7} entries: per-regex scans {before / repeat * 1000:8.2f} ms, "
+              f"classifier {after / repeat * 1000:8.2f} ms ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
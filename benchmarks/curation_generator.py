@@ -0,0 +1,182 @@
+"""
+Generates synthetic curations laid out the way validate_curation expects them, valid or with a random defect,
+as zip or 7z and with content sizes drawn from a log-normal distribution.
+Run from the project root with `python -m benchmarks.curation_generator --count 100 --output-dir curations`.
+"""
+import argparse
+import io
+import os
+import random
+import tempfile
+import uuid
+import zipfile
+from typing import Callable, NamedTuple, Optional
+
+import py7zr
+from PIL import Image
+
+UUID = "e647a839-c4d8-4c51-8f04-4cf142f1718c"
+TAGS = ["Action", "Arcade", "Platformer", "Puzzle", "Shooter"]
+FORMATS = ["zip", "7z"]
+
+Members = list[tuple[str, bytes]]
+
+
+class Curation(NamedTuple):
+    filename: str
+    data: bytes
+    valid: bool
+    # the defect of an invalid curation
+    defect: Optional[str]
+
+
+def meta_yaml(title: str = "Benchmark Curation", launch_command: str = "http://example.com/game.swf",
+              languages: str = "en", tags: str = "Action; Arcade", extra: str = "") -> str:
+    return f"""Title: {title}
+Library: arcade
+Developer: Nobody
+Release Date: 2020-01-01
+Languages: {languages}
+Tags: {tags}
+Source: http://example.com/
+Status: Playable
+Application Path: FPSoftware/Flash/flashplayer_32_sa.exe
+Launch Command: {launch_command}
+{extra}"""
+
+
+META = meta_yaml()
+
+
+def small_png(color: tuple[int, int, int] = (255, 0, 0)) -> bytes:
+    data = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(data, format="PNG")
+    return data.getvalue()
+
+
+def noise_png(size: int) -> bytes:
+    data = io.BytesIO()
+    Image.frombytes("RGB", (size, size), random.Random(size).randbytes(size * size * 3)).save(data, format="PNG")
+    return data.getvalue()
+
+
+def curation_members(content: Members, meta: str = META, image: Optional[bytes] = None,
+                     root: str = UUID) -> Members:
+    """The members of a valid curation with the given content files, in the order they are archived."""
+    image = image if image is not None else small_png()
+    members = [(f"{root}/", b""), (f"{root}/content/", b"")]
+    members += [(f"{root}/content/{path}", data) for path, data in content]
+    members += [(f"{root}/meta.yaml", meta.encode()), (f"{root}/logo.png", image), (f"{root}/ss.png", image)]
+    return members
+
+
+def random_content(rng: random.Random, size: int, file_size: int = 64 * 1024) -> Members:
+    """Compressible content files of `size` bytes in total."""
+    words = [bytes(rng.choices(range(97, 123), k=rng.randint(3, 10))) for _ in range(256)]
+    files = []
+    for i, offset in enumerate(range(0, size, file_size)):
+        length = min(file_size, size - offset)
+        files.append((f"www.example.com/game/file{i}.swf", b" ".join(rng.choices(words, k=length // 4 + 1))[:length]))
+    return files
+
+
+def write_zip(path_or_file, members: Members):
+    with zipfile.ZipFile(path_or_file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+
+
+def write_7z(path_or_file, members: Members):
+    """Writes a solid 7z archive, all the members are compressed as one stream."""
+    with py7zr.SevenZipFile(path_or_file, "w") as archive, tempfile.TemporaryDirectory() as empty_folder:
+        for name, data in members:
+            if name.endswith("/"):
+                # py7zr can only add folders that exist
+                archive.write(empty_folder, name.rstrip("/"))
+            else:
+                archive.writestr(data, name)
+
+
+def archive_bytes(archive_type: str, members: Members) -> bytes:
+    data = io.BytesIO()
+    (write_zip if archive_type == "zip" else write_7z)(data, members)
+    return data.getvalue()
+
+
+def drop(suffix: str) -> Callable[[Members], Members]:
+    return lambda members: [(name, data) for name, data in members if not name.endswith(suffix)]
+
+
+def replace_meta(meta: str) -> Callable[[Members], Members]:
+    return lambda members: [(name, meta.encode() if name.endswith("/meta.yaml") else data) for name, data in members]
+
+
+# defects of invalid curations, each turns the members of a valid curation into an invalid one
+DEFECTS: dict[str, Callable[[Members], Members]] = {
+    "missing_logo": drop("/logo.png"),
+    "missing_ss": drop("/ss.png"),
+    "missing_meta": drop("/meta.yaml"),
+    "missing_content": lambda members: [(name, data) for name, data in members if "/content/" not in name],
+    "empty_content": lambda members: [(name, data) for name, data in members
+                                      if "/content/" not in name or name.endswith("/content/")],
+    "uppercase_logo_extension": lambda members: [(name.replace("/logo.png", "/logo.PNG"), data)
+                                                 for name, data in members],
+    "https_launch_command": replace_meta(meta_yaml(launch_command="https://example.com/game.swf")),
+    "bad_language": replace_meta(meta_yaml(languages="English")),
+    "missing_title": replace_meta(meta_yaml(title="")),
+    "missing_tags": replace_meta(meta_yaml(tags="")),
+}
+
+
+def generate_curation(rng: random.Random, valid: bool, archive_type: str, content_size: int) -> Curation:
+    """
+    Generates a curation with about `content_size` bytes of content.
+    Every curation has its own root folder, title and launch command so that none of them are duplicates.
+    """
+    curation_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    meta = meta_yaml(title=f"Synthetic Curation {curation_id}",
+                     launch_command=f"http://example.com/{curation_id}/game.swf",
+                     tags="; ".join(rng.sample(TAGS, rng.randint(1, 3))))
+    image = small_png((rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    members = curation_members(random_content(rng, content_size), meta=meta, image=image, root=curation_id)
+    defect = None
+    if not valid:
+        defect = rng.choice(sorted(DEFECTS))
+        members = DEFECTS[defect](members)
+    return Curation(f"{curation_id}.{archive_type}", archive_bytes(archive_type, members), valid, defect)
+
+
+def generate_curations(count: int, invalid_ratio: float = 0.2, formats: list[str] = FORMATS,
+                       size_median: int = 1000 * 1000, size_sigma: float = 1.0, seed: int = 0) -> list[Curation]:
+    """Generates curations with content sizes drawn from a log-normal distribution around `size_median` bytes."""
+    rng = random.Random(seed)
+    curations = []
+    for _ in range(count):
+        size = max(1, int(rng.lognormvariate(0, size_sigma) * size_median))
+        curations.append(generate_curation(rng, rng.random() >= invalid_ratio, rng.choice(formats), size))
+    return curations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--invalid-ratio", type=float, default=0.2)
+    parser.add_argument("--formats", default=",".join(FORMATS), help="comma separated archive formats")
+    parser.add_argument("--size-median", type=int, default=1000 * 1000, help="median content size in bytes")
+    parser.add_argument("--size-sigma", type=float, default=1.0, help="spread of the log-normal content sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    curations = generate_curations(args.count, args.invalid_ratio, args.formats.split(","),
+                                   args.size_median, args.size_sigma, args.seed)
+    for curation in curations:
+        with open(os.path.join(args.output_dir, curation.filename), "wb") as f:
+            f.write(curation.data)
+    invalid = sum(1 for curation in curations if not curation.valid)
+    print(f"generated {len(curations)} curations ({invalid} invalid) in '{args.output_dir}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Sends synthetic curations to validator-server at fixed open-loop rates, requests are sent on a Poisson schedule
+whether or not earlier ones were answered, and reports throughput, error rate and latency percentiles per rate.
+Without `--url`, a local server is started against a reference data stub so that no network is needed.
+Run from the project root with `python -m benchmarks.load_driver --rates 1,2,4 --duration 30`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import NamedTuple, Optional
+
+import aiohttp
+
+from benchmarks.curation_generator import Curation, TAGS, generate_curations
+from reference_data_stub import ReferenceDataStub
+
+
+class Response(NamedTuple):
+    # ok, shed (503), error (any other status or no response) or wrong (the result doesn't match the curation)
+    outcome: str
+    # seconds from when the request was scheduled to be sent until its response was read
+    latency: float
+
+
+def start_local_server(port: int, workers: int, queue_size: int, work_dir: str) \
+        -> tuple[subprocess.Popen, ReferenceDataStub]:
+    stub = ReferenceDataStub(tags=TAGS, launch_commands=[], wiki_tags=TAGS)
+    stub_url = stub.start()
+    env = dict(os.environ,
+               BLUEBOT_URL=stub_url,
+               WIKI_TAGS_URL=f"{stub_url}/datahub/Tags",
+               VALIDATION_WORKERS=str(workers),
+               VALIDATION_QUEUE_SIZE=str(queue_size),
+               VALIDATION_CACHE_PATH="",
+               REFERENCE_DATA_SNAPSHOT_DIR=os.path.join(work_dir, "snapshots"),
+               LAUNCH_COMMAND_INDEX_PATH=os.path.join(work_dir, "launch_commands.idx"),
+               IMAGE_STORE_PATH=os.path.join(work_dir, "images"))
+    log = open(os.path.join(work_dir, "server.log"), "wb")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "validator-server:app", "--host", "127.0.0.1",
+                               "--port", str(port)], env=env, stdout=log, stderr=subprocess.STDOUT)
+    return server, stub
+
+
+async def wait_until_live(session: aiohttp.ClientSession, url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(f"{url}/health/live") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"validator-server at {url} did not come up")
+        await asyncio.sleep(0.5)
+
+
+async def send(session: aiohttp.ClientSession, url: str, curation: Curation, scheduled: float) -> Response:
+    loop = asyncio.get_running_loop()
+    form = aiohttp.FormData()
+    form.add_field("file", curation.data, filename=curation.filename)
+    try:
+        async with session.post(f"{url}/upload/", data=form) as response:
+            body = await response.read()
+            if response.status == 503:
+                outcome = "shed"
+            elif response.status != 200:
+                outcome = "error"
+            else:
+                outcome = "ok" if (not json.loads(body)["curation_errors"]) == curation.valid else "wrong"
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        outcome = "error"
+    return Response(outcome, loop.time() - scheduled)
+
+
+async def run_rate(session: aiohttp.ClientSession, url: str, curations: list[Curation], rate: float,
+                   duration: float, rng: random.Random) -> dict:
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    scheduled = start
+    tasks = []
+    while True:
+        scheduled += rng.expovariate(rate)
+        if scheduled - start >= duration:
+            break
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        tasks.append(asyncio.create_task(send(session, url, rng.choice(curations), scheduled)))
+    responses = await asyncio.gather(*tasks)
+    return summarize(rate, responses, loop.time() - start)
+
+
+def percentile(values: list[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(rate: float, responses: list[Response], elapsed: float) -> dict:
+    latencies = sorted(response.latency for response in responses if response.outcome == "ok")
+    counts = {outcome: sum(1 for response in responses if response.outcome == outcome)
+              for outcome in ["ok", "shed", "error", "wrong"]}
+    return {
+        "offered_rate": rate,
+        "requests": len(responses),
+        **counts,
+        "throughput": counts["ok"] / elapsed if elapsed else 0.0,
+        "error_rate": (len(responses) - counts["ok"]) / len(responses) if responses else 0.0,
+        "latency": {"p50": percentile(latencies, 0.5), "p90": percentile(latencies, 0.9),
+                    "p99": percentile(latencies, 0.99), "max": latencies[-1] if latencies else None},
+    }
+
+
+def print_summary(summary: dict):
+    def ms(seconds: Optional[float]) -> str:
+        return f"{seconds * 1000:9.1f}" if seconds is not None else f"{'-':>9}"
+
+    latency = summary["latency"]
+    print(f"{summary['offered_rate']:8.2f}/s {summary['requests']:6} requests {summary['throughput']:8.2f}/s ok "
+          f"errors {summary['error_rate'] * 100:5.1f}% (shed {summary['shed']}, failed {summary['error']}, "
+          f"wrong {summary['wrong']}) latency ms p50 {ms(latency['p50'])} p90 {ms(latency['p90'])} "
+          f"p99 {ms(latency['p99'])} max {ms(latency['max'])}")
+
+
+async def drive(args) -> list[dict]:
+    curations = generate_curations(args.curations, args.invalid_ratio, args.formats.split(","),
+                                   args.size_median, args.size_sigma, args.seed)
+    rng = random.Random(args.seed)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    # open-loop: never hold a request back because too many are already in flight
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await wait_until_live(session, args.url)
+        summaries = []
+        for rate in [float(rate) for rate in args.rates.split(",")]:
+            summary = await run_rate(session, args.url, curations, rate, args.duration, rng)
+            print_summary(summary)
+            summaries.append(summary)
+        return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="validator-server to load, a local one is started if not given")
+    parser.add_argument("--rates", default="1,2,4", help="comma separated request rates per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds each rate is sent for")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds until a request counts as failed")
+    parser.add_argument("--curations", type=int, default=50, help="how many different curations are sent")
+    parser.add_argument("--invalid-ratio", type=float, default=0.2)
+    parser.add_argument("--formats", default="zip,7z")
+    parser.add_argument("--size-median", type=int, default=1000 * 1000, help="median content size in bytes")
+    parser.add_argument("--size-sigma", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8765, help="port of the local server")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="workers of the local server")
+    parser.add_argument("--queue-size", type=int, default=16, help="queue size of the local server")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    server = stub = None
+    with tempfile.TemporaryDirectory(prefix="load_driver_") as work_dir:
+        if args.url is None:
+            server, stub = start_local_server(args.port, args.workers, args.queue_size, work_dir)
+            args.url = f"http://127.0.0.1:{args.port}"
+        try:
+            summaries = asyncio.run(drive(args))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+                stub.stop()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"url": args.url, "duration": args.duration, "results": summaries}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Compares meta_parser against the previous meta parsing of validate_curation on meta files with long descriptions.
+Run from the project root with `python -m benchmarks.meta_parser_benchmark`.
+"""
+import io
+import timeit
+
+from ruamel.yaml import YAML
+
+from benchmarks.curation_generator import meta_yaml
+from meta_parser import _yaml, parse_meta
+
+
+def description_lines(count: int) -> list[str]:
+    return [f"Line {i} of a long description: it goes on about the game, {'and on ' * 10}." for i in range(count)]
+
+
+def yaml_meta(line_count: int) -> bytes:
+    extra = "Original Description: |-\n" + "".join(f"  {line}\n" for line in description_lines(line_count))
+    return meta_yaml(extra=extra).encode()
+
+
+def txt_meta(line_count: int) -> bytes:
+    # meta_yaml is also valid legacy txt, apart from the multiline block indented with a tab
+    extra = "Original Description: |\n" + "".join(f"\t{line}\n" for line in description_lines(line_count)) + \
+            "Notes: Some notes\n"
+    return meta_yaml(extra=extra).encode()
+
+
+def previous_yaml(data: bytes, pure: bool = False) -> dict:
+    """
+    The YAML branch of validate_curation before meta_parser, kept here as the baseline.
+    Without ruamel.yaml.clib installed it used the pure Python parser.
+    """
+    with io.TextIOWrapper(io.BytesIO(data), encoding='utf8') as meta_file:
+        return YAML(typ="safe", pure=pure).load(meta_file)
+
+
+def previous_txt(data: bytes) -> dict:
+    """
+    The txt branch of validate_curation before meta_parser, kept here as the baseline. Its first readlines()
+    consumes the file, so it stops at the first multiline value, and the rescans slice the lines every time.
+    """
+    def parse_lines_until_multiline(lines: list[str], d: dict, starting_number: int):
+        break_number: int = -1
+        for idx, line in enumerate(lines[starting_number:]):
+            if '|' not in line and line.strip():
+                split: list[str] = line.split(":")
+                split: list[str] = [x.strip(' ') for x in split]
+                d.update({split[0]: split[1]})
+            else:
+                break_number = idx
+                break
+        return d, break_number
+
+    def parse_multiline(lines: list[str], d: dict, starting_number: int):
+        break_number = -1
+        key: str = ""
+        val: str = ""
+        for idx, line in enumerate(lines[starting_number:]):
+            if idx is starting_number:
+                split = line.split(':')
+                split = [x.strip(' ') for x in split]
+                key = split[0]
+            else:
+                if line.startswith('\t'):
+                    line = line.strip(" \t")
+                    val += line
+                else:
+                    break_number = idx
+                    break
+        d.update({key: val})
+        return d, break_number
+
+    props: dict = {}
+    with io.TextIOWrapper(io.BytesIO(data), encoding='utf8') as meta_file:
+        break_index: int = 0
+        while break_index != -1:
+            props, break_index = parse_lines_until_multiline(meta_file.readlines(), props, break_index)
+            props, break_index = parse_multiline(meta_file.readlines(), props, break_index)
+            if props.get("Genre") is not None:
+                props["Tags"] = props["Genre"]
+    return props
+
+
+def compare(name: str, before, after, data: bytes):
+    repeat = max(1, 200000 // len(data))
+    before_time = min(timeit.repeat(lambda: before(data), number=repeat, repeat=3)) / repeat
+    after_time = min(timeit.repeat(lambda: after(data), number=repeat, repeat=3)) / repeat
+    print(f"{name:<5} {len(data) // 1000:>6} KB: previous {before_time * 1000:8.3f} ms, "
+          f"meta_parser {after_time * 1000:8.3f} ms ({before_time / after_time:.1f}x)")
+
+
+def main():
+    print(f"YAML parser: {_yaml.Parser.__name__}")
+    for line_count in [0, 100, 1000, 10000]:
+        compare("yaml", previous_yaml, lambda data: parse_meta("meta.yaml", data), yaml_meta(line_count))
+        compare("pure", lambda data: previous_yaml(data, pure=True), lambda data: parse_meta("meta.yaml", data),
+                yaml_meta(line_count))
+    for line_count in [0, 100, 1000, 10000]:
+        data = txt_meta(line_count)
+        props = parse_meta("meta.txt", data)
+        # the previous parser drops everything from the first multiline value on
+        print(f"txt meta with {line_count} description lines: previous parsed {len(previous_txt(data))} fields, "
+              f"meta_parser {len(props)}")
+        compare("txt", previous_txt, lambda data: parse_meta("meta.txt", data), data)
+
+
+if __name__ == '__main__':
+    main()
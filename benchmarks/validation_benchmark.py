@@ -0,0 +1,225 @@
+"""
+Times validate_curation per stage over the test_curations corpus and over generated stress archives.
+Run from the project root with `python -m benchmarks.validation_benchmark --output results.json`,
+add `--compare` to compare against the committed benchmarks/baseline.json or `--baseline results.json` to compare
+against an earlier run, the exit code is 1 if anything got slower.
+Generated archives are kept in data/cache/benchmark_archives so that they are only built once.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+from typing import Callable
+from unittest.mock import patch
+
+import py7zr
+
+import metrics
+from benchmarks.curation_generator import META, Members, curation_members, noise_png, write_zip, write_7z
+from curation_validator import validate_curation, get_archive_type
+
+RESULTS_FORMAT = 1
+CORPUS_DIR = "test_curations"
+GENERATED_DIR = "data/cache/benchmark_archives"
+# results of a full run at scale 1, regenerate it with `--output` when a change is meant to be slower or faster
+BASELINE_PATH = "benchmarks/baseline.json"
+TAGS = frozenset(["Action", "Arcade", "Platformer"])
+
+
+def many_files(count: int) -> Members:
+    return [(f"www.example.com/folder{i // 100}/file{i}.txt", f"{i}".encode()) for i in range(count)]
+
+
+def deep_tree(depth: int) -> Members:
+    return [("/".join(f"level{level}" for level in range(i + 1)) + "/file.txt", f"{i}".encode())
+            for i in range(depth)]
+
+
+def huge_meta(size: int) -> str:
+    # random words, repeated lines would compress past the extraction ratio limit and only time the abort
+    rng = random.Random(size)
+    words = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=8)) for _ in range(1000)]
+    line_count = size // (8 * 9 + 3)
+    return META + "Curation Notes: |-\n" + "".join(f"  {' '.join(rng.choices(words, k=8))}\n"
+                                                    for _ in range(line_count))
+
+
+def large_files(count: int, size: int) -> Members:
+    rng = random.Random(count)
+    words = [bytes(rng.choices(range(97, 123), k=8)) for _ in range(1000)]
+    return [(f"www.example.com/large{i}.swf", b" ".join(rng.choices(words, k=size // 9))) for i in range(count)]
+
+
+def write_non_solid_7z(path: str, members: Members):
+    """py7zr can't write non-solid archives, but every append adds a new stream."""
+    folders = [member for member in members if member[0].endswith("/")]
+    files = [member for member in members if not member[0].endswith("/")]
+    write_7z(path, folders + files[:1])
+    for name, data in files[1:]:
+        with py7zr.SevenZipFile(path, "a") as archive:
+            archive.writestr(data, name)
+
+
+def stress_archives(scale: float) -> dict[str, Callable[[str], None]]:
+    """Returns the generated archives by file name, each with the function writing it."""
+    file_count = max(1, int(100000 * scale))
+    depth = max(1, int(256 * scale))
+    meta_size = max(1, int(10 * 1000 * 1000 * scale))
+    png_size = max(16, int(2048 * scale ** 0.5))
+    large_count = max(2, int(64 * scale))
+    archives = {}
+    for suffix, write in [("zip", write_zip), ("7z", write_7z)]:
+        archives[f"stress_many_files_{file_count}.{suffix}"] = \
+            lambda path, write=write: write(path, curation_members(many_files(file_count)))
+        archives[f"stress_deep_tree_{depth}.{suffix}"] = \
+            lambda path, write=write: write(path, curation_members(deep_tree(depth)))
+        archives[f"stress_huge_meta_words_{meta_size}.{suffix}"] = \
+            lambda path, write=write: write(path, curation_members(many_files(10), meta=huge_meta(meta_size)))
+        archives[f"stress_large_png_{png_size}.{suffix}"] = \
+            lambda path, write=write: write(path, curation_members(many_files(10), image=noise_png(png_size)))
+    archives[f"stress_solid_{large_count}.7z"] = \
+        lambda path: write_7z(path, curation_members(large_files(large_count, 512 * 1024)))
+    archives[f"stress_non_solid_{large_count}.7z"] = \
+        lambda path: write_non_solid_7z(path, curation_members(large_files(large_count, 512 * 1024)))
+    return archives
+
+
+def generate(generated_dir: str, scale: float, name_filter: re.Pattern) -> list[str]:
+    os.makedirs(generated_dir, exist_ok=True)
+    paths = []
+    for name, write in stress_archives(scale).items():
+        if not name_filter.search(name):
+            continue
+        path = os.path.join(generated_dir, name)
+        if not os.path.exists(path):
+            print(f"generating {name}...", file=sys.stderr)
+            write(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        paths.append(path)
+    return paths
+
+
+def benchmark(path: str, runs: int) -> dict:
+    totals = []
+    stages: dict[str, list[float]] = {}
+    rules: dict[str, list[float]] = {}
+    metrics.buffer_records()
+    # the first validation warms up the file cache and the lazily loaded data files
+    validate_curation(path)
+    for _ in range(runs):
+        metrics.take_records()
+        start = time.perf_counter()
+        validate_curation(path)
+        totals.append(time.perf_counter() - start)
+        for name, value, labels in metrics.take_records():
+            if name == metrics.VALIDATION_STAGE_SECONDS._name:
+                stages.setdefault(labels["stage"], []).append(value)
+            elif name == metrics.VALIDATION_RULE_SECONDS._name:
+                rules.setdefault(labels["rule"], []).append(value)
+    return {
+        "archive_type": get_archive_type(path),
+        "bytes": os.path.getsize(path),
+        "runs": runs,
+        "seconds": {"min": min(totals), "median": statistics.median(totals)},
+        "stages": {stage: statistics.median(values) for stage, values in stages.items()},
+        "rules": {rule: statistics.median(values) for rule, values in rules.items()},
+    }
+
+
+def summarize_formats(results: dict[str, dict]) -> dict[str, dict]:
+    formats: dict[str, dict] = {}
+    for result in results.values():
+        summary = formats.setdefault(result["archive_type"],
+                                     {"archives": 0, "seconds": 0.0, "stages": {}, "rules": {}})
+        summary["archives"] += 1
+        summary["seconds"] += result["seconds"]["median"]
+        for stage, seconds in result["stages"].items():
+            summary["stages"][stage] = summary["stages"].get(stage, 0.0) + seconds
+        for rule, seconds in result.get("rules", {}).items():
+            summary["rules"][rule] = summary["rules"].get(rule, 0.0) + seconds
+    return formats
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float, min_delta: float) -> list[str]:
+    """Prints the change of every archive in both runs and returns the archives that got slower."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["seconds"]["median"]
+        after = result["seconds"]["median"]
+        regressed = after > before * (1 + tolerance) and after - before > min_delta
+        print(f"{name:<60} {before * 1000:10.2f} ms -> {after * 1000:10.2f} ms "
+              f"({(after - before) / before * 100 if before else 0:+6.1f}%){'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against the results of an earlier run")
+    parser.add_argument("--compare", action="store_true", help=f"compare against the committed {BASELINE_PATH}")
+    parser.add_argument("--runs", type=int, default=3, help="how many times each archive is validated")
+    parser.add_argument("--scale", type=float, default=1.0, help="scales the size of the generated archives")
+    parser.add_argument("--filter", default="", help="only benchmark archives whose name matches this regex")
+    parser.add_argument("--no-corpus", action="store_true", help="skip the test_curations corpus")
+    parser.add_argument("--no-generated", action="store_true", help="skip the generated stress archives")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown against the baseline that counts as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.005,
+                        help="seconds an archive must slow down by to count as a regression")
+    args = parser.parse_args()
+    name_filter = re.compile(args.filter)
+
+    paths = []
+    if not args.no_corpus:
+        paths += [os.path.join(CORPUS_DIR, name) for name in sorted(os.listdir(CORPUS_DIR))
+                  if name_filter.search(name)]
+    if not args.no_generated:
+        paths += generate(GENERATED_DIR, args.scale, name_filter)
+
+    results = {}
+    # the reference data is fixed so that only the validation itself is measured
+    with patch("curation_validator.get_tag_list", return_value=TAGS), \
+            patch("curation_validator.get_launch_commands_bluebot", return_value=frozenset()):
+        for path in paths:
+            name = os.path.basename(path)
+            results[name] = benchmark(path, args.runs)
+            print(f"{name:<60} {results[name]['seconds']['median'] * 1000:10.2f} ms", file=sys.stderr)
+
+    output = {
+        "format": RESULTS_FORMAT,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "py7zr": py7zr.__version__,
+        "scale": args.scale,
+        "results": results,
+        "formats": summarize_formats(results),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+
+    baseline_path = args.baseline or (BASELINE_PATH if args.compare else None)
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            print(f"warning: the baseline was generated with scale {baseline.get('scale')}", file=sys.stderr)
+        regressions = compare(results, baseline["results"], args.tolerance, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} archives got slower than the baseline", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ import asyncio
 import os
 import re
 import traceback
-from typing import Optional
+from typing import NamedTuple, Optional
 from urllib.parse import quote as quote_url
 
 import discord
@@ -10,13 +10,19 @@ from discord.ext import commands
 from pretty_help import PrettyHelp
 
 from dotenv import load_dotenv
+
+# the project modules read their settings when they are imported, so .env has to be loaded before them
+load_dotenv()
+
+import util
 from logger import getLogger, set_global_logging_level
-from curation_validator import get_launch_commands_bluebot, validate_curation, CurationType
+from curation_validator import get_launch_commands_bluebot, index_curation_content, CurationType
+from metrics import start_metrics_server
+from validation_pool import get_validation_pool
 
 set_global_logging_level('DEBUG')
 l = getLogger("main")
 
-load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 FLASH_GAMES_CHANNEL = int(os.getenv('FLASH_GAMES_CHANNEL'))
 OTHER_GAMES_CHANNEL = int(os.getenv('OTHER_GAMES_CHANNEL'))
@@ -32,6 +38,7 @@ NOTIFY_ME_CHANNEL = int(os.getenv('NOTIFY_ME_CHANNEL'))
 GOD_USER = int(os.getenv('GOD_USER'))
 NOTIFICATION_SQUAD_ID = int(os.getenv('NOTIFICATION_SQUAD_ID'))
 BOT_GUY = int(os.getenv('BOT_GUY'))
+METRICS_PORT = os.getenv('METRICS_PORT')
 
 intents = discord.Intents.default()
 intents.members = True
@@ -45,7 +52,7 @@ EXTREME_EMOJI_ID = 778145279714918400
 
 @bot.event
 async def on_ready():
-    l.info(f"{bot.user} connected")
+    l.info("%s connected", bot.user)
 
 
 @bot.event
@@ -108,17 +115,23 @@ async def notify_me(message: discord.Message):
     notification_squad = message.guild.get_role(NOTIFICATION_SQUAD_ID)
     if message.channel is bot.get_channel(NOTIFY_ME_CHANNEL):
         if "unnotify me" in message.content.lower():
-            l.debug(f"Removed role from {message.author.id}")
+            l.debug("Removed role from %s", message.author.id)
             await message.author.remove_roles(notification_squad)
         elif "notify me" in message.content.lower():
-            l.debug(f"Gave role to {message.author.id}")
+            l.debug("Gave role to %s", message.author.id)
             await message.author.add_roles(notification_squad)
 
 
 async def check_curation_in_message(message: discord.Message, dry_run: bool = True):
-    if len(message.attachments) != 1:  # TODO can we have more than one attachment?
+    attachments = get_curation_attachments(message)
+    if not attachments:
         return
+    results = await validate_curation_attachments(message, attachments, index_content=not dry_run)
+    await report_curation(message, results, dry_run)
+
 
+def get_curation_attachments(message: discord.Message) -> list[discord.Attachment]:
+    """Returns the curation archives attached to the message if it was posted in a curation channel."""
     is_in_flash_game_channel = message.channel.id == FLASH_GAMES_CHANNEL
     is_in_other_game_channel = message.channel.id == OTHER_GAMES_CHANNEL
     is_in_animation_channel = message.channel.id == ANIMATIONS_CHANNEL
@@ -128,75 +141,163 @@ async def check_curation_in_message(message: discord.Message, dry_run: bool = Tr
 
     if not (
             is_in_flash_game_channel or is_in_other_game_channel or is_in_animation_channel or is_audition):  # or is_curator_lounge):
-        return
+        return []
+
+    return [attachment for attachment in message.attachments
+            if attachment.filename.endswith('.7z') or attachment.filename.endswith('.zip') or attachment.filename.endswith('.rar')]
+
+
+async def download_curation_attachment(message: discord.Message, attachment: discord.Attachment) -> tuple[str, str]:
+    """Saves the attachment and returns its filename and the SHA-256 of its contents."""
+    # curations are validated concurrently, so two uploads with the same name must not share a file
+    archive_filename: str = f"{attachment.id}-{attachment.filename}"
+
+    l.debug("detected message '%s' from user '%s' in channel '%s' with attachment '%s'",
+            message.id, message.author, message.channel, archive_filename)
+    l.debug("downloading attachment '%s' - '%s'...", attachment.id, archive_filename)
+    with open(archive_filename, "wb") as f:
+        writer = util.HashingWriter(f)
+        await attachment.save(writer, seek_begin=False)
+    return archive_filename, writer.hexdigest()
+
+
+class AttachmentResult(NamedTuple):
+    attachment: discord.Attachment
+    # the result of `validate_curation`, or None if downloading or validating failed
+    result: Optional[tuple]
+    error_traceback: Optional[str]
+
+
+async def validate_curation_attachment(message: discord.Message, attachment: discord.Attachment,
+                                       download_slots: Optional[asyncio.Semaphore] = None,
+                                       index_content: bool = False) -> tuple[Optional[tuple], Optional[str]]:
+    """
+    Downloads and validates the attachment, returns the result of `validate_curation` or the traceback if
+    downloading or validating failed. Downloads wait for one of the `download_slots` if given.
+    With `index_content`, an accepted curation is added to the content index before its archive is removed.
+    """
+    archive_filename = None
+    try:
+        if download_slots is not None:
+            async with download_slots:
+                archive_filename, archive_hash = await download_curation_attachment(message, attachment)
+        else:
+            archive_filename, archive_hash = await download_curation_attachment(message, attachment)
+        result = await get_validation_pool().validate(archive_filename, archive_hash=archive_hash)
+        if index_content and is_accepted(message, result):
+            await index_accepted_curation(archive_filename, result)
+        return result, None
+    except Exception as e:
+        l.exception(e)
+        return None, traceback.format_exc()
+    finally:
+        # archive cleanup
+        if archive_filename is not None and os.path.exists(archive_filename):
+            l.debug("removing archive %s...", archive_filename)
+            os.remove(archive_filename)
 
-    attachment = message.attachments[0]
-    archive_filename: str = attachment.filename
-    if not (archive_filename.endswith('.7z') or archive_filename.endswith('.zip') or archive_filename.endswith('.rar')):
-        return
 
-    l.debug(
-        f"detected message '{message.id}' from user '{message.author}' in channel '{message.channel}' with attachment '{archive_filename}'")
-    l.debug(f"downloading attachment '{attachment.id}' - '{archive_filename}'...")
-    await attachment.save(archive_filename)
+async def validate_curation_attachments(message: discord.Message, attachments: list[discord.Attachment],
+                                        download_slots: Optional[asyncio.Semaphore] = None,
+                                        index_content: bool = False) -> list[AttachmentResult]:
+    """Downloads and validates all the attachments at once, so that a message takes as long as its slowest one."""
+    results = await asyncio.gather(*(validate_curation_attachment(message, attachment, download_slots, index_content)
+                                     for attachment in attachments))
+    return [AttachmentResult(attachment, result, error_traceback)
+            for attachment, (result, error_traceback) in zip(attachments, results)]
+
+
+def is_accepted(message: discord.Message, result: tuple) -> bool:
+    """Whether the curation has no problems at all, only those are added to the content index."""
+    curation_errors, curation_warnings, _, curation_type, _, _ = result
+    return message.content != "" and not curation_errors and not curation_warnings and \
+        not get_channel_errors(message, curation_type)
+
 
+async def index_accepted_curation(archive_filename: str, result: tuple):
+    title = (result[4] or {}).get("Title")
     try:
-        curation_errors, curation_warnings, is_extreme, curation_type, _, _ = validate_curation(archive_filename)
+        await asyncio.get_running_loop().run_in_executor(None, index_curation_content, archive_filename,
+                                                         str(title) if title else None)
     except Exception as e:
-        l.exception(e)
-        l.debug(f"removing archive {archive_filename}...")
-        os.remove(archive_filename)
-        if not dry_run:
-            l.debug(f"adding 💥 reaction to message '{message.id}'")
-            await message.add_reaction('💥')
-        reply_channel: discord.TextChannel = bot.get_channel(BOT_TESTING_CHANNEL)
-        await reply_channel.send(f"<@{GOD_USER}> the curation validator has thrown an exception:\n"
+        # the curation was still validated, it is only missing from the content index
+        l.error("could not add '%s' to the content index: %s", archive_filename, e)
+
+
+def get_channel_errors(message: discord.Message, curation_type: Optional[CurationType]) -> list[str]:
+    """Returns an error if the curation was posted to the channel of another curation type."""
+    if message.channel.id == AUDITIONS_CHANNEL:
+        return []
+    errors = []
+    mentioned_channel: discord.TextChannel
+    if curation_type == CurationType.FLASH_GAME and message.channel.id != FLASH_GAMES_CHANNEL:
+        mentioned_channel = bot.get_channel(FLASH_GAMES_CHANNEL)
+        errors.append(f"Curation is a flash game, please submit to {mentioned_channel.mention}")
+    if curation_type == CurationType.OTHER_GAME and message.channel.id != OTHER_GAMES_CHANNEL:
+        mentioned_channel = bot.get_channel(OTHER_GAMES_CHANNEL)
+        errors.append(f"Curation is an other game, please submit to {mentioned_channel.mention}")
+    if curation_type == CurationType.ANIMATION and message.channel.id != ANIMATIONS_CHANNEL:
+        mentioned_channel = bot.get_channel(ANIMATIONS_CHANNEL)
+        errors.append(f"Curation is an animation, please submit to {mentioned_channel.mention}")
+    return errors
+
+
+async def report_curation(message: discord.Message, results: list[AttachmentResult], dry_run: bool):
+    """
+    Replies once with the problems `validate_curation_attachments` found in all the curations of the message, with
+    a section per curation if there are several, also naming the curations the validator failed on. Reacts with 💥
+    if validating any curation failed and 🚫 if any has problems, both if both happened, and 🤖 otherwise.
+    """
+    failed = [result for result in results if result.error_traceback is not None]
+    validated = [result for result in results if result.error_traceback is None]
+    reply_channel: discord.TextChannel = bot.get_channel(BOT_TESTING_CHANNEL)
+    for attachment, _, error_traceback in failed:
+        await reply_channel.send(f"<@{GOD_USER}> the curation validator has thrown an exception "
+                                 f"on `{attachment.filename}`:\n"
                                  f"🔗 {message.jump_url}\n"
-                                 f"```{traceback.format_exc()}```")
-        return
+                                 f"```{error_traceback}```")
 
-    # archive cleanup
-    l.debug(f"removing archive {archive_filename}...")
-    os.remove(archive_filename)
-    if message.content == "":
-        curation_errors.append("Discord upload must include title of game.")
-    if not is_audition:
-        mentioned_channel: discord.TextChannel
-        if curation_type == CurationType.FLASH_GAME and not is_in_flash_game_channel:
-            mentioned_channel = bot.get_channel(FLASH_GAMES_CHANNEL)
-            curation_errors.append(f"Curation is a flash game, please submit to {mentioned_channel.mention}")
-        if curation_type == CurationType.OTHER_GAME and not is_in_other_game_channel:
-            mentioned_channel = bot.get_channel(OTHER_GAMES_CHANNEL)
-            curation_errors.append(f"Curation is an other game, please submit to {mentioned_channel.mention}")
-        if curation_type == CurationType.ANIMATION and not is_in_animation_channel:
-            mentioned_channel = bot.get_channel(ANIMATIONS_CHANNEL)
-            curation_errors.append(f"Curation is an animation, please submit to {mentioned_channel.mention}")
+    is_in_flash_game_channel = message.channel.id == FLASH_GAMES_CHANNEL
+    is_in_other_game_channel = message.channel.id == OTHER_GAMES_CHANNEL
+    is_in_animation_channel = message.channel.id == ANIMATIONS_CHANNEL
+    is_audition = message.channel.id == AUDITIONS_CHANNEL
+    single = len(results) == 1
+
+    # message-wide problems come first, then those of every curation
+    message_errors = ["Discord upload must include title of game."] if message.content == "" and validated else []
+    has_errors = len(message_errors) > 0
+    # TODO tag warnings changed to errors this way because i'm lazy for now
+    has_warnings = False
+    is_extreme = False
+    sections: list[str] = []
+    for attachment, result, _ in validated:
+        curation_errors, curation_warnings, curation_is_extreme, curation_type, _, _ = result
+        curation_errors = curation_errors + get_channel_errors(message, curation_type)
+        has_errors = has_errors or len(curation_errors) > 0
+        has_warnings = has_warnings or len(curation_warnings) > 0
+        is_extreme = is_extreme or bool(curation_is_extreme)
+        section = "".join(f"🚫 {problem}\n" for problem in curation_errors + curation_warnings)
+        if not single:
+            section = f"**{attachment.filename}**\n" + (section or "🤖 No problems found.\n")
+        sections.append(section)
+    if not single:
+        sections += [f"**{attachment.filename}**\n💥 The validator failed on this curation, it will be looked into.\n"
+                     for attachment, _, _ in failed]
 
     # format reply
     final_reply: str = ""
-    if len(curation_errors) > 0:
-        final_reply += message.author.mention + f" Your curation is invalid:\n" \
-                                                f"🔗 {message.jump_url}\n"
-    if len(curation_errors) == 0 and len(curation_warnings) > 0:
-        final_reply += message.author.mention + f" Your curation might have some problems:\n" \
+    if has_errors or has_warnings or (failed and not single):
+        if single:
+            summary = "Your curation is invalid:" if has_errors else "Your curation might have some problems:"
+        elif has_errors or has_warnings:
+            summary = "Some of your curations are invalid:" if has_errors else \
+                "Some of your curations might have some problems:"
+        else:
+            summary = "The validator failed on some of your curations:"
+        final_reply += message.author.mention + f" {summary}\n" \
                                                 f"🔗 {message.jump_url}\n"
-
-    has_errors = len(curation_errors) > 0
-    if has_errors:
-        if not dry_run:
-            l.debug(f"adding 🚫 reaction to message '{message.id}'")
-            await message.add_reaction('🚫')
-        for curation_error in curation_errors:
-            final_reply += f"🚫 {curation_error}\n"
-
-    # TODO tag warnings changed to errors this way because i'm lazy for now
-    has_warnings = len(curation_warnings) > 0
-    if has_warnings:
-        if not dry_run:
-            l.debug(f"adding 🚫 reaction to message '{message.id}'")
-            await message.add_reaction('🚫')
-        for curation_warning in curation_warnings:
-            final_reply += f"🚫 {curation_warning}\n"
+        final_reply += "".join(f"🚫 {message_error}\n" for message_error in message_errors)
+        final_reply += "".join(sections)
 
     is_audition_with_mistakes = is_audition and (has_warnings or has_errors)
     if is_audition_with_mistakes and "duplicate" not in final_reply:
@@ -204,8 +305,14 @@ async def check_curation_in_message(message: discord.Message, dry_run: bool = Tr
     elif is_audition_with_mistakes:
         final_reply += "Feel free to curate another game instead."
 
+    if not dry_run:
+        reactions = (['💥'] if failed else []) + (['🚫'] if has_errors or has_warnings else []) or ['🤖']
+        for reaction in reactions:
+            l.debug("adding %s reaction to message '%s'", reaction, message.id)
+            await message.add_reaction(reaction)
+
     if is_extreme and not dry_run:
-        l.debug(f"adding :extreme: reaction to message '{message.id}'")
+        l.debug("adding :extreme: reaction to message '%s'", message.id)
         emoji = bot.get_emoji(EXTREME_EMOJI_ID)
         # This is just for testing on my server so I don't get an error, though it's also useful if we lose emoji slots
         if emoji is None:
@@ -217,7 +324,7 @@ async def check_curation_in_message(message: discord.Message, dry_run: bool = Tr
         # if len(curation_errors) == 0 and len(curation_warnings) > 0:
         #     final_reply += "⚠️ If the problems detected are valid and you're going to upload a fixed version, " \
         #                    "please remove the original curation submission after you upload the new one."
-        reply_channel: discord.TextChannel = bot.get_channel(BOT_ALERTS_CHANNEL)
+        reply_channel = bot.get_channel(BOT_ALERTS_CHANNEL)
         if is_extreme:
             reply_channel = bot.get_channel(NSFW_LOUNGE_CHANNEL)
         elif is_in_flash_game_channel or is_in_other_game_channel or is_in_animation_channel:
@@ -225,15 +332,12 @@ async def check_curation_in_message(message: discord.Message, dry_run: bool = Tr
         elif is_audition:
             reply_channel = bot.get_channel(AUDITION_CHAT_CHANNEL)
         if not dry_run:
-            l.info(f"sending reply to message '{message.id}' : '" + final_reply.replace('\n', ' ') + "'")
+            l.info("sending reply to message '%s' : '%s'", message.id, final_reply.replace('\n', ' '))
             await reply_channel.send(final_reply)
         else:
-            l.info(f"NOT SENDING reply to message '{message.id}' : '" + final_reply.replace('\n', ' ') + "'")
-    else:
-        if not dry_run:
-            l.debug(f"adding 🤖 reaction to message '{message.id}'")
-            await message.add_reaction('🤖')
-        l.info(f"curation in message '{message.id}' validated and is OK - {message.jump_url}")
+            l.info("NOT SENDING reply to message '%s' : '%s'", message.id, final_reply.replace('\n', ' '))
+    elif validated and not failed:
+        l.info("curations in message '%s' validated and are OK - %s", message.id, message.jump_url)
 
 
 def is_bot_guy():
@@ -251,8 +355,11 @@ async def main():
             await bot.load_extension(f"cogs.{filename[:-3]}")
         print(f"Cog \"{filename[:-3]}\" has been loaded.")
 
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+
     # start the client
-    l.info(f"starting the bot...")
+    l.info("starting the bot...")
     async with bot:
         await bot.start(TOKEN)
 
@@ -0,0 +1,52 @@
+from typing import AsyncIterator, NamedTuple
+
+import discord
+
+from logger import getLogger
+
+l = getLogger("main")
+
+BLUE_ID = 144019275210817536
+VALIDATED_EMOJIS = {"🤖", "ℹ️", "🚫", "⚠️"}
+
+
+class ScannedMessage(NamedTuple):
+    """What the callers of the scan need to know about a message, the message itself isn't kept alive by it."""
+    id: int
+    jump_url: str
+    attachment_count: int
+    already_validated: bool
+    has_blue_hammer: bool
+
+
+async def has_reaction_from(reaction: discord.Reaction, user_id: int) -> bool:
+    async for user in reaction.users():
+        if user.id == user_id:
+            return True
+    return False
+
+
+async def scan_until_blue(channel: discord.TextChannel) -> AsyncIterator[ScannedMessage]:
+    """
+    Streams the channel history from the newest message and stops after the message with Blue's hammer reaction.
+    Messages are yielded one at a time with their reaction state, so callers decide what, if anything, to keep,
+    and fetch the messages they act on again.
+    """
+    message_counter = 0
+    async for msg in channel.history(limit=None):
+        message_counter += 1
+        already_validated = False
+        has_blue_hammer = False
+        if len(msg.reactions) > 0:
+            l.debug("analyzing reactions for msg %s - message %s...", msg.id, message_counter)
+        for reaction in msg.reactions:
+            if reaction.emoji in VALIDATED_EMOJIS and reaction.me:
+                already_validated = True
+            elif reaction.emoji == "🛠️" and not has_blue_hammer:
+                l.debug("found hammer, getting reactions users for msg %s and reaction %s...", msg.id, reaction)
+                has_blue_hammer = await has_reaction_from(reaction, BLUE_ID)
+        yield ScannedMessage(msg.id, msg.jump_url, len(msg.attachments), already_validated, has_blue_hammer)
+        if has_blue_hammer:
+            l.debug("found Blue's hammer after scanning %s messages", message_counter)
+            return
+    l.warning("Blue's hammer not found after scanning all %s messages", message_counter)
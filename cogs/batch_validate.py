@@ -1,10 +1,18 @@
-from typing import Optional
+import asyncio
+import os
+import time
+from collections import deque
 
 import discord
 from discord.ext import commands
 
 from bot import l, FLASH_GAMES_CHANNEL, OTHER_GAMES_CHANNEL, ANIMATIONS_CHANNEL, COOL_CRAB, \
-    check_curation_in_message
+    AttachmentResult, get_curation_attachments, validate_curation_attachment, report_curation
+from channel_scanner import scan_until_blue
+from validation_pool import get_validation_pool
+
+BATCH_DOWNLOAD_CONCURRENCY = int(os.getenv('BATCH_DOWNLOAD_CONCURRENCY', 4))
+PROGRESS_INTERVAL = 60
 
 class BatchCheck(commands.Cog, description="Batch Checking"):
 
@@ -14,7 +22,8 @@ class BatchCheck(commands.Cog, description="Batch Checking"):
     @commands.command(name="batch-validate", hidden=True)
     @commands.has_role("Administrator")
     @commands.max_concurrency(1, per=commands.BucketType.default, wait=False)
-    async def batch_validate_command(self, ctx: discord.ext.commands.Context, channel_alias: str, limit: int, dry_run: bool):
+    async def batch_validate_command(self, ctx: discord.ext.commands.Context, channel_alias: str, limit: int, dry_run: bool,
+                                     download_concurrency: int = BATCH_DOWNLOAD_CONCURRENCY):
         if channel_alias == "flash":
             channel_id = FLASH_GAMES_CHANNEL
         elif channel_alias == "other":
@@ -29,6 +38,10 @@ class BatchCheck(commands.Cog, description="Batch Checking"):
             await ctx.channel.send("limit must be > 0 and <= 500")
             return
 
+        if download_concurrency <= 0 or download_concurrency > 16:
+            await ctx.channel.send("download concurrency must be > 0 and <= 16")
+            return
+
         if dry_run:
             await ctx.channel.send(f"[DRY RUN] Validating a batch of up to {limit} of the oldest* unprocessed curations. "
                                    f"Sit back and relax, this will take a while {COOL_CRAB}.")
@@ -36,88 +49,94 @@ class BatchCheck(commands.Cog, description="Batch Checking"):
             await ctx.channel.send(f"Validating a batch of up to {limit} of the oldest* unprocessed curations. "
                                    f"Sit back and relax, this will take a while {COOL_CRAB}.")
 
-        messages = await self.get_messages_without_bot_reaction_from_blue(channel_id, limit)
-        if len(messages) == 0:
+        channel = self.bot.get_channel(channel_id)
+        message_ids = await self.get_message_ids_without_bot_reaction_from_blue(channel, limit)
+        if len(message_ids) == 0:
             await ctx.channel.send(f"No unchecked curations found.")
             return
 
-        counter = 0
-        for message in messages:
-            l.debug(f"batch-validate: Checking message #{counter} - {message.id} - {message.jump_url}")
-            counter += 1
-            await check_curation_in_message(message, dry_run=dry_run)
+        counter = await self.validate_batch(ctx, channel, message_ids, dry_run, download_concurrency)
 
-        l.debug(f"Batch validated {counter} curations.")
+        l.debug("Batch validated %s curations.", counter)
         await ctx.channel.send(f"Batch validated {counter} curations.")
 
-    async def get_messages_without_bot_reaction_from_blue(self, channel_id: int, max_messages: int = 1) -> list[
-        discord.Message]:
-        all_messages = await self.get_messages_without_bot_reaction_until_blue(channel_id, max_messages=100000)
-        all_messages.reverse()
-        from_index = 1  # remove blue's hammer
-        to_index = max_messages + from_index if max_messages + from_index <= len(all_messages) else len(all_messages)
-        return all_messages[from_index:to_index]
-
-    async def get_messages_without_bot_reaction_until_blue(self, channel_id: int, max_messages: int = 1) -> list[
-        discord.Message]:
+    async def validate_batch(self, ctx: discord.ext.commands.Context, channel: discord.TextChannel,
+                             message_ids: list[int], dry_run: bool, download_concurrency: int) -> int:
         """
-        Returns list of messages from a channel which bot did not react to,
-        up until max_messages or until Blue's hammer reaction is found, including the hammer message.
+        Fetches the messages as their turn comes, downloads attachments with bounded concurrency and validates them
+        in parallel in the validation pool, while reporting the results in message order.
+        Progress is reported in the invoking channel periodically.
         """
-        BLUE_ID = 144019275210817536
-        message_counter = 0
-        oldest_message: Optional[discord.Message] = None
-        batch_size = 1000
-        all_messages: list[discord.Message] = []
-        non_validated_messages: list[discord.Message] = []
-
-        channel = self.bot.get_channel(channel_id)
-        while True:
-            if oldest_message is None:
-                l.debug(f"getting {batch_size} messages...")
-                message_batch: list[discord.Message] = await channel.history(limit=batch_size).flatten()
-            else:
-                l.debug(f"getting {batch_size} messages from {oldest_message.jump_url} ...")
-                message_batch: list[discord.Message] = await channel.history(limit=batch_size,
-                                                                             before=oldest_message).flatten()
-            if len(message_batch) == 0:
-                l.warn(f"no messages found, weird.")
-                return all_messages
-            oldest_message = message_batch[-1]
-            all_messages.extend(message_batch)
-
-            l.debug("processing messages...")
-            for msg in message_batch:
-                # TODO can we have more than one attachment?
-                potential_result = [msg for msg in non_validated_messages if len(msg.attachments) == 1]
-                if len(potential_result) >= max_messages:
-                    return potential_result
-                message_counter += 1
-                reactions = msg.reactions
-                if len(reactions) > 0:
-                    l.debug(f"analyzing reactions for msg {msg.id} - message {message_counter}...")
-                already_validated = False
-                found_blue = False
-                for reaction in reactions:
-                    if (
-                            reaction.emoji == "🤖" or reaction.emoji == "ℹ️" or reaction.emoji == "🚫" or reaction.emoji == "⚠️") and reaction.me:
-                        already_validated = True
+        download_slots = asyncio.Semaphore(download_concurrency)
+        # bounds how many downloaded archives can wait on disk for validation or reporting
+        window = asyncio.Semaphore(download_concurrency + 2 * get_validation_pool().max_workers)
+
+        async def check(message: discord.Message, attachment: discord.Attachment) -> AttachmentResult:
+            try:
+                return AttachmentResult(attachment, *await validate_curation_attachment(message, attachment,
+                                                                                         download_slots,
+                                                                                         index_content=not dry_run))
+            finally:
+                window.release()
+
+        async def produce(queue: asyncio.Queue):
+            # the sentinel is sent even if producing fails, the consumer then re-raises the error of the producer
+            try:
+                for message_id in message_ids:
+                    try:
+                        message = await channel.fetch_message(message_id)
+                    except discord.NotFound:
+                        l.debug("batch-validate: message %s was deleted since the scan, skipping it", message_id)
                         continue
-                    if reaction.emoji != "🛠️":
+                    except discord.HTTPException as e:
+                        l.warning("batch-validate: could not fetch message %s, skipping it: %s", message_id, e)
                         continue
-                    l.debug(f"found hammer, getting reactions users for msg {msg.id} and reaction {reaction}...")
-                    users: list[discord.User] = await reaction.users().flatten()
-                    for user in users:
-                        if user.id == BLUE_ID:
-                            found_blue = True
-                            break
-                if not already_validated:
-                    non_validated_messages.append(msg)
-                if found_blue:
-                    l.debug(f"message filter searched {len(all_messages)} messages "
-                            f"and found {len(non_validated_messages)} which were not validated yet.")
-                    return [msg for msg in non_validated_messages if
-                            len(msg.attachments) == 1]  # TODO can we have more than one attachment?
+                    tasks = []
+                    # every attachment takes a slot of its own, so a message with many of them can't hold up the
+                    # window
+                    for attachment in get_curation_attachments(message):
+                        await window.acquire()
+                        tasks.append(asyncio.create_task(check(message, attachment)))
+                    await queue.put((message, tasks))
+            finally:
+                queue.put_nowait(None)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(produce(queue))
+        counter = 0
+        last_progress = time.monotonic()
+        try:
+            while (item := await queue.get()) is not None:
+                message, tasks = item
+                l.debug("batch-validate: Checking message #%s - %s - %s", counter, message.id, message.jump_url)
+                counter += 1
+                if tasks:
+                    await report_curation(message, list(await asyncio.gather(*tasks)), dry_run)
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    await ctx.channel.send(f"{'[DRY RUN] ' if dry_run else ''}Validated {counter}/{len(message_ids)} curations...")
+            await producer
+        finally:
+            producer.cancel()
+        return counter
+
+    async def get_message_ids_without_bot_reaction_from_blue(self, channel: discord.TextChannel,
+                                                             max_messages: int = 1) -> list[int]:
+        """
+        Returns the IDs of up to max_messages of the oldest messages with attachments the bot did not react to
+        that were posted after the message with Blue's hammer reaction, oldest first.
+        """
+        # the scan goes from the newest message, so the oldest candidates are the last ones seen
+        candidates: deque[int] = deque(maxlen=max_messages)
+        scanned = 0
+        async for scanned_message in scan_until_blue(channel):
+            scanned += 1
+            if scanned_message.has_blue_hammer:
+                break
+            if not scanned_message.already_validated and scanned_message.attachment_count > 0:
+                candidates.append(scanned_message.id)
+        l.debug("message filter searched %s messages and kept %s which were not validated yet.", scanned, len(candidates))
+        return list(reversed(candidates))
 
 
 async def setup(bot: commands.Bot):
@@ -1,4 +1,6 @@
+import asyncio
 import datetime
+import io
 import os
 import re
 import shutil
@@ -15,11 +17,14 @@ from discord.ext import commands
 import util
 from bot import COOL_CRAB, PENDING_FIXES_CHANNEL, FLASH_GAMES_CHANNEL, OTHER_GAMES_CHANNEL, ANIMATIONS_CHANNEL, \
     is_bot_guy
+from channel_scanner import scan_until_blue
 from curation_validator import get_launch_commands_bluebot
 from logger import getLogger
 
 l = getLogger("main")
 
+PENDING_FIXES_DOWNLOAD_CONCURRENCY = 8
+
 
 class Utilities(commands.Cog, description="Utilities, primarily for moderators."):
 
@@ -29,19 +34,13 @@ class Utilities(commands.Cog, description="Utilities, primarily for moderators."
     @commands.command(name="check-lc", brief="Check if a given launch command is already in the master database.",
                       description="Check if a given launch command is already in the master database.")
     async def check_lc(self, ctx: discord.ext.commands.Context, *launch_command):
-        l.debug(f"check_lc command invoked from {ctx.author.id} in channel {ctx.channel.id} - {ctx.message.jump_url}")
-
-        def normalize_launch_command(launch_command: str) -> str:
-            return launch_command.replace('"', "").replace("'", "").replace(" ", "").replace("`", "")
+        l.debug("check_lc command invoked from %s in channel %s - %s", ctx.author.id, ctx.channel.id, ctx.message.jump_url)
 
         launch_command_user = ""
         for arg in launch_command:
             launch_command_user += arg
 
-        launch_command_user = normalize_launch_command(launch_command_user)
-        normalized_commands = {normalize_launch_command(command) for command in get_launch_commands_bluebot()}
-
-        if launch_command_user in normalized_commands:
+        if get_launch_commands_bluebot().contains_normalized(launch_command_user):
             await ctx.channel.send("Launch command **found** in the master database, most likely a duplicate.")
         else:
             await ctx.channel.send("Launch command **not found** in the master database, most likely not a duplicate.")
@@ -49,18 +48,18 @@ class Utilities(commands.Cog, description="Utilities, primarily for moderators."
     @commands.command(hidden=True)
     @commands.has_role("Administrator")
     async def ping(self, ctx: discord.ext.commands.Context):
-        l.debug(f"received ping from {ctx.author.id} in channel {ctx.channel.id} - {ctx.message.jump_url}")
+        l.debug("received ping from %s in channel %s - %s", ctx.author.id, ctx.channel.id, ctx.message.jump_url)
         await ctx.channel.send("pong")
 
     @commands.command(name="approve", brief="Override the bot's decision and approve the curation (Moderator).",
                       description="Override the bot's decision and approve the curation (Moderator only).")
     @commands.check_any(commands.has_role("Moderator"), is_bot_guy())
     async def approve(self, ctx: discord.ext.commands.Context, message: discord.Message):
-        l.debug(f"approve command invoked from {ctx.author.id} in channel {ctx.channel.id} - {ctx.message.jump_url}")
+        l.debug("approve command invoked from %s in channel %s - %s", ctx.author.id, ctx.channel.id, ctx.message.jump_url)
         reactions: list[discord.Reaction] = message.reactions
         for reaction in reactions:
             if reaction.me:
-                l.debug(f"removing bot's reaction {reaction} from message {message.id}")
+                l.debug("removing bot's reaction %s from message %s", reaction, message.id)
                 await message.remove_reaction(reaction.emoji, self.bot.user)
         await message.add_reaction("🤖")
 
@@ -68,14 +67,14 @@ class Utilities(commands.Cog, description="Utilities, primarily for moderators."
                       description="Pin a message by url (Staff only).")
     @commands.has_any_role("Mechanic", "Developer", "Curator", "Archivist", "Hacker", "Hunter", "Administrator")
     async def pin(self, ctx: discord.ext.commands.Context, message: discord.Message):
-        l.debug(f"pin command invoked from {ctx.author.id} in channel {ctx.channel.id} - {ctx.message.jump_url}")
+        l.debug("pin command invoked from %s in channel %s - %s", ctx.author.id, ctx.channel.id, ctx.message.jump_url)
         await message.pin()
 
     @commands.command(name="unpin", brief="Unpin a message (Staff).",
                       description="Unpin a message by url (Staff only).")
     @commands.has_any_role("Mechanic", "Developer", "Curator", "Archivist", "Hacker", "Hunter", "Administrator")
     async def unpin(self, ctx: discord.ext.commands.Context, message: discord.Message):
-        l.debug(f"unpin command invoked from {ctx.author.id} in channel {ctx.channel.id} - {ctx.message.jump_url}")
+        l.debug("unpin command invoked from %s in channel %s - %s", ctx.author.id, ctx.channel.id, ctx.message.jump_url)
         await message.unpin()
         await ctx.send("Unpinned!")
 
@@ -87,8 +86,8 @@ class Utilities(commands.Cog, description="Utilities, primarily for moderators."
     async def automatic_get_jsons(self, ctx: discord.ext.commands.Context, last_message: Optional[discord.Message],
                                   channel: Optional[discord.TextChannel] = None,
                                   use_flashfreze: Optional[bool] = False):
-        l.debug(
-            f"pending fixes command invoked from {ctx.author.id} in channel {ctx.channel.id} - {ctx.message.jump_url}")
+        l.debug("pending fixes command invoked from %s in channel %s - %s",
+                ctx.author.id, ctx.channel.id, ctx.message.jump_url)
         if not channel:
             channel = self.bot.get_channel(PENDING_FIXES_CHANNEL)
         async with ctx.typing():
@@ -97,25 +96,24 @@ class Utilities(commands.Cog, description="Utilities, primarily for moderators."
                     f"Getting all jsons in {channel.mention} not marked with a ⚠️  before <{last_message.jump_url}> and after the pin. "
                     f"Sit back and relax, this will take a while {COOL_CRAB}.")
 
-                final_folder, start_date, end_date = await self.get_raw_json_messages_in_pending_fixes(last_message, channel)
+                archive, start_date, end_date = await self.get_raw_json_messages_in_pending_fixes(last_message, channel)
             else:
                 await ctx.send(f"Getting all jsons in {channel.mention} not marked with a ⚠️ since the pin. "
                                f"Sit back and relax, this will take a while {COOL_CRAB}.")
-                final_folder, start_date, end_date = await self.get_raw_json_messages_in_pending_fixes(None, channel)
+                archive, start_date, end_date = await self.get_raw_json_messages_in_pending_fixes(None, channel)
 
-            archive = shutil.make_archive(f'pending_fixes {start_date} to {end_date}', 'zip', final_folder)
-            l.debug(f"Sending fetched pending fixes")
+            l.debug("Sending fetched pending fixes")
             try:
-                if not use_flashfreze:
-                    await ctx.send(file=discord.File(archive))
-                else:
+                try:
+                    if not use_flashfreze:
+                        await ctx.send(file=discord.File(archive))
+                    else:
+                        await self.send_with_flashfreeze(ctx, archive)
+                except HTTPException:
+                    await ctx.send("Resulting file too large, sending as to flashfreeze instead.")
                     await self.send_with_flashfreeze(ctx, archive)
-            except HTTPException:
-                await ctx.send("Resulting file too large, sending as to flashfreeze instead.")
-                await self.send_with_flashfreeze(ctx, archive)
-
-        shutil.rmtree(final_folder, True)
-        os.remove(archive)
+            finally:
+                shutil.rmtree(os.path.dirname(archive), True)
 
     async def send_with_flashfreeze(self, ctx, archive):
         l.debug("Sending with flashfreeze")
@@ -143,18 +141,18 @@ class Utilities(commands.Cog, description="Utilities, primarily for moderators."
         await ctx.channel.send(f"Measuring the length of Blue's curation journey through hell. "
                                f"Sit back and relax, this will take a while {COOL_CRAB}.")
 
-        messages = await self.hell_counter(channel_id)
-        if len(messages) > 0:
+        message_count, last_jump_url = await self.hell_counter(channel_id)
+        if message_count > 0:
             await ctx.channel.send(
-                f"Blue's curation journey in `{channel_alias}` channel is `{len(messages)}` messages long.\n"
-                f"🔗 {messages[-1].jump_url}")
+                f"Blue's curation journey in `{channel_alias}` channel is `{message_count}` messages long.\n"
+                f"🔗 {last_jump_url}")
         else:
             await ctx.channel.send(f"Blue has earned his freedom... for now.")
 
     @commands.command(name="mood", brief="Mood.", hidden=True)
     @commands.has_role("Moderator")
     async def mood(self, ctx: discord.ext.commands.Context):
-        l.debug(f"mood command invoked from {ctx.author.id} in channel {ctx.channel.id} - {ctx.message.jump_url}")
+        l.debug("mood command invoked from %s in channel %s - %s", ctx.author.id, ctx.channel.id, ctx.message.jump_url)
         await ctx.channel.send("```\n"
                                "'You thought it would be cool?' This was not as interesting an explanation as I had hoped for.\n"
                                "'Yeah. What?' He turned to look at me. 'You never did something just because you thought it might be cool?'\n"
@@ -172,47 +170,24 @@ class Utilities(commands.Cog, description="Utilities, primarily for moderators."
                                "'I suppose I thought it might be cool,' I said.\n"
                                "```")
 
-    async def hell_counter(self, channel_id: int) -> list[discord.Message]:
-        BLUE_ID = 144019275210817536
+    async def hell_counter(self, channel_id: int) -> tuple[int, Optional[str]]:
+        """Returns how many messages there are up to and including Blue's hammer, and the link to the last of them."""
+        message_count = 0
+        last_jump_url = None
+        async for scanned_message in scan_until_blue(self.bot.get_channel(channel_id)):
+            message_count += 1
+            last_jump_url = scanned_message.jump_url
+        return message_count, last_jump_url
+
+    async def get_raw_json_messages_in_pending_fixes(self, newest_message: Optional[discord.Message], channel: discord.TextChannel) -> tuple[str, str, str]:
+        """
+        Collects the json and archive attachments in the channel into a zip archive and returns its path, in a
+        temporary folder the caller removes. If collecting fails, the folder is removed along with the partial archive.
+        Attachments are downloaded concurrently and written straight into the archive, in folders of 100.
+        """
         message_counter = 0
-        oldest_message: Optional[discord.Message] = None
-        batch_size = 1000
-        messages: list[discord.Message] = []
-
-        channel = self.bot.get_channel(channel_id)
-        while True:
-            if oldest_message is None:
-                l.debug(f"getting {batch_size} messages...")
-                message_batch: list[discord.Message] = await channel.history(limit=batch_size).flatten()
-            else:
-                l.debug(f"getting {batch_size} messages from {oldest_message.jump_url} ...")
-                message_batch: list[discord.Message] = await channel.history(limit=batch_size,
-                                                                             before=oldest_message).flatten()
-            if len(message_batch) == 0:
-                l.warn(f"no messages found, weird.")
-                return messages
-            oldest_message = message_batch[-1]
-            messages.extend(message_batch)
-
-            l.debug("processing messages...")
-            for msg in message_batch:
-                message_counter += 1
-                reactions = msg.reactions
-                if len(reactions) > 0:
-                    l.debug(f"analyzing reactions for msg {msg.id} - message {message_counter}...")
-                for reaction in reactions:
-                    if reaction.emoji != "🛠️":
-                        continue
-                    l.debug(f"found hammer, getting reactions users for msg {msg.id} and reaction {reaction}...")
-                    users: list[discord.User] = await reaction.users().flatten()
-                    for user in users:
-                        if user.id == BLUE_ID:
-                            return messages[:message_counter]
-
-    async def get_raw_json_messages_in_pending_fixes(self, newest_message: Optional[discord.Message], channel: discord.TextChannel) -> Optional[tuple[str, str, str]]:
-        message_counter = 0
-        downloaded_attachments: list[str] = []
-        temp_folder = tempfile.mkdtemp(prefix='pending_fixes')
+        accepted_attachments = 0
+        duplicate_counts: dict[str, int] = {}
         pins: list[discord.Message] = await channel.pins()
         pins.sort(key=lambda pin: pin.created_at)
         if pins:
@@ -225,44 +200,70 @@ class Utilities(commands.Cog, description="Utilities, primarily for moderators."
             end_date = datetime.date.today().strftime('%Y-%m-%d')
         else:
             end_date = newest_message.created_at.date().strftime('%Y-%m-%d')
-        uuid_regex = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+        archive_dir = tempfile.mkdtemp(prefix="pending_fixes_")
+        archive_path = os.path.join(archive_dir, f'pending_fixes {start_date} to {end_date}.zip')
+        download_slots = asyncio.Semaphore(PENDING_FIXES_DOWNLOAD_CONCURRENCY)
+        tasks: list[asyncio.Task] = []
         l.debug("processing messages...")
-        async for msg in channel.history(before=newest_message, after=oldest_message, limit=None):
-            l.debug(f"Processing message {msg.id}")
-            message_counter += 1
-            if len(msg.attachments) != 1:
-                continue
-            reactions = msg.reactions
-            if len(reactions) > 0:
-                l.debug(f"analyzing reactions for msg {msg.id} - message {message_counter}...")
-            should_be_manual = False
-            for reaction in reactions:
-                if reaction.emoji == "⚠️":
-                    should_be_manual = True
-            attachment_filename = msg.attachments[0].filename
-            if \
-                    attachment_filename.endswith('.json') or \
-                    attachment_filename.endswith('.zip') or attachment_filename.endswith('.7z') and \
-                    not should_be_manual and msg.attachments[0].size < 3_000_000:
-                l.debug(f"Downloading file {attachment_filename} from message {msg.id}")
-                num_duplicates = downloaded_attachments.count(attachment_filename)
-                folder_number = int(len(downloaded_attachments)/100)
-                downloaded_attachments.append(attachment_filename)
-                if not os.path.exists(f"{temp_folder}/{folder_number}"):
-                    os.makedirs(f"{temp_folder}/{folder_number}")
-                if num_duplicates == 0:
-                    save_location = f'{temp_folder}/{folder_number}/{attachment_filename}'
-                else:
-                    save_location = f'{temp_folder}/{folder_number}/dupe{num_duplicates}-{attachment_filename}'
-                await msg.attachments[0].save(save_location)
-                if attachment_filename.endswith('.7z') or attachment_filename.endswith('.zip'):
-                    try:
-                        if not all(uuid_regex.search(x) for x in util.get_archive_filenames(save_location)):
-                            os.remove(save_location)
-                    except (util.NotArchiveType, util.ArchiveTooLargeException, zipfile.BadZipfile, py7zr.Bad7zFile) as e:
-                        l.info(f"Error {e} when opening {save_location}, removing archive.")
-                        os.remove(save_location)
-        return temp_folder, start_date, end_date
+        try:
+            with zipfile.ZipFile(archive_path, 'w') as output:
+                try:
+                    async for msg in channel.history(before=newest_message, after=oldest_message, limit=None):
+                        l.debug("Processing message %s", msg.id)
+                        message_counter += 1
+                        if len(msg.attachments) != 1:
+                            continue
+                        reactions = msg.reactions
+                        if len(reactions) > 0:
+                            l.debug("analyzing reactions for msg %s - message %s...", msg.id, message_counter)
+                        should_be_manual = False
+                        for reaction in reactions:
+                            if reaction.emoji == "⚠️":
+                                should_be_manual = True
+                        attachment = msg.attachments[0]
+                        attachment_filename = attachment.filename
+                        if (attachment_filename.endswith('.json') or attachment_filename.endswith('.zip')
+                                or attachment_filename.endswith('.7z')) and \
+                                not should_be_manual and attachment.size < 3_000_000:
+                            num_duplicates = duplicate_counts.get(attachment_filename, 0)
+                            duplicate_counts[attachment_filename] = num_duplicates + 1
+                            folder_number = int(accepted_attachments / 100)
+                            accepted_attachments += 1
+                            if num_duplicates == 0:
+                                arcname = f'{folder_number}/{attachment_filename}'
+                            else:
+                                arcname = f'{folder_number}/dupe{num_duplicates}-{attachment_filename}'
+                            tasks.append(asyncio.create_task(
+                                self.collect_pending_fix(msg, attachment, arcname, output, download_slots)))
+                    await asyncio.gather(*tasks)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+        except BaseException:
+            # a partial archive is never handed out
+            shutil.rmtree(archive_dir, True)
+            raise
+        return archive_path, start_date, end_date
+
+    async def collect_pending_fix(self, msg: discord.Message, attachment: discord.Attachment, arcname: str,
+                                  output: zipfile.ZipFile, download_slots: asyncio.Semaphore):
+        async with download_slots:
+            l.debug("Downloading file %s from message %s", attachment.filename, msg.id)
+            data = await attachment.read()
+        if attachment.filename.endswith('.7z') or attachment.filename.endswith('.zip'):
+            uuid_regex = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+            try:
+                filenames = await asyncio.get_running_loop().run_in_executor(
+                    None, util.get_archive_filenames, attachment.filename, io.BytesIO(data))
+            except (util.NotArchiveType, util.ArchiveTooLargeException, zipfile.BadZipfile, py7zr.Bad7zFile) as e:
+                l.info("Error %s when opening %s from message %s, skipping archive.", e, attachment.filename, msg.id)
+                return
+            if not all(uuid_regex.search(x) for x in filenames):
+                return
+            # archives are already compressed
+            output.writestr(arcname, data, compress_type=zipfile.ZIP_STORED)
+        else:
+            output.writestr(arcname, data, compress_type=zipfile.ZIP_DEFLATED)
 
 
 class BadURLException(Exception):
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# the tests log to a temporary file rather than the log.log of the bot, set before any module imports logger
+os.environ["LOGFILE_PATH"] = os.path.join(tempfile.gettempdir(), "curation_validator_test.log")
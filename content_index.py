@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from logger import getLogger
+
+l = getLogger("main")
+
+# curations sharing at least this share of the content files of a new one are reported
+CONTENT_INDEX_MIN_MATCH = float(os.getenv('CONTENT_INDEX_MIN_MATCH', 0.5))
+# 1 to also hash every content file, which decompresses them, so that files only match if their contents do
+CONTENT_INDEX_STRONG_HASH = bool(int(os.getenv('CONTENT_INDEX_STRONG_HASH', 0)))
+
+
+class ContentMatch(NamedTuple):
+    key: str
+    title: Optional[str]
+    # how many of the content files of the checked curation are also in the matching one
+    matched: int
+    # the share of the content files of the checked curation that matched
+    ratio: float
+
+
+def fingerprint(size: int, crc32: int) -> int:
+    """Combines the size and CRC32 of a file into an integer SQLite can store, sizes of 2GB and up are capped."""
+    return (min(size, 0x7FFFFFFF) << 32) | crc32
+
+
+def content_key(fingerprints: dict[int, Optional[bytes]]) -> str:
+    """The key of a curation without a UUID folder, identical content gets the same key."""
+    digest = hashlib.sha256()
+    for value in sorted(fingerprints):
+        digest.update(value.to_bytes(8, "little"))
+    return f"content:{digest.hexdigest()}"
+
+
+class ContentIndex:
+    """
+    Index of the content files of every accepted curation by their size and CRC32, which zip and 7z archives store
+    in their headers, so that duplicated content is found without decompressing anything. A strong hash can be
+    stored along with them, two files with the same size and CRC32 only match if their strong hashes do as well.
+    Curations are keyed by their UUID so that a fixed resubmission of a curation doesn't match itself.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # every validation worker has its own connection, they wait for each other's writes
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS curations ("
+                         "id INTEGER PRIMARY KEY, "
+                         "key TEXT NOT NULL UNIQUE, "
+                         "title TEXT, "
+                         "files INTEGER NOT NULL, "
+                         "added REAL NOT NULL)")
+        # clustered by fingerprint, a lookup reads only the rows of the fingerprints it looks for
+        self._db.execute("CREATE TABLE IF NOT EXISTS files ("
+                         "fingerprint INTEGER NOT NULL, "
+                         "curation INTEGER NOT NULL, "
+                         "strong_hash BLOB, "
+                         "PRIMARY KEY (fingerprint, curation)) WITHOUT ROWID")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_curation ON files (curation)")
+        self._db.execute("CREATE TEMP TABLE lookup (fingerprint INTEGER PRIMARY KEY, strong_hash BLOB)")
+        self._db.commit()
+
+    def find_matches(self, key: str, fingerprints: dict[int, Optional[bytes]], min_ratio: float = 0.5,
+                     limit: int = 3) -> list[ContentMatch]:
+        """
+        Returns the curations other than `key` that contain at least `min_ratio` of the given content files,
+        which are mapped to their strong hash or None, with the most matching curation first.
+        """
+        if not fingerprints:
+            return []
+        with self._lock:
+            try:
+                self._db.executemany("INSERT INTO lookup VALUES (?, ?)", fingerprints.items())
+                # CROSS JOIN keeps SQLite from scanning all files to group them, it seeks each looked up fingerprint
+                rows = self._db.execute(
+                    "SELECT curations.key, curations.title, COUNT(*) AS matched FROM lookup "
+                    "CROSS JOIN files ON files.fingerprint = lookup.fingerprint "
+                    "JOIN curations ON curations.id = files.curation "
+                    "WHERE curations.key != ? AND (lookup.strong_hash IS NULL OR files.strong_hash IS NULL "
+                    "OR lookup.strong_hash = files.strong_hash) "
+                    "GROUP BY files.curation HAVING matched >= ? ORDER BY matched DESC LIMIT ?",
+                    (key, min_ratio * len(fingerprints), limit)).fetchall()
+            finally:
+                self._db.execute("DELETE FROM lookup")
+                self._db.commit()
+        return [ContentMatch(key, title, matched, matched / len(fingerprints)) for key, title, matched in rows]
+
+    def add(self, key: str, title: Optional[str], fingerprints: dict[int, Optional[bytes]]):
+        """
+        Adds the content files of a curation to the index, replacing the files it had under the same key.
+        Adding the same files and title under the same key again leaves the index as it is.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT id, title FROM curations WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] == title and dict(self._db.execute(
+                    "SELECT fingerprint, strong_hash FROM files WHERE curation = ?", (row[0],))) == fingerprints:
+                l.debug("content files of curation '%s' are already in the content index", key)
+                return
+            curation, = self._db.execute(
+                "INSERT INTO curations (key, title, files, added) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET title = excluded.title, files = excluded.files, "
+                "added = excluded.added RETURNING id",
+                (key, title, len(fingerprints), time.time())).fetchone()
+            self._db.execute("DELETE FROM files WHERE curation = ?", (curation,))
+            self._db.executemany("INSERT INTO files VALUES (?, ?, ?)",
+                                 ((value, curation, strong_hash) for value, strong_hash in fingerprints.items()))
+            self._db.commit()
+        l.debug("added %s content files of curation '%s' to the content index", len(fingerprints), key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            curations, = self._db.execute("SELECT COUNT(*) FROM curations").fetchone()
+            files, = self._db.execute("SELECT COUNT(*) FROM files").fetchone()
+        return {"curations": curations, "files": files}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_index: Optional[ContentIndex] = None
+
+
+def get_content_index() -> Optional[ContentIndex]:
+    """Returns the process-wide content index, or None if CONTENT_INDEX_PATH isn't set."""
+    global _index
+    path = os.getenv('CONTENT_INDEX_PATH', "")
+    if _index is None and path:
+        _index = ContentIndex(path)
+    return _index
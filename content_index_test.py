@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import curation_validator
+from archive_backends import ArchiveMember
+from content_index import ContentIndex, content_key, fingerprint
+
+UUID = "e647a839-c4d8-4c51-8f04-4cf142f1718c"
+OTHER_UUID = "0c6ee8f7-16b2-4d7e-a7b6-8e0e0ab6c1d0"
+
+
+class TestContentIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index = ContentIndex(os.path.join(self.temp_dir.name, "content_index.sqlite3"))
+
+    def tearDown(self):
+        self.index.close()
+        self.temp_dir.cleanup()
+
+    def test_find_matches(self):
+        self.index.add("a", "Game A", {fingerprint(100, i): None for i in range(10)})
+        self.index.add("b", "Game B", {fingerprint(100, i): None for i in range(5, 20)})
+        matches = self.index.find_matches("c", {fingerprint(100, i): None for i in range(8)}, min_ratio=0.5)
+        self.assertEqual([(match.key, match.title, match.matched) for match in matches], [("a", "Game A", 8)])
+        self.assertEqual(matches[0].ratio, 1.0)
+        # a curation never matches itself, and adding it again replaces its files
+        self.assertNotIn("a", [match.key for match in self.index.find_matches("a", {fingerprint(100, i): None
+                                                                                    for i in range(10)})])
+        self.index.add("a", "Game A", {fingerprint(200, 1): None})
+        self.assertEqual(self.index.stats(), {"curations": 2, "files": 16})
+        self.assertEqual(self.index.find_matches("c", {fingerprint(100, i): None for i in range(4)}), [])
+
+    def test_strong_hashes(self):
+        self.index.add("a", None, {fingerprint(100, 1): b"1", fingerprint(100, 2): None})
+        self.assertEqual(len(self.index.find_matches("b", {fingerprint(100, 1): b"1"}, min_ratio=1)), 1)
+        # same size and CRC32 but different content
+        self.assertEqual(self.index.find_matches("b", {fingerprint(100, 1): b"2"}, min_ratio=1), [])
+        # a file without a strong hash matches on the size and CRC32 alone
+        self.assertEqual(len(self.index.find_matches("b", {fingerprint(100, 2): b"2"}, min_ratio=1)), 1)
+
+    def test_content_key(self):
+        self.assertEqual(content_key({1: None, 2: None}), content_key({2: b"x", 1: None}))
+        self.assertNotEqual(content_key({1: None}), content_key({2: None}))
+
+    def test_add_same_content(self):
+        self.index.add("a", "Game A", {fingerprint(100, 1): None})
+        added, = self.index._db.execute("SELECT added FROM curations WHERE key = 'a'").fetchone()
+        self.index.add("a", "Game A", {fingerprint(100, 1): None})
+        self.assertEqual(self.index._db.execute("SELECT added FROM curations WHERE key = 'a'").fetchone(), (added,))
+        self.index.add("a", "Game A", {fingerprint(100, 2): None})
+        self.assertEqual(len(self.index.find_matches("b", {fingerprint(100, 2): None}, min_ratio=1)), 1)
+
+    def test_check_duplicate_content(self):
+        members = [ArchiveMember(f"{UUID}/content/", True, 0, None),
+                   ArchiveMember(f"{UUID}/content/a.swf", False, 1000, 0x1234),
+                   ArchiveMember(f"{UUID}/content/empty.txt", False, 0, 0),
+                   ArchiveMember(f"{UUID}/logo.png", False, 1000, 0x5678)]
+        with patch.object(curation_validator, "get_content_index", return_value=self.index):
+            def check(uuid: str):
+                renamed = [member._replace(name=member.name.replace(UUID, uuid)) for member in members]
+                return curation_validator.find_duplicate_content("curation.7z", 1000, renamed,
+                                                                 f"{uuid}/content/", [uuid])
+
+            self.assertEqual(check(UUID), [])
+            # validating only looks the content up
+            self.assertEqual(self.index.stats(), {"curations": 0, "files": 0})
+            key, fingerprints = curation_validator.content_fingerprints("curation.7z", 1000, members,
+                                                                        f"{UUID}/content/", [UUID])
+            self.index.add(key, "Game", fingerprints)
+            # a fixed resubmission of the same curation isn't a duplicate
+            self.assertEqual(check(UUID), [])
+            self.assertEqual(check(OTHER_UUID),
+                             ["100% of the content matches the curation `Game`. Is your curation a duplicate?"])
+        self.assertEqual(self.index.stats(), {"curations": 1, "files": 1})
+
+    def test_index_curation_content(self):
+        with patch.object(curation_validator, "get_content_index", return_value=self.index):
+            curation_validator.index_curation_content("test_curations/test_curation_valid.7z", "Game")
+            curation_validator.index_curation_content("test_curations/test_curation_valid.7z", "Game")
+        self.assertEqual(self.index.stats()["curations"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,23 +1,61 @@
-import base64
+import hashlib
+import mmap
+import pathlib
 import shutil
 import json
 import re
+import sqlite3
+import time
 from enum import Enum, auto
-from typing import Optional
+from typing import Callable, NamedTuple, Optional
 
-import py7zr
-from cachetools import TTLCache, cached
-from ruamel.yaml import YAML, YAMLError
+from cachetools import TTLCache
 
+from language_registry import get_language_registry
+from archive_backends import ArchiveMember, get_archive_type, get_backend
+from content_index import CONTENT_INDEX_MIN_MATCH, CONTENT_INDEX_STRONG_HASH, content_key, fingerprint, \
+    get_content_index
+from extraction_budget import ExtractionBudget, ExtractionBudgetExceeded, DeadlineReader
+from launch_command_index import LaunchCommandIndex
 from logger import getLogger
+from meta_parser import MetaParseError, parse_meta
+from metrics import StageTimer, cached, record, VALIDATIONS, VALIDATION_SECONDS, ARCHIVE_SIZE_BYTES, \
+    ARCHIVE_MEMBERS
+from reference_data import get_reference_data
+from rule_pipeline import FatalError, Rule, RuleInput, RulePipeline, RuleResult
 import os
 import tempfile
-import zipfile
-import requests
-from bs4 import BeautifulSoup
 
 l = getLogger("main")
 
+UUID_REGEX = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$")
+UUID_REGEX_CASE = re.compile(r"(?i)^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$")
+META_FILENAMES = {"meta.yaml", "meta.yml", "meta.txt"}
+
+# archives up to this size are read from memory, larger ones are extracted to a temporary directory
+IN_MEMORY_MAX_BYTES = int(os.getenv('VALIDATION_IN_MEMORY_MAX_BYTES', 64 * 1000 * 1000))
+# rules that need the same input run on this many threads, rules fetching remote data gain the most from it
+VALIDATION_RULE_THREADS = int(os.getenv('VALIDATION_RULE_THREADS', 1))
+
+# bump whenever a change to validate_curation can change its result for the same archive
+RULESET_VERSION = 7
+
+
+class ArchiveEntry(NamedTuple):
+    name: str
+    is_dir: bool
+
+
+class ClassifiedFilenames(NamedTuple):
+    uuid_folder: list[str]
+    content_folder: list[str]
+    meta: list[str]
+    logo: list[str]
+    logo_case: list[str]
+    ss: list[str]
+    ss_case: list[str]
+    system_files: set[str]
+
 
 class CurationType(Enum):
     FLASH_GAME = auto()
@@ -25,427 +63,605 @@ class CurationType(Enum):
     ANIMATION = auto()
 
 
-def validate_curation(filename: str) -> tuple[list,
-                                              list,
-                                              Optional[bool],
-                                              Optional[CurationType],
-                                              Optional[dict],
-                                              Optional[list[dict]]]:
+# called with the name of the stage validation has reached and how many of its steps are done out of how many
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def no_progress(stage: str, done: int, total: int):
+    pass
+
+
+def validate_curation(filename: str, progress: ProgressCallback = no_progress) -> tuple[list,
+                                                                                    list,
+                                                                                    Optional[bool],
+                                                                                    Optional[CurationType],
+                                                                                    Optional[dict],
+                                                                                    Optional[list[dict]]]:
+    archive_type = get_archive_type(filename)
+    start = time.perf_counter()
+    try:
+        result = check_curation(filename, progress)
+    except Exception:
+        record(VALIDATIONS, outcome="exception", archive_type=archive_type)
+        raise
+    errors, warnings, *_ = result
+    outcome = "rejected" if errors else "warnings" if warnings else "passed"
+    record(VALIDATIONS, outcome=outcome, archive_type=archive_type)
+    record(VALIDATION_SECONDS, time.perf_counter() - start, archive_type=archive_type)
+    return result
+
+
+class Curation:
+    """What the validation rules of a curation read, filled in input by input by the rule pipeline."""
+
+    def __init__(self, filename: str, archive_type: str, archive_size: int, members: list[ArchiveMember],
+                 progress: ProgressCallback):
+        self.filename = filename
+        self.archive_type = archive_type
+        self.archive_size = archive_size
+        # small archives are read in-process, running the 7-Zip executable would cost more than it saves
+        self.in_memory = archive_size <= IN_MEMORY_MAX_BYTES
+        self.members = members
+        self.entries = [ArchiveEntry(member.name, member.is_dir) for member in members]
+        self.classified = classify_filenames([entry.name for entry in self.entries], get_bad_system_files_file())
+        self.budget = ExtractionBudget(archive_size)
+        self.progress = progress
+        self.contents: dict[str, bytes] = {}
+        # None without a meta file
+        self.props: Optional[dict] = None
+        self.images: list[dict] = []
+
+
+def check_curation(filename: str, progress: ProgressCallback) -> tuple[list,
+                                                                      list,
+                                                                      Optional[bool],
+                                                                      Optional[CurationType],
+                                                                      Optional[dict],
+                                                                      Optional[list[dict]]]:
+    timer = StageTimer()
     errors: list = []
     warnings: list = []
 
-    # process archive
-    filenames: list = []
-
     max_uncompressed_size = 50 * 1000 * 1000 * 1000
 
-    base_path = None
-
-    if filename.endswith(".7z"):
+    progress("listing", 0, 1)
+    archive_type = get_archive_type(filename)
+    if archive_type in ("7z", "zip"):
         try:
-            l.debug(f"reading archive '{filename}'...")
-            archive = py7zr.SevenZipFile(filename, mode='r')
+            l.debug("reading archive '%s'...", filename)
+            archive_size = os.path.getsize(filename)
+            members = get_backend(archive_type, file_object=archive_size <= IN_MEMORY_MAX_BYTES) \
+                .list_members(filename)
 
-            uncompressed_size = archive.archiveinfo().uncompressed
+            uncompressed_size = sum(member.size for member in members)
             if uncompressed_size > max_uncompressed_size:
                 warnings.append(
                     f"The archive is too large to be validated (`{uncompressed_size // 1000000}MB/{max_uncompressed_size // 1000000}MB`).")
-                archive.close()
                 return errors, warnings, None, None, None, None
-
-            filenames = archive.getnames()
-            base_path = tempfile.mkdtemp(prefix="curation_validator_") + "/"
-            archive.extractall(path=base_path)
-            archive.close()
         except Exception as e:
-            l.error(f"there was an error while reading file '{filename}': {e}")
-            errors.append("There seems to a problem with your 7z file.")
-            return errors, warnings, None, None, None, None
-    elif filename.endswith(".zip"):
-        try:
-            l.debug(f"reading archive '{filename}'...")
-            archive = zipfile.ZipFile(filename, mode='r')
-
-            uncompressed_size = sum([zinfo.file_size for zinfo in archive.filelist])
-            if uncompressed_size > max_uncompressed_size:
-                warnings.append(
-                    f"The archive is too large to be validated (`{uncompressed_size // 1000000}MB/{max_uncompressed_size // 1000000}MB`).")
-                archive.close()
-                return errors, warnings, None, None, None, None
-
-            filenames = archive.namelist()
-            base_path = tempfile.mkdtemp(prefix="curation_validator_") + "/"
-            archive.extractall(path=base_path)
-            archive.close()
-        except Exception as e:
-            l.error(f"there was an error while reading file '{filename}': {e}")
-            errors.append("There seems to a problem with your zip file.")
+            l.error("there was an error while reading file '%s': %s", filename, e)
+            errors.append(f"There seems to a problem with your {archive_type} file.")
             return errors, warnings, None, None, None, None
     elif filename.endswith(".rar"):
         errors.append("Curations must be either .zip or .7z, not .rar.")
         return errors, warnings, None, None, None, None
     else:
-        l.warn(f"file type of file '{filename}' not supported")
+        l.warn("file type of file '%s' not supported", filename)
         errors.append(f"file type of file '{filename}' not supported")
         return errors, warnings, None, None, None, None
 
-    # check files
-    l.debug(f"validating archive data for '{filename}'...")
-    uuid_folder_regex = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}/?$")
-    uuid_folder = [match for match in filenames if uuid_folder_regex.match(match) is not None]
-
-    logo = []
-    ss = []
-
-    if len(uuid_folder) == 0:  # legacy or broken curation
-        content_folder_regex = re.compile(r"^[^/]+/content/?$")
-        meta_regex = re.compile(r"^[^/]+/meta\.(yaml|yml|txt)$")
-        logo_regex = re.compile(r"^[^/]+/logo\.(png)$")
-        logo_regex_case = re.compile(r"(?i)^[^/]+/logo\.(png)$")
-        ss_regex = re.compile(r"^[^/]+/ss\.(png)$")
-        ss_regex_case = re.compile(r"(?i)^[^/]+/ss\.(png)$")
-        content_folder = [match for match in filenames if content_folder_regex.match(match) is not None]
-        meta = [match for match in filenames if meta_regex.match(match) is not None]
-        logo = [match for match in filenames if logo_regex.match(match) is not None]
-        logo_case = [match for match in filenames if logo_regex_case.match(match) is not None]
-        ss = [match for match in filenames if ss_regex.match(match) is not None]
-        ss_case = [match for match in filenames if ss_regex_case.match(match) is not None]
-    else:  # core curation
-        content_folder_regex = re.compile(
-            r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}/content/?$")
-        meta_regex = re.compile(
-            r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}/meta\.(yaml|yml|txt)$")
-        logo_regex = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}/logo\.png$")
-        logo_regex_case = re.compile(
-            r"(?i)^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}/logo\.(png)$")
-        ss_regex = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}/ss\.png$")
-        ss_regex_case = re.compile(
-            r"(?i)^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}/ss\.(png)$")
-
-        content_folder = [match for match in filenames if content_folder_regex.match(match) is not None]
-        meta = [match for match in filenames if meta_regex.match(match) is not None]
-        logo = [match for match in filenames if logo_regex.match(match) is not None]
-        logo_case = [match for match in filenames if logo_regex_case.match(match) is not None]
-        ss = [match for match in filenames if ss_regex.match(match) is not None]
-        ss_case = [match for match in filenames if ss_regex_case.match(match) is not None]
-
-    if len(logo) == 0 and len(ss) == 0 and len(content_folder) == 0 and len(meta) == 0:
-        errors.append("Logo, screenshot, content folder and meta not found. Is your curation structured properly?")
-        archive_cleanup(filename, base_path)
+    timer.lap("listing")
+    record(ARCHIVE_SIZE_BYTES, uncompressed_size, archive_type=archive_type)
+    record(ARCHIVE_MEMBERS, len(members), archive_type=archive_type)
+
+    l.debug("validating archive data for '%s'...", filename)
+    curation = Curation(filename, archive_type, archive_size, members, progress)
+    timer.lap("classify")
+
+    rule_errors, warnings, fatal = get_rule_pipeline().run(curation)
+    errors += rule_errors
+    if fatal:
         return errors, warnings, None, None, None, None
+    if curation.props is None:
+        return errors, warnings, False, None, {}, curation.images
+    is_extreme, _ = get_extreme(curation.props)
+    return errors, warnings, is_extreme, get_curation_type(curation.props), curation.props, curation.images
 
-    if set(logo) != set(logo_case):
-        errors.append("Logo file extension must be lowercase.")
-    else:
-        if len(logo) == 0:
-            errors.append("Logo file is either missing or its filename is incorrect.")
 
-    if set(ss) != set(ss_case):
-        errors.append("Screenshot file extension must be lowercase.")
-    else:
-        if len(ss) == 0:
-            errors.append("Screenshot file is either missing or its filename is incorrect.")
+RULES: list[Rule] = []
 
-    # check content
-    if len(content_folder) == 0:
-        errors.append("Content folder not found.")
-    else:
-        content_folder_path = base_path + content_folder[0]
-        filecount_in_content = sum([len(files) for r, d, files in os.walk(content_folder_path)])
-        if filecount_in_content == 0:
-            errors.append("No files found in content folder.")
-        # localflash checking
-        if 'localflash' in os.listdir(content_folder_path):
-            files_in_localflash = os.listdir(content_folder_path + '/localflash')
-            if len(files_in_localflash) > 1:
-                errors.append("Content must be in additional folder in localflash rather than in localflash directly.")
-            else:
-                with open("data/common_localflash_names.json") as f:
-                    bad_localflash_names = json.load(f)["names"]
-                    for file in files_in_localflash:
-                        filepath = content_folder_path + '/localflash/' + file
-                        if os.path.isfile(filepath):
-                            errors.append(
-                                "Content must be in additional folder in localflash rather than in localflash directly.")
-                            break
-                        elif file in bad_localflash_names:
-                            errors.append("Extremely common localflash containing folder name, please change.")
-
-    with open("data/bad_system_files.json") as f:
-        bad_system_files = json.load(f)["names"]
-        for name in bad_system_files:
-            if any(name in s for s in filenames):
-                errors.append(f"{name} file found in curation, please remove.")
-
-    # process meta
-    is_extreme = False
-    curation_type = None
-    props: dict = {}
-    if len(meta) == 0:
-        errors.append(
-            "Meta file is either missing or its filename is incorrect. Are you using Flashpoint Core for curating?")
-    else:
-        meta_filename = meta[0]
-        with open(base_path + meta_filename, mode='r', encoding='utf8') as meta_file:
-            if meta_filename.endswith(".yml") or meta_filename.endswith(".yaml"):
-                try:
-                    yaml = YAML(typ="safe")
-                    props: dict = yaml.load(meta_file)
-                    if props is None:
-                        errors.append("The meta file seems to be empty.")
-                        archive_cleanup(filename, base_path)
-                        return errors, warnings, None, None, None, None
-                except YAMLError:
-                    errors.append("Unable to load meta YAML file")
-                    archive_cleanup(filename, base_path)
-                    return errors, warnings, None, None, None, None
-                except ValueError:
-                    errors.append("Invalid release date. Ensure entered date is valid.")
-                    archive_cleanup(filename, base_path)
-                    return errors, warnings, None, None, None, None
-            elif meta_filename.endswith(".txt"):
-                break_index: int = 0
-                while break_index != -1:
-                    props, break_index = parse_lines_until_multiline(meta_file.readlines(), props,
-                                                                     break_index)
-                    props, break_index = parse_multiline(meta_file.readlines(), props, break_index)
-                    if props.get("Genre") is not None:
-                        props["Tags"] = props["Genre"]
-            else:
-                errors.append(
-                    "Meta file is either missing or its filename is incorrect. Are you using Flashpoint Core for curating?")
-                archive_cleanup(filename, base_path)
-                return errors, warnings, None, None, None, None
 
-        title: tuple[str, bool] = ("Title", bool(props.get("Title")))
-        # developer: tuple[str, bool] = ("Developer", bool(props["Developer"]))
-        release_date: tuple[str, bool] = ("Release Date", bool(props.get("Release Date")))
-        if release_date[1]:
-            date_string = str(props.get("Release Date")).strip()
-            if len(date_string) > 0:
-                date_regex = re.compile(r"^\d{4}(-\d{2}){0,2}$")
-                if not date_regex.match(date_string):
-                    errors.append(
-                        f"Release date {date_string} is incorrect. Release dates should always be in `YYYY-MM-DD` format.")
-
-        language_properties: tuple[str, bool] = "Languages", bool(props.get("Languages"))
-        if language_properties[1]:
-            with open("data/language-codes.json") as f:
-                list_of_languages_and_codes: list[dict] = json.load(f)
-            with open("data/lang_replacements.json") as f:
-                replacements: dict = json.load(f)
-            language_str: str = props.get("Languages", "")
-            language_codes = language_str.split(";")
-            language_codes = [x.strip() for x in language_codes]
-            valid_language_codes = [language["alpha2"] for language in list_of_languages_and_codes]
-            for language_code in language_codes:
-                replacement_code = replacements.get(language_code)
-                if language_code not in valid_language_codes:
-                    if language_code == "":
-                        pass
-                    # if the language code is a valid alpha3 code and there's no valid alpha2 code for it, we allow that
-                    elif language_code in [language["alpha3-b"] for language in list_of_languages_and_codes if not language["alpha2"]]:
-                        pass
-                    elif language_code in [language["alpha3-b"] for language in list_of_languages_and_codes]:
-                        for x in list_of_languages_and_codes:
-                            if language_code in x["alpha3-b"]:
-                                errors.append(
-                                    f"Languages must be in ISO 639-1 format, so please use `{x['alpha2']}` instead of `{language_code}`")
-                    elif language_code in [language["English"] for language in list_of_languages_and_codes]:
-                        for x in list_of_languages_and_codes:
-                            if language_code in x["English"]:
-                                errors.append(
-                                    f"Languages must be in ISO 639-1 format, so please use `{x['alpha2']}` instead of `{language_code}`")
-                    elif ',' in language_code:
-                        errors.append("Languages should be separated with semicolons, not commas.")
-                    elif replacement_code is not None:
-                        language_name = ""
-                        for x in list_of_languages_and_codes:
-                            if replacement_code == x["alpha2"]:
-                                language_name = x["English"]
-                        errors.append(
-                            f"The correct ISO 639-1 language code for {language_name} is `{replacement_code}`, not `{language_code}`.")
-                    else:
-                        errors.append(f"Code `{language_code}` is not a valid ISO 639-1 language code.")
-
-        # tag: tuple[str, bool] = ("Tags", bool(props["Tags"]))
-        source: tuple[str, bool] = ("Source", bool(props.get("Source")))
-        status: tuple[str, bool] = ("Status", bool(props.get("Status")))
-        launch_command: tuple[str, bool] = ("Launch Command", bool(props.get("Launch Command")))
-        application_path: tuple[str, bool] = ("Application Path", bool(props.get("Application Path")))
-
-        # TODO check description?
-        # description: tuple[str, bool] = ("Description", bool(props["Original Description"]))
-        # if description[1] is False and (
-        #         bool(props["Curation Notes"]) or bool(props["Game Notes"])):
-        #     reply += "Make sure you didn't put your description in the notes section.\n"
-
-        simple_mandatory_props: list[tuple[str, bool]] = [title, language_properties, source, launch_command, status,
-                                                          application_path]
-        if not all([x[1] for x in simple_mandatory_props]):
-            for prop in simple_mandatory_props:
-                if prop[1] is False:
-                    errors.append(f"The `{prop[0]}` property in the meta file is mandatory.")
-
-        if launch_command[1] and "https" in props["Launch Command"]:
-            errors.append("Found `https` in launch command. All launch commands must use `http` instead of `https`.")
-
-        if launch_command[1] and props["Launch Command"] in get_launch_commands_bluebot():
-            errors.append(
-                "Identical launch command already present in the master database. Is your curation a duplicate?")
-
-        # TODO check optional props?
-        # optional_props: list[tuple[str, bool]] = [developer, release_date, tag, description]
-        # if not all(optional_props[1]): for x in optional_props: if x[1] is False: reply += x[0] +
-        # "is missing, but not necessary. Add it if you can find it, but it's okay if you can't.\n"
-
-        tags: list[str] = props.get("Tags", "").split(";") if props.get("Tags", "") is not None else ""
-        tags: list[str] = [x.strip() for x in tags]
-        tags: list[str] = [x for x in tags if len(x) > 0]
-
-        master_tag_list = get_tag_list()
-
-        if not tags:
-            errors.append("Missing tags. At least one tag must be specified.")
-        else:
-            for tag in tags:
-                if tag not in master_tag_list:
-                    warnings.append(f"Tag `{tag}` is not a known tag, please verify (did you write it correctly?).")
-
-        extreme: tuple[str, bool] = ("Extreme", bool(props.get("Extreme")))
-        extreme_tags = get_extreme_tag_list_file()
-        is_extreme = False
-        if extreme[1] and (props["Extreme"] == "Yes" or props["Extreme"] is True):
-            is_extreme = True
-        if tags:
-            has_extreme_tags = bool([tag for tag in tags if tag in extreme_tags])
-            has_legacy_extreme = "LEGACY-Extreme" in tags
-            if has_extreme_tags or has_legacy_extreme:
-                is_extreme = True
-            if is_extreme and not has_extreme_tags:
-                errors.append("Curation is extreme but lacks extreme tags.")
-
-        if props.get("Library") is not None and "theatre" in props.get("Library"):
-            curation_type = CurationType.ANIMATION
+def rule(needs: RuleInput, meta: bool = False):
+    """Adds the decorated function to the rules of validate_curation, `meta` rules only run if there's a meta file."""
+
+    def decorator(check: Callable[[Curation, RuleResult], None]):
+        def run(curation: Curation, result: RuleResult):
+            if not meta or curation.props is not None:
+                check(curation, result)
+
+        RULES.append(Rule(check.__name__.removeprefix("check_"), needs, run))
+        return check
+
+    return decorator
+
+
+@rule(RuleInput.LISTING)
+def check_member_count(curation: Curation, result: RuleResult):
+    try:
+        curation.budget.check_members(len(curation.members))
+    except ExtractionBudgetExceeded as e:
+        raise FatalError(str(e))
+
+
+@rule(RuleInput.LISTING)
+def check_structure(curation: Curation, result: RuleResult):
+    classified = curation.classified
+    if not classified.logo and not classified.ss and not classified.content_folder and not classified.meta:
+        raise FatalError("Logo, screenshot, content folder and meta not found. Is your curation structured properly?")
+
+
+@rule(RuleInput.LISTING)
+def check_images(curation: Curation, result: RuleResult):
+    classified = curation.classified
+    if set(classified.logo) != set(classified.logo_case):
+        result.errors.append("Logo file extension must be lowercase.")
+    elif len(classified.logo) == 0:
+        result.errors.append("Logo file is either missing or its filename is incorrect.")
+
+    if set(classified.ss) != set(classified.ss_case):
+        result.errors.append("Screenshot file extension must be lowercase.")
+    elif len(classified.ss) == 0:
+        result.errors.append("Screenshot file is either missing or its filename is incorrect.")
+
+
+@rule(RuleInput.LISTING)
+def check_content_folder(curation: Curation, result: RuleResult):
+    content_folder = curation.classified.content_folder
+    if len(content_folder) == 0:
+        result.errors.append("Content folder not found.")
+        return
+    content_folder_path = content_folder[0]
+    entries = curation.entries
+    filecount_in_content = sum(1 for entry in entries
+                               if not entry.is_dir and entry.name.startswith(content_folder_path.rstrip("/") + "/"))
+    if filecount_in_content == 0:
+        result.errors.append("No files found in content folder.")
+    # localflash checking
+    if 'localflash' in list_folder(entries, content_folder_path):
+        files_in_localflash = list_folder(entries, content_folder_path.rstrip("/") + '/localflash')
+        if len(files_in_localflash) > 1:
+            result.errors.append("Content must be in additional folder in localflash rather than in localflash directly.")
         else:
-            platform: Optional[str] = props.get("Platform")
-            if platform is None or "Flash" in platform:
-                curation_type = CurationType.FLASH_GAME
-            else:
-                curation_type = CurationType.OTHER_GAME
+            with open("data/common_localflash_names.json") as f:
+                bad_localflash_names = json.load(f)["names"]
+                for file, is_dir in files_in_localflash.items():
+                    if not is_dir:
+                        result.errors.append(
+                            "Content must be in additional folder in localflash rather than in localflash directly.")
+                        break
+                    elif file in bad_localflash_names:
+                        result.errors.append("Extremely common localflash containing folder name, please change.")
+
+
+@rule(RuleInput.LISTING)
+def check_system_files(curation: Curation, result: RuleResult):
+    for name in get_bad_system_files_file():
+        if name in curation.classified.system_files:
+            result.errors.append(f"{name} file found in curation, please remove.")
+
+
+def load_meta(curation: Curation):
+    """
+    Reads the meta file and parses it. The images are read in the same pass, reading a 7z archive twice would cost
+    more than reading them does.
+    """
+    classified = curation.classified
+    # only the meta file and the images are read, everything else is checked from the listing
+    try:
+        curation.contents = read_members(curation.filename, classified.meta[:1] + classified.logo + classified.ss,
+                                         curation.in_memory, curation.progress, curation.budget)
+    except ExtractionBudgetExceeded as e:
+        l.warning("aborted extracting file '%s': %s", curation.filename, e)
+        raise FatalError(str(e))
+    except Exception as e:
+        l.error("there was an error while extracting file '%s': %s", curation.filename, e)
+        raise FatalError(f"There seems to a problem with your {pathlib.Path(curation.filename).suffix[1:]} file.")
+
+    curation.progress("meta", 0, 1)
+    if classified.meta:
+        try:
+            curation.props = parse_meta(classified.meta[0], curation.contents[classified.meta[0]])
+        except MetaParseError as e:
+            raise FatalError(str(e))
+
+
+@rule(RuleInput.META)
+def check_meta_file(curation: Curation, result: RuleResult):
+    if curation.props is None:
+        result.errors.append(
+            "Meta file is either missing or its filename is incorrect. Are you using Flashpoint Core for curating?")
 
-    images = []
 
-    if len(logo) == 1:
-        logo = logo[0]
-        image_path = f"{base_path}{logo}"
-        images.append({"type": "logo", "data": encode_image(image_path)})
+@rule(RuleInput.META, meta=True)
+def check_release_date(curation: Curation, result: RuleResult):
+    props = curation.props
+    if props.get("Release Date"):
+        date_string = str(props.get("Release Date")).strip()
+        if len(date_string) > 0:
+            date_regex = re.compile(r"^\d{4}(-\d{2}){0,2}$")
+            if not date_regex.match(date_string):
+                result.errors.append(
+                    f"Release date {date_string} is incorrect. Release dates should always be in `YYYY-MM-DD` format.")
+
+
+@rule(RuleInput.META, meta=True)
+def check_languages(curation: Curation, result: RuleResult):
+    props = curation.props
+    if not props.get("Languages"):
+        return
+    language_registry = get_language_registry()
+    language_str: str = props.get("Languages", "")
+    language_codes = language_str.split(";")
+    language_codes = [x.strip() for x in language_codes]
+    for language_code in language_codes:
+        if language_code == "" or language_registry.is_alpha2(language_code):
+            continue
+        alpha3_b_language = language_registry.get_by_alpha3_b(language_code)
+        english_name_language = language_registry.get_by_english_name(language_code)
+        replacement_code = language_registry.get_replacement(language_code)
+        # if the language code is a valid alpha3 code and there's no valid alpha2 code for it, we allow that
+        if alpha3_b_language is not None and not alpha3_b_language["alpha2"]:
+            pass
+        elif alpha3_b_language is not None:
+            result.errors.append(
+                f"Languages must be in ISO 639-1 format, so please use `{alpha3_b_language['alpha2']}` instead of `{language_code}`")
+        elif english_name_language is not None:
+            result.errors.append(
+                f"Languages must be in ISO 639-1 format, so please use `{english_name_language['alpha2']}` instead of `{language_code}`")
+        elif ',' in language_code:
+            result.errors.append("Languages should be separated with semicolons, not commas.")
+        elif replacement_code is not None:
+            replacement_language = language_registry.get_by_alpha2(replacement_code)
+            language_name = replacement_language["English"] if replacement_language is not None else ""
+            result.errors.append(
+                f"The correct ISO 639-1 language code for {language_name} is `{replacement_code}`, not `{language_code}`.")
+        else:
+            result.errors.append(f"Code `{language_code}` is not a valid ISO 639-1 language code.")
 
-    for screenshot in ss:
-        image_path = f"{base_path}{screenshot}"
-        images.append({"type": f"screenshot", "data": encode_image(image_path)})
 
-    archive_cleanup(filename, base_path)
-    return errors, warnings, is_extreme, curation_type, props, images
+@rule(RuleInput.META, meta=True)
+def check_mandatory_properties(curation: Curation, result: RuleResult):
+    props = curation.props
+    # TODO check description?
+    # description: tuple[str, bool] = ("Description", bool(props["Original Description"]))
+    # if description[1] is False and (
+    #         bool(props["Curation Notes"]) or bool(props["Game Notes"])):
+    #     reply += "Make sure you didn't put your description in the notes section.\n"
+
+    # TODO check optional props?
+    # optional_props: list[tuple[str, bool]] = [developer, release_date, tag, description]
+    # if not all(optional_props[1]): for x in optional_props: if x[1] is False: reply += x[0] +
+    # "is missing, but not necessary. Add it if you can find it, but it's okay if you can't.\n"
+    for prop in ["Title", "Languages", "Source", "Launch Command", "Status", "Application Path"]:
+        if not props.get(prop):
+            result.errors.append(f"The `{prop}` property in the meta file is mandatory.")
+
+
+@rule(RuleInput.META, meta=True)
+def check_launch_command_protocol(curation: Curation, result: RuleResult):
+    launch_command = curation.props.get("Launch Command")
+    if launch_command and "https" in launch_command:
+        result.errors.append("Found `https` in launch command. All launch commands must use `http` instead of `https`.")
+
+
+@rule(RuleInput.META, meta=True)
+def check_extreme_tags(curation: Curation, result: RuleResult):
+    is_extreme, has_extreme_tags = get_extreme(curation.props)
+    if get_tags(curation.props) and is_extreme and not has_extreme_tags:
+        result.errors.append("Curation is extreme but lacks extreme tags.")
+
+
+@rule(RuleInput.CONTENT)
+def check_duplicate_content(curation: Curation, result: RuleResult):
+    if curation.classified.content_folder:
+        result.warnings += find_duplicate_content(curation.filename, curation.archive_size, curation.members,
+                                                  curation.classified.content_folder[0],
+                                                  curation.classified.uuid_folder)
+
+
+def load_images(curation: Curation):
+    classified = curation.classified
+    if len(classified.logo) == 1:
+        curation.images.append({"type": "logo", "data": curation.contents[classified.logo[0]]})
+    for screenshot in classified.ss:
+        curation.images.append({"type": "screenshot", "data": curation.contents[screenshot]})
+
+
+@rule(RuleInput.REMOTE, meta=True)
+def check_launch_command_duplicate(curation: Curation, result: RuleResult):
+    launch_command = curation.props.get("Launch Command")
+    if launch_command and launch_command in get_launch_commands_bluebot():
+        result.errors.append(
+            "Identical launch command already present in the master database. Is your curation a duplicate?")
+
+
+@rule(RuleInput.REMOTE, meta=True)
+def check_tags(curation: Curation, result: RuleResult):
+    tags = get_tags(curation.props)
+    if not tags:
+        result.errors.append("Missing tags. At least one tag must be specified.")
+        return
+    master_tag_list = get_tag_list()
+    for tag in tags:
+        if tag not in master_tag_list:
+            result.warnings.append(f"Tag `{tag}` is not a known tag, please verify (did you write it correctly?).")
+
+
+_rule_pipeline: Optional[RulePipeline[Curation]] = None
+
+
+def get_rule_pipeline() -> RulePipeline[Curation]:
+    global _rule_pipeline
+    if _rule_pipeline is None:
+        _rule_pipeline = RulePipeline(RULES, {RuleInput.META: load_meta, RuleInput.CONTENT: load_images},
+                                      VALIDATION_RULE_THREADS)
+    return _rule_pipeline
+
+
+def get_tags(props: dict) -> list[str]:
+    tags: list[str] = props.get("Tags", "").split(";") if props.get("Tags", "") is not None else ""
+    tags: list[str] = [x.strip() for x in tags]
+    return [x for x in tags if len(x) > 0]
+
+
+def get_extreme(props: dict) -> tuple[bool, bool]:
+    """Returns whether the curation is extreme and whether it has extreme tags."""
+    extreme_tags = get_extreme_tag_list_file()
+    is_extreme = bool(props.get("Extreme")) and (props["Extreme"] == "Yes" or props["Extreme"] is True)
+    tags = get_tags(props)
+    has_extreme_tags = bool([tag for tag in tags if tag in extreme_tags])
+    if has_extreme_tags or "LEGACY-Extreme" in tags:
+        is_extreme = True
+    return is_extreme, has_extreme_tags
+
+
+def get_curation_type(props: dict) -> CurationType:
+    if props.get("Library") is not None and "theatre" in props.get("Library"):
+        return CurationType.ANIMATION
+    platform: Optional[str] = props.get("Platform")
+    if platform is None or "Flash" in platform:
+        return CurationType.FLASH_GAME
+    return CurationType.OTHER_GAME
+
+
+def classify_filenames(filenames: list[str], bad_system_files: list[str]) -> ClassifiedFilenames:
+    """
+    Sorts the archive paths into the curation folder, content folder, meta, logo, screenshot and bad system files
+    in a single pass. Curations with a UUID folder only count files directly in a UUID folder, legacy curations
+    count files directly in any root folder.
+    """
+    # one scan of each path finds the names anywhere in it, so copies and resource forks like ._.DS_Store or
+    # desktop.ini.bak are found as well, longer names first so that a name containing another one wins
+    bad_system_file_regex = re.compile("|".join(re.escape(bad_name)
+                                                for bad_name in sorted(bad_system_files, key=len, reverse=True)))
+    uuid_folder: list[str] = []
+    system_files: set[str] = set()
+    # (path, is in a lowercase UUID folder) for files directly in a root folder
+    content_folder: list[tuple[str, bool]] = []
+    meta: list[tuple[str, bool]] = []
+    logo: list[tuple[str, bool]] = []
+    logo_case: list[tuple[str, bool]] = []
+    ss: list[tuple[str, bool]] = []
+    ss_case: list[tuple[str, bool]] = []
+
+    for name in filenames:
+        if bad_system_files:
+            system_files.update(bad_system_file_regex.findall(name))
+
+        root, separator, rest = name.partition("/")
+        if not rest:
+            if UUID_REGEX.match(root):
+                uuid_folder.append(name)
+            continue
+        if not root:
+            continue
+        is_folder = rest.endswith("/")
+        child = rest[:-1] if is_folder else rest
+        if "/" in child:
+            continue
+        in_uuid_folder = UUID_REGEX.match(root) is not None
+        if child == "content":
+            content_folder.append((name, in_uuid_folder))
+        elif is_folder:
+            continue
+        elif child in META_FILENAMES:
+            meta.append((name, in_uuid_folder))
+        elif child.lower() == "logo.png":
+            if child == "logo.png":
+                logo.append((name, in_uuid_folder))
+            logo_case.append((name, in_uuid_folder or UUID_REGEX_CASE.match(root) is not None))
+        elif child.lower() == "ss.png":
+            if child == "ss.png":
+                ss.append((name, in_uuid_folder))
+            ss_case.append((name, in_uuid_folder or UUID_REGEX_CASE.match(root) is not None))
+
+    def select(candidates: list[tuple[str, bool]]) -> list[str]:
+        return [path for path, in_uuid_folder in candidates if in_uuid_folder or not uuid_folder]
+
+    return ClassifiedFilenames(uuid_folder, select(content_folder), select(meta), select(logo), select(logo_case),
+                               select(ss), select(ss_case), system_files)
+
+
+def list_folder(entries: list[ArchiveEntry], folder: str) -> dict[str, bool]:
+    """Returns the direct children of a folder in the archive listing, mapped to whether they are folders."""
+    prefix = folder.rstrip("/") + "/"
+    children: dict[str, bool] = {}
+    for entry in entries:
+        if not entry.name.startswith(prefix):
+            continue
+        rest = entry.name[len(prefix):].strip("/")
+        if not rest:
+            continue
+        child, separator, _ = rest.partition("/")
+        children[child] = children.get(child, False) or bool(separator) or entry.is_dir
+    return children
+
+
+def content_fingerprints(filename: str, archive_size: int, members: list[ArchiveMember], content_folder: str,
+                         uuid_folder: list[str]) -> tuple[str, dict[int, Optional[bytes]]]:
+    """
+    Returns the key of the curation in the content index and the fingerprints of its content files, from the size
+    and CRC32 in the archive headers, mapped to their strong hash if CONTENT_INDEX_STRONG_HASH is set.
+    """
+    prefix = content_folder.rstrip("/") + "/"
+    # empty files would match each other without being duplicated content
+    files = {member.name: fingerprint(member.size, member.crc32) for member in members
+             if not member.is_dir and member.name.startswith(prefix) and member.size > 0 and member.crc32 is not None}
+    strong_hashes: dict[str, bytes] = {}
+    if CONTENT_INDEX_STRONG_HASH and files:
+        try:
+            strong_hashes = get_backend(get_archive_type(filename), file_object=True) \
+                .hash_members(filename, list(files), ExtractionBudget(archive_size))
+        except ExtractionBudgetExceeded as e:
+            l.warning("not hashing the content of '%s': %s", filename, e)
+    fingerprints = {value: strong_hashes.get(name) for name, value in files.items()}
+    key = uuid_folder[0].strip("/") if uuid_folder else content_key(fingerprints)
+    return key, fingerprints
+
+
+def find_duplicate_content(filename: str, archive_size: int, members: list[ArchiveMember], content_folder: str,
+                           uuid_folder: list[str]) -> list[str]:
+    """
+    Looks the content files up in the content index and returns a warning for every other curation that has most
+    of the same files. Validating doesn't add anything to the index, accepted curations are added by the caller
+    with `index_curation_content`.
+    """
+    content_index = get_content_index()
+    if content_index is None:
+        return []
+    key, fingerprints = content_fingerprints(filename, archive_size, members, content_folder, uuid_folder)
+    try:
+        matches = content_index.find_matches(key, fingerprints, CONTENT_INDEX_MIN_MATCH)
+    except sqlite3.Error as e:
+        l.error("could not use the content index for '%s': %s", filename, e)
+        return []
+    return [f"{match.ratio:.0%} of the content matches the curation `{match.title or match.key}`. "
+            f"Is your curation a duplicate?" for match in matches]
+
+
+def index_curation_content(filename: str, title: Optional[str]):
+    """
+    Adds the content files of an accepted curation to the content index, so that later curations with the same
+    content are reported as duplicates of it. Indexing the same content under the same key again does nothing.
+    """
+    content_index = get_content_index()
+    if content_index is None:
+        return
+    archive_size = os.path.getsize(filename)
+    members = get_backend(get_archive_type(filename), file_object=archive_size <= IN_MEMORY_MAX_BYTES) \
+        .list_members(filename)
+    classified = classify_filenames([member.name for member in members], get_bad_system_files_file())
+    if not classified.content_folder:
+        return
+    key, fingerprints = content_fingerprints(filename, archive_size, members, classified.content_folder[0],
+                                             classified.uuid_folder)
+    try:
+        content_index.add(key, title, fingerprints)
+    except sqlite3.Error as e:
+        l.error("could not add '%s' to the content index: %s", filename, e)
+
+
+def read_members(filename: str, members: list[str], in_memory: bool, progress: ProgressCallback,
+                 budget: ExtractionBudget) -> dict[str, bytes]:
+    """
+    Reads the given archive members into memory by name. With `in_memory`, they are read straight from a memory map
+    of the archive, otherwise they are extracted into a temporary directory first so that any backend can be used.
+    """
+    if not in_memory:
+        base_path = extract_members(filename, members, progress, budget)
+        try:
+            return {member: read_file(base_path + member) for member in members}
+        finally:
+            archive_cleanup(filename, base_path)
+    progress("extracting", 0, len(members))
+    if not members:
+        return {}
+    backend = get_backend(get_archive_type(filename), file_object=True)
+    l.debug("reading %s members of archive '%s' with %s...", len(members), filename, backend.name)
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return backend.read_members(DeadlineReader(data, budget), members, budget,
+                                    lambda done, total: progress("extracting", done, total))
+
+
+def extract_members(filename: str, members: list[str], progress: ProgressCallback = no_progress,
+                    budget: Optional[ExtractionBudget] = None) -> str:
+    """
+    Extracts only the given archive members into a new temporary directory and returns its path.
+    Raises ExtractionBudgetExceeded and removes the directory as soon as extracting goes over the budget.
+    """
+    if budget is None:
+        budget = ExtractionBudget(os.path.getsize(filename))
+    base_path = tempfile.mkdtemp(prefix="curation_validator_") + "/"
+    progress("extracting", 0, len(members))
+    if not members:
+        return base_path
+    backend = get_backend(get_archive_type(filename))
+    l.debug("extracting %s members of archive '%s' into '%s' with %s...", len(members), filename, base_path,
+            backend.name)
+    try:
+        backend.extract(filename, members, base_path, budget,
+                        lambda done, total: progress("extracting", done, total))
+    except Exception:
+        archive_cleanup(filename, base_path)
+        raise
+    return base_path
 
 
-def encode_image(image_path):
-    l.debug(f"encoding file '{image_path}' into base64")
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read())
+def read_file(path: str) -> bytes:
+    l.debug("reading extracted file '%s'", path)
+    with open(path, "rb") as f:
+        return f.read()
 
 
 def archive_cleanup(filename, base_path):
-    l.debug(f"cleaning up extracted files in {base_path} after the archive '{filename}'...")
+    l.debug("cleaning up extracted files in %s after the archive '%s'...", base_path, filename)
     shutil.rmtree(base_path, True)
 
 
-@cached(cache=TTLCache(maxsize=1, ttl=600))
-def get_launch_commands_bluebot() -> list[str]:
-    l.debug(f"getting launch commands from bluebot...")
-    resp = requests.get(url="https://bluebot.unstable.life/launch-commands")
-    return resp.json()["launch_commands"]
-
+def get_launch_commands_bluebot() -> LaunchCommandIndex:
+    return get_reference_data().launch_commands
 
-@cached(cache=TTLCache(maxsize=1, ttl=600))
-def get_tag_list_bluebot() -> list[str]:
-    l.debug(f"getting tags from bluebot...")
-    resp = requests.get(url="https://bluebot.unstable.life/tags")
-    return resp.json()["tags"]
 
+def get_tag_list() -> frozenset[str]:
+    return get_reference_data().tags
 
-@cached(cache=TTLCache(maxsize=1, ttl=3600))
-def get_tag_list_file() -> list[str]:
-    l.debug(f"getting tags from file...")
-    with open("data/category_tags.json", "r", encoding="utf-8") as f:
-        data = json.load(f)
-        return data["tags"]
 
-
-@cached(cache=TTLCache(maxsize=1, ttl=3600))
+@cached("extreme_tags", TTLCache(maxsize=1, ttl=3600))
 def get_extreme_tag_list_file() -> list[str]:
-    l.debug(f"getting tags from file...")
+    l.debug("getting tags from file...")
     with open("data/extreme_tags.json", "r", encoding="utf-8") as f:
         data = json.load(f)
         return data["tags"]
 
 
-@cached(cache=TTLCache(maxsize=1, ttl=60))
-def get_tag_list_wiki() -> list[str]:
-    l.debug(f"getting tags from wiki...")
-    tags = []
-    resp = requests.get(url="https://bluemaxima.org/flashpoint/datahub/Tags")
-    soup = BeautifulSoup(resp.text, "html.parser")
-    tables = soup.find_all("table")
-    for table in tables:
-        rows = table.find_all("tr")
-        for row in rows:
-            cols = row.find_all('td')
-            if len(cols) > 0:
-                col = cols[0]
-                links = row.find_all('a')
-                if len(links) > 0:
-                    tags.append(links[0].contents[0].strip())
-                else:
-                    tags.append(col.contents[0].strip())
-    return tags
-
-
-def get_tag_list() -> list[str]:
-    bluebot_tags = get_tag_list_bluebot()
-    file_tags = get_tag_list_file()
-    wiki_tags = get_tag_list_wiki()
-    return list(set(file_tags + wiki_tags + bluebot_tags))
-
-
-def parse_lines_until_multiline(lines: list[str], d: dict, starting_number: int):
-    break_number: int = -1
-    for idx, line in enumerate(lines[starting_number:]):
-        if '|' not in line and line.strip():
-            split: list[str] = line.split(":")
-            split: list[str] = [x.strip(' ') for x in split]
-            d.update({split[0]: split[1]})
-        else:
-            break_number = idx
-            break
-    return d, break_number
-
-
-def parse_multiline(lines: list[str], d: dict, starting_number: int):
-    break_number = -1
-    key: str = ""
-    val: str = ""
-    for idx, line in enumerate(lines[starting_number:]):
-        if idx is starting_number:
-            split = line.split(':')
-            split = [x.strip(' ') for x in split]
-            key = split[0]
-        else:
-            if line.startswith('\t'):
-                line = line.strip(" \t")
-                val += line
-            else:
-                break_number = idx
-                break
-    d.update({key: val})
-    return d, break_number
+@cached("bad_system_files", TTLCache(maxsize=1, ttl=3600))
+def get_bad_system_files_file() -> list[str]:
+    l.debug("getting bad system file names from file...")
+    with open("data/bad_system_files.json", "r", encoding="utf-8") as f:
+        return json.load(f)["names"]
+
+
+@cached("data_files_version", TTLCache(maxsize=1, ttl=600))
+def get_data_files_version() -> str:
+    l.debug("computing data files version...")
+    digest = hashlib.sha256()
+    for name in ["bad_system_files.json", "category_tags.json", "common_localflash_names.json", "extreme_tags.json",
+                 "lang_replacements.json", "language-codes.json"]:
+        with open(os.path.join("data", name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def get_reference_data_version() -> str:
+    """Returns a digest of all the data validate_curation checks against, both remote and local."""
+    return hashlib.sha256(f"{get_data_files_version()}:{get_reference_data().version}".encode()).hexdigest()
@@ -1,7 +1,11 @@
+import glob
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 
-from curation_validator import validate_curation, CurationType
+from curation_validator import validate_curation, CurationType, ArchiveEntry, list_folder, classify_filenames
+from extraction_budget import ExtractionBudget
 
 
 def mock_get_tag_list() -> list[str]:
@@ -284,6 +288,84 @@ class TestCurationValidator(unittest.TestCase):
             self.assertCountEqual(warnings, [])
 
 
+    def test_list_folder_from_listing(self):
+        entries = [ArchiveEntry("uuid/content/", True),
+                   ArchiveEntry("uuid/content/localflash/game/a.swf", False),
+                   ArchiveEntry("uuid/content/b.html", False)]
+        self.assertEqual(list_folder(entries, "uuid/content"), {"localflash": True, "b.html": False})
+        self.assertEqual(list_folder(entries, "uuid/content/localflash/"), {"game": True})
+
+    def test_classify_filenames(self):
+        uuid = "e647a839-c4d8-4c51-8f04-4cf142f1718c"
+        classified = classify_filenames([f"{uuid}/", f"{uuid}/content/", f"{uuid}/meta.yaml", f"{uuid}/LOGO.png",
+                                         f"{uuid}/ss.png", f"{uuid}/content/desktop.ini", "legacy/meta.txt"],
+                                        ["desktop.ini", "Thumbs.db"])
+        self.assertEqual(classified.uuid_folder, [f"{uuid}/"])
+        self.assertEqual(classified.content_folder, [f"{uuid}/content/"])
+        self.assertEqual(classified.meta, [f"{uuid}/meta.yaml"])
+        self.assertEqual(classified.logo, [])
+        self.assertEqual(classified.logo_case, [f"{uuid}/LOGO.png"])
+        self.assertEqual(classified.ss, [f"{uuid}/ss.png"])
+        self.assertEqual(classified.system_files, {"desktop.ini"})
+
+    def test_classify_system_file_variants(self):
+        bad_system_files = ["desktop.ini", "Thumbs.db", ".DS_Store"]
+        for name, expected in [("__MACOSX/x/._.DS_Store", ".DS_Store"),
+                               ("uuid/content/._Thumbs.db", "Thumbs.db"),
+                               ("uuid/content/desktop.ini.bak", "desktop.ini")]:
+            self.assertEqual(classify_filenames([name], bad_system_files).system_files, {expected})
+        self.assertEqual(classify_filenames(["uuid/content/desktop.txt"], bad_system_files).system_files, set())
+
+    def test_small_archive_in_memory(self):
+        for extension in ["7z", "zip"]:
+            filename = f"test_curations/test_curation_valid.{extension}"
+            with patch("tempfile.mkdtemp", side_effect=AssertionError("extracted to disk")):
+                in_memory = validate_curation(filename)
+            with patch("curation_validator.IN_MEMORY_MAX_BYTES", 0):
+                extracted = validate_curation(filename)
+            self.assertEqual(in_memory, extracted)
+
+    def validate_with_budget(self, filename: str, **limits):
+        with patch("curation_validator.ExtractionBudget", lambda size: ExtractionBudget(size, **limits)):
+            return validate_curation(filename)
+
+    def test_extraction_bytes_limit(self):
+        extracted_before = set(glob.glob(os.path.join(tempfile.gettempdir(), "curation_validator_*")))
+        for extension in ["7z", "zip"]:
+            errors, warnings, _, _, _, _ = self.validate_with_budget(
+                f"test_curations/test_curation_valid.{extension}", max_bytes=100)
+            self.assertCountEqual(errors, ["Extracting the archive was aborted after it wrote more than 100 bytes."])
+        # nothing extracted is left behind
+        self.assertEqual(set(glob.glob(os.path.join(tempfile.gettempdir(), "curation_validator_*"))),
+                         extracted_before)
+
+    def test_extraction_ratio_limit(self):
+        for extension in ["7z", "zip"]:
+            errors, warnings, _, _, _, _ = self.validate_with_budget(
+                f"test_curations/test_curation_valid.{extension}", max_ratio=0.01, ratio_grace=0)
+            self.assertCountEqual(errors, ["Extracting the archive was aborted because it expands to more than "
+                                           "0.01 times its size."])
+
+    def test_extraction_member_limit(self):
+        for extension in ["7z", "zip"]:
+            errors, warnings, _, _, _, _ = self.validate_with_budget(
+                f"test_curations/test_curation_valid.{extension}", max_members=2)
+            self.assertEqual(len(errors), 1)
+            self.assertRegex(errors[0], r"^The archive has \d+ files, at most 2 are allowed\.$")
+
+    def test_extraction_limits_from_environment(self):
+        with patch.dict(os.environ, {"EXTRACTION_MAX_MEMBERS": "2"}):
+            errors, warnings, _, _, _, _ = validate_curation("test_curations/test_curation_valid.7z")
+        self.assertEqual(len(errors), 1)
+        self.assertRegex(errors[0], r"^The archive has \d+ files, at most 2 are allowed\.$")
+
+    def test_extraction_timeout(self):
+        for extension in ["7z", "zip"]:
+            errors, warnings, _, _, _, _ = self.validate_with_budget(
+                f"test_curations/test_curation_valid.{extension}", timeout=-1)
+            self.assertCountEqual(errors, ["Extracting the archive was aborted because it took longer than "
+                                           "-1 seconds."])
+
 
 if __name__ == '__main__':
     unittest.main()
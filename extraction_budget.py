@@ -0,0 +1,146 @@
+import io
+import os
+import time
+from typing import Optional
+
+from py7zr.io import Py7zIO, WriterFactory
+
+# the ratio is only checked past this many bytes, small files like a long meta compress well without being a problem
+RATIO_GRACE_BYTES = 10 * 1000 * 1000
+
+
+class ExtractionBudgetExceeded(Exception):
+    pass
+
+
+def format_size(size: int) -> str:
+    """Formats a number of bytes with the largest decimal unit it fills, e.g. 1.5MB or 100 bytes."""
+    for unit, factor in [("GB", 1000 ** 3), ("MB", 1000 ** 2), ("KB", 1000)]:
+        if size >= factor:
+            return f"{round(size / factor, 2):g}{unit}"
+    return f"{size} bytes"
+
+
+class ExtractionBudget:
+    """
+    Limits how much extracting an archive may write, relative to the archive size and in total,
+    how many members it may have and how long extracting it may take.
+    Every check raises ExtractionBudgetExceeded as soon as a limit is hit.
+    Limits that aren't given are read from the EXTRACTION_* environment variables every time a budget is made.
+    """
+
+    def __init__(self, archive_size: int, max_bytes: Optional[int] = None, max_ratio: Optional[float] = None,
+                 max_members: Optional[int] = None, timeout: Optional[float] = None,
+                 ratio_grace: int = RATIO_GRACE_BYTES):
+        self.archive_size = archive_size
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(os.getenv('EXTRACTION_MAX_BYTES', 1000 * 1000 * 1000))
+        self.max_ratio = max_ratio if max_ratio is not None else float(os.getenv('EXTRACTION_MAX_RATIO', 100))
+        self.max_members = max_members if max_members is not None else \
+            int(os.getenv('EXTRACTION_MAX_MEMBERS', 1000 * 1000))
+        self.timeout = timeout if timeout is not None else float(os.getenv('EXTRACTION_TIMEOUT', 300))
+        self.ratio_grace = ratio_grace
+        self.deadline = time.monotonic() + self.timeout
+        self.written = 0
+
+    def check_members(self, count: int):
+        if count > self.max_members:
+            raise ExtractionBudgetExceeded(
+                f"The archive has {count} files, at most {self.max_members} are allowed.")
+
+    def check_deadline(self):
+        if time.monotonic() > self.deadline:
+            raise ExtractionBudgetExceeded(
+                f"Extracting the archive was aborted because it took longer than {self.timeout:g} seconds.")
+
+    def add(self, size: int):
+        """Counts `size` more bytes about to be written, raises before they are if that goes over a limit."""
+        self.written += size
+        if self.written > self.max_bytes:
+            raise ExtractionBudgetExceeded(
+                f"Extracting the archive was aborted after it wrote more than {format_size(self.max_bytes)}.")
+        if self.written > max(self.archive_size * self.max_ratio, self.ratio_grace):
+            raise ExtractionBudgetExceeded(
+                f"Extracting the archive was aborted because it expands to more than {self.max_ratio:g} times "
+                f"its size.")
+        self.check_deadline()
+
+
+class DeadlineReader(io.RawIOBase):
+    """
+    Reads an archive from a file object, or a memory map, checking the deadline of the budget on every read,
+    so that decompressing members that are skipped, which writes nothing, can't run past it either.
+    """
+
+    def __init__(self, fp, budget: ExtractionBudget):
+        super().__init__()
+        self.fp = fp
+        self.budget = budget
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        self.budget.check_deadline()
+        return self.fp.read(size)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self.fp.seek(offset, whence)
+        return self.fp.tell()
+
+    def tell(self) -> int:
+        return self.fp.tell()
+
+
+class BudgetedFile(Py7zIO):
+    """A file py7zr extracts a member into, every write is counted against the budget before it is written."""
+
+    def __init__(self, path: str, budget: ExtractionBudget):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, "wb")
+        self.budget = budget
+
+    def write(self, s) -> int:
+        self.budget.add(len(s))
+        return self.file.write(s)
+
+    def read(self, size: Optional[int] = None) -> bytes:
+        return b""
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.file.seek(offset, whence)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def size(self) -> int:
+        return self.file.tell()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class BudgetedWriterFactory(WriterFactory):
+    """Makes py7zr extract members into files on disk through BudgetedFile."""
+
+    def __init__(self, budget: ExtractionBudget):
+        self.budget = budget
+        self.files: list[BudgetedFile] = []
+
+    def create(self, filename: str) -> Py7zIO:
+        product = BudgetedFile(filename, self.budget)
+        self.files.append(product)
+        return product
+
+    def close(self):
+        # py7zr doesn't close the file it was writing when extraction fails
+        for product in self.files:
+            product.close()
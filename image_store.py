@@ -0,0 +1,133 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from PIL import Image
+
+from logger import getLogger
+
+l = getLogger("api")
+
+IMAGE_HASH_REGEX = re.compile(r"^[0-9a-f]{64}$")
+THUMBNAIL_SIZES = [64, 128, 256, 512]
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class ImageStore:
+    """
+    Content-addressed store for curation logos and screenshots, keyed by the SHA-256 of the image.
+    Images and their thumbnails expire `ttl` seconds after they were last stored.
+    """
+
+    def __init__(self, path: str, ttl: float = 3600, eviction_interval: float = 60):
+        self.path = path
+        self.ttl = ttl
+        self.eviction_interval = eviction_interval
+        self._last_eviction = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _image_path(self, image_hash: str) -> str:
+        return os.path.join(self.path, f"{image_hash}.png")
+
+    def _thumbnail_path(self, image_hash: str, size: int) -> str:
+        return os.path.join(self.path, f"{image_hash}.thumbnail{size}.png")
+
+    def put(self, data: bytes) -> str:
+        """Stores the image and returns its hash."""
+        image_hash = hashlib.sha256(data).hexdigest()
+        path = self._image_path(image_hash)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        self.evict_expired()
+        return image_hash
+
+    def get_path(self, image_hash: str) -> Optional[str]:
+        """Returns the path of the stored image, None if there is no such image or it expired."""
+        if not IMAGE_HASH_REGEX.match(image_hash):
+            return None
+        path = self._image_path(image_hash)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                return None
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_thumbnail(self, image_hash: str, size: int) -> Optional[bytes]:
+        """
+        Returns the image scaled down to fit into a square of the smallest supported size that is at least `size`,
+        None if there is no such image. Thumbnails are generated on the first request and kept with the image.
+        Raises `InvalidImage` if the image can't be decoded.
+        """
+        path = self.get_path(image_hash)
+        if path is None:
+            return None
+        size = next((supported for supported in THUMBNAIL_SIZES if supported >= size), THUMBNAIL_SIZES[-1])
+        thumbnail_path = self._thumbnail_path(image_hash, size)
+        try:
+            with open(thumbnail_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        l.debug("generating %spx thumbnail of image %s", size, image_hash)
+        try:
+            with Image.open(path) as image:
+                image.thumbnail((size, size))
+                output = io.BytesIO()
+                image.save(output, format="PNG")
+        except (OSError, Image.DecompressionBombError) as e:
+            raise InvalidImage(f"could not generate a thumbnail of image {image_hash}: {e}") from e
+        data = output.getvalue()
+        temp_path = f"{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, thumbnail_path)
+        return data
+
+    def evict_expired(self, force: bool = False):
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_eviction < self.eviction_interval:
+                return
+            self._last_eviction = now
+        evicted = 0
+        for entry in os.scandir(self.path):
+            image_hash = entry.name.split(".", 1)[0]
+            try:
+                # thumbnails expire together with their image
+                image_mtime = os.stat(self._image_path(image_hash)).st_mtime
+            except FileNotFoundError:
+                image_mtime = entry.stat().st_mtime
+            if now - image_mtime > self.ttl:
+                try:
+                    os.remove(entry.path)
+                    evicted += 1
+                except FileNotFoundError:
+                    pass
+        if evicted:
+            l.debug("evicted %s expired files from the image store", evicted)
+
+
+_store: Optional[ImageStore] = None
+
+
+def get_image_store() -> ImageStore:
+    global _store
+    if _store is None:
+        _store = ImageStore(os.getenv('IMAGE_STORE_PATH', os.path.join(tempfile.gettempdir(), "curation_validator_images")),
+                            ttl=float(os.getenv('IMAGE_STORE_TTL', 3600)))
+    return _store
@@ -0,0 +1,55 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from PIL import Image
+
+from image_store import ImageStore, InvalidImage
+
+
+def png(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height)).save(output, format="PNG")
+    return output.getvalue()
+
+
+class TestImageStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = ImageStore(self.temp_dir.name, ttl=60)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_stores_by_content(self):
+        data = png(10, 10)
+        image_hash = self.store.put(data)
+        self.assertEqual(self.store.put(data), image_hash)
+        with open(self.store.get_path(image_hash), "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertIsNone(self.store.get_path("../" + image_hash))
+
+    def test_thumbnail_fits_size(self):
+        image_hash = self.store.put(png(1000, 500))
+        with Image.open(io.BytesIO(self.store.get_thumbnail(image_hash, 100))) as thumbnail:
+            self.assertEqual(thumbnail.size, (128, 64))
+
+    def test_thumbnail_of_invalid_image(self):
+        image_hash = self.store.put(b"not an image")
+        with self.assertRaises(InvalidImage):
+            self.store.get_thumbnail(image_hash, 100)
+
+    def test_expires(self):
+        image_hash = self.store.put(png(10, 10))
+        expired = time.time() - 120
+        os.utime(self.store.get_path(image_hash), (expired, expired))
+        self.assertIsNone(self.store.get_path(image_hash))
+        self.store.evict_expired(force=True)
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
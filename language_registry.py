@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+from typing import NamedTuple, Optional
+
+from logger import getLogger
+
+l = getLogger("main")
+
+
+class LanguageIndex(NamedTuple):
+    alpha2: dict[str, dict]
+    alpha3_b: dict[str, dict]
+    english: dict[str, dict]
+    replacements: dict[str, str]
+
+
+class LanguageRegistry:
+    """
+    ISO 639 language codes indexed by alpha2 code, alpha3-b code and English name, together with the map of common
+    wrong codes to their replacements. The files are parsed once and parsed again only when their mtime changes.
+    """
+
+    def __init__(self, codes_path: str = "data/language-codes.json",
+                 replacements_path: str = "data/lang_replacements.json"):
+        self.codes_path = codes_path
+        self.replacements_path = replacements_path
+        self._lock = threading.Lock()
+        self._mtimes: Optional[tuple[float, float]] = None
+        self._index: Optional[LanguageIndex] = None
+
+    def _current_index(self) -> LanguageIndex:
+        mtimes = (os.stat(self.codes_path).st_mtime, os.stat(self.replacements_path).st_mtime)
+        if mtimes != self._mtimes:
+            with self._lock:
+                if mtimes != self._mtimes:
+                    self._index = self._load()
+                    self._mtimes = mtimes
+        return self._index
+
+    def _load(self) -> LanguageIndex:
+        l.debug("loading language codes from '%s' and '%s'...", self.codes_path, self.replacements_path)
+        with open(self.codes_path, "r", encoding="utf-8") as f:
+            languages: list[dict] = json.load(f)
+        with open(self.replacements_path, "r", encoding="utf-8") as f:
+            replacements: dict[str, str] = json.load(f)
+        return LanguageIndex(alpha2={language["alpha2"]: language for language in languages if language["alpha2"]},
+                             alpha3_b={language["alpha3-b"]: language for language in languages},
+                             english={language["English"]: language for language in languages},
+                             replacements=replacements)
+
+    def is_alpha2(self, code: str) -> bool:
+        return code in self._current_index().alpha2
+
+    def get_by_alpha3_b(self, code: str) -> Optional[dict]:
+        return self._current_index().alpha3_b.get(code)
+
+    def get_by_english_name(self, name: str) -> Optional[dict]:
+        return self._current_index().english.get(name)
+
+    def get_by_alpha2(self, code: str) -> Optional[dict]:
+        return self._current_index().alpha2.get(code)
+
+    def get_replacement(self, code: str) -> Optional[str]:
+        return self._current_index().replacements.get(code)
+
+
+_registry: Optional[LanguageRegistry] = None
+
+
+def get_language_registry() -> LanguageRegistry:
+    global _registry
+    if _registry is None:
+        _registry = LanguageRegistry()
+    return _registry
@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+import unittest
+
+from language_registry import LanguageRegistry
+
+
+class TestLanguageRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.codes_path = os.path.join(self.temp_dir.name, "language-codes.json")
+        self.replacements_path = os.path.join(self.temp_dir.name, "lang_replacements.json")
+        self.write_codes([{"English": "Japanese", "alpha2": "ja", "alpha3-b": "jpn"}])
+        with open(self.replacements_path, "w") as f:
+            json.dump({"jp": "ja"}, f)
+        self.registry = LanguageRegistry(self.codes_path, self.replacements_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_codes(self, languages: list[dict]):
+        with open(self.codes_path, "w") as f:
+            json.dump(languages, f)
+
+    def test_lookups(self):
+        self.assertTrue(self.registry.is_alpha2("ja"))
+        self.assertFalse(self.registry.is_alpha2("jpn"))
+        self.assertEqual(self.registry.get_by_alpha3_b("jpn")["alpha2"], "ja")
+        self.assertEqual(self.registry.get_by_english_name("Japanese")["alpha2"], "ja")
+        self.assertEqual(self.registry.get_replacement("jp"), "ja")
+        self.assertIsNone(self.registry.get_replacement("ja"))
+
+    def test_reloads_when_file_changes(self):
+        self.assertFalse(self.registry.is_alpha2("en"))
+        self.write_codes([{"English": "English", "alpha2": "en", "alpha3-b": "eng"}])
+        stat = os.stat(self.codes_path)
+        os.utime(self.codes_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertTrue(self.registry.is_alpha2("en"))
+
+
+if __name__ == '__main__':
+    unittest.main()
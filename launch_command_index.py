@@ -0,0 +1,255 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from logger import getLogger
+
+l = getLogger("main")
+
+MAGIC = b"FPLCIDX1"
+# magic, slot count, exact count, normalized count, digest of the launch commands
+HEADER = struct.Struct("<8sQQQ32s")
+SLOT = struct.Struct("<Q")
+MIN_SLOT_COUNT = 1024
+MAX_LOAD_FACTOR = 0.7
+
+
+def normalize_launch_command(launch_command: str) -> str:
+    return launch_command.replace('"', "").replace("'", "").replace(" ", "").replace("`", "")
+
+
+def hash_launch_command(launch_command: str) -> int:
+    # 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(launch_command.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def digest_launch_commands(launch_commands: set[str]) -> bytes:
+    digest = hashlib.sha256()
+    for launch_command in sorted(launch_commands):
+        digest.update(launch_command.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.digest()
+
+
+class LaunchCommandIndex:
+    """
+    Read side of the on-disk launch command index. The file holds two open addressing hash tables of 64-bit
+    launch command hashes, one for the exact and one for the normalized launch commands, and is memory-mapped so
+    that every process shares the same pages. The index is reopened when the file is replaced by a rebuild.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mmap: Optional[mmap.mmap] = None
+        self._file_id: Optional[tuple[int, int]] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _current(self) -> mmap.mmap:
+        stat = os.stat(self.path)
+        file_id = (stat.st_ino, stat.st_dev)
+        if file_id != self._file_id:
+            with self._lock:
+                if file_id != self._file_id:
+                    l.debug("mapping launch command index '%s'...", self.path)
+                    with open(self.path, "rb") as f:
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    if mapped[:len(MAGIC)] != MAGIC:
+                        mapped.close()
+                        raise ValueError(f"'{self.path}' is not a launch command index")
+                    # the previous mapping may still be in use by another thread, it is closed once unreferenced
+                    self._mmap, self._file_id = mapped, file_id
+        return self._mmap
+
+    def _header(self, mapped: mmap.mmap) -> tuple[int, int, int, bytes]:
+        _, slot_count, exact_count, normalized_count, digest = HEADER.unpack_from(mapped, 0)
+        return slot_count, exact_count, normalized_count, digest
+
+    def _lookup(self, table: int, launch_command: str) -> bool:
+        mapped = self._current()
+        slot_count = self._header(mapped)[0]
+        offset = HEADER.size + table * slot_count * SLOT.size
+        mask = slot_count - 1
+        wanted = hash_launch_command(launch_command)
+        slot = wanted & mask
+        while True:
+            value = SLOT.unpack_from(mapped, offset + slot * SLOT.size)[0]
+            if value == 0:
+                return False
+            if value == wanted:
+                return True
+            slot = (slot + 1) & mask
+
+    def __contains__(self, launch_command: str) -> bool:
+        return self._lookup(0, launch_command)
+
+    def contains_normalized(self, launch_command: str) -> bool:
+        """Checks whether the launch command is in the index ignoring quotes, backticks and spaces."""
+        return self._lookup(1, normalize_launch_command(launch_command))
+
+    def __len__(self) -> int:
+        return self._header(self._current())[1]
+
+    def digest(self) -> str:
+        return self._header(self._current())[3].hex()
+
+
+class LaunchCommandIndexWriter:
+    """
+    Write side of the launch command index. Only the process holding the lock file writes the index: new launch
+    commands are inserted into the mapped tables in place, and the index is rebuilt into a new file that replaces
+    the old one when launch commands were removed or the tables are getting full.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock_file = None
+        # launch commands currently in the index, the baseline for delta updates
+        self.launch_commands: Optional[set[str]] = None
+
+    def try_acquire(self) -> bool:
+        """Tries to become the only writer of the index, returns whether this process is the writer."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + ".lock", "a")
+        try:
+            lock_exclusive(lock_file)
+        except OSError:
+            lock_file.close()
+            return False
+        l.debug("process %s is now the writer of launch command index '%s'", os.getpid(), self.path)
+        self._lock_file = lock_file
+        return True
+
+    def update(self, launch_commands: list[str]):
+        new = set(launch_commands)
+        old = self.launch_commands
+        if old is None or not os.path.exists(self.path):
+            self._rebuild(new)
+        else:
+            added = new - old
+            removed = old - new
+            if removed:
+                l.debug("%s launch commands were removed, rebuilding the index...", len(removed))
+                self._rebuild(new)
+            elif added:
+                self._insert(added, new)
+        self.launch_commands = new
+
+    def _rebuild(self, launch_commands: set[str]):
+        normalized = {normalize_launch_command(launch_command) for launch_command in launch_commands}
+        slot_count = MIN_SLOT_COUNT
+        while slot_count * MAX_LOAD_FACTOR < 2 * len(launch_commands):
+            slot_count *= 2
+        l.debug("building launch command index with %s launch commands and %s slots...",
+                len(launch_commands), slot_count)
+        tables = [bytearray(slot_count * SLOT.size), bytearray(slot_count * SLOT.size)]
+        for table, values in zip(tables, (launch_commands, normalized)):
+            for value in values:
+                insert_hash(table, slot_count, hash_launch_command(value))
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, slot_count, len(launch_commands), len(normalized),
+                                digest_launch_commands(launch_commands)))
+            f.write(tables[0])
+            f.write(tables[1])
+        os.replace(temp_path, self.path)
+
+    def _insert(self, added: set[str], launch_commands: set[str]):
+        with open(self.path, "r+b") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE)
+            try:
+                _, slot_count, exact_count, normalized_count, _ = HEADER.unpack_from(mapped, 0)
+                if (max(exact_count, normalized_count) + len(added)) > slot_count * MAX_LOAD_FACTOR:
+                    mapped.close()
+                    mapped = None
+                    self._rebuild(launch_commands)
+                    return
+                l.debug("inserting %s new launch commands into the index...", len(added))
+                exact = memoryview(mapped)[HEADER.size:HEADER.size + slot_count * SLOT.size]
+                normalized = memoryview(mapped)[HEADER.size + slot_count * SLOT.size:]
+                for launch_command in added:
+                    exact_count += insert_hash(exact, slot_count, hash_launch_command(launch_command))
+                    normalized_count += insert_hash(normalized, slot_count,
+                                                    hash_launch_command(normalize_launch_command(launch_command)))
+                exact.release()
+                normalized.release()
+                HEADER.pack_into(mapped, 0, MAGIC, slot_count, exact_count, normalized_count,
+                                 digest_launch_commands(launch_commands))
+                mapped.flush()
+            finally:
+                if mapped is not None:
+                    mapped.close()
+
+
+def lock_exclusive(lock_file):
+    """Takes an exclusive lock on an open file without blocking, raises OSError if another process holds it."""
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        # msvcrt locks a byte range from the current position, so every process locks the first byte
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def insert_hash(table, slot_count: int, value: int) -> int:
+    """Inserts the hash into the table, returns 1 if it was not in the table yet and 0 otherwise."""
+    mask = slot_count - 1
+    slot = value & mask
+    while True:
+        current = SLOT.unpack_from(table, slot * SLOT.size)[0]
+        if current == value:
+            return 0
+        if current == 0:
+            SLOT.pack_into(table, slot * SLOT.size, value)
+            return 1
+        slot = (slot + 1) & mask
+
+
+_index: Optional[LaunchCommandIndex] = None
+_writer: Optional[LaunchCommandIndexWriter] = None
+
+
+def get_launch_command_index_path() -> str:
+    return os.getenv('LAUNCH_COMMAND_INDEX_PATH', "data/cache/launch_commands.idx")
+
+
+def get_launch_command_index() -> LaunchCommandIndex:
+    global _index
+    if _index is None:
+        _index = LaunchCommandIndex(get_launch_command_index_path())
+    return _index
+
+
+def get_launch_command_index_writer() -> LaunchCommandIndexWriter:
+    global _writer
+    if _writer is None:
+        path = get_launch_command_index_path()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        _writer = LaunchCommandIndexWriter(path)
+    return _writer
+
+
+def _after_fork():
+    # the child must not think it holds the lock of its parent, and its copy of the lock file descriptor
+    # must not keep the lock alive after the parent exits
+    global _index, _writer
+    if _writer is not None and _writer._lock_file is not None:
+        _writer._lock_file.close()
+    _index = None
+    _writer = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
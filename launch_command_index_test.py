@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from launch_command_index import LaunchCommandIndex, LaunchCommandIndexWriter
+
+
+class TestLaunchCommandIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "launch_commands.idx")
+        self.writer = LaunchCommandIndexWriter(self.path)
+        self.index = LaunchCommandIndex(self.path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_exact_and_normalized_lookups(self):
+        self.writer.update(["http://www.bluemaxima.org/a.html", 'http://localflash/lab/"c d".html'])
+        self.assertIn("http://www.bluemaxima.org/a.html", self.index)
+        self.assertNotIn("http://www.bluemaxima.org/b.html", self.index)
+        self.assertNotIn("http://localflash/lab/cd.html", self.index)
+        self.assertTrue(self.index.contains_normalized("http://localflash/lab/cd.html"))
+        self.assertEqual(len(self.index), 2)
+
+    def test_delta_updates(self):
+        self.writer.update(["http://a.html"])
+        digest = self.index.digest()
+        self.writer.update(["http://a.html", "http://b.html"])
+        self.assertIn("http://b.html", self.index)
+        self.assertNotEqual(self.index.digest(), digest)
+        self.writer.update(["http://b.html"])
+        self.assertNotIn("http://a.html", self.index)
+        self.assertIn("http://b.html", self.index)
+
+    def test_grows_when_full(self):
+        launch_commands = [f"http://{i}.html" for i in range(2000)]
+        self.writer.update(launch_commands[:10])
+        self.writer.update(launch_commands)
+        self.assertTrue(all(launch_command in self.index for launch_command in launch_commands))
+        self.assertEqual(len(self.index), 2000)
+
+    def test_single_writer(self):
+        self.assertTrue(self.writer.try_acquire())
+        self.assertFalse(LaunchCommandIndexWriter(self.path).try_acquire())
+
+    def test_single_writer_without_fcntl(self):
+        locked = []
+
+        def locking(fd, mode, size):
+            if locked:
+                raise OSError("locked by another process")
+            locked.append((mode, size))
+
+        msvcrt = SimpleNamespace(LK_NBLCK=2, locking=locking)
+        with patch("launch_command_index.fcntl", None), patch("launch_command_index.msvcrt", msvcrt, create=True):
+            self.assertTrue(self.writer.try_acquire())
+            self.assertFalse(LaunchCommandIndexWriter(self.path).try_acquire())
+        self.assertEqual(locked, [(2, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,15 @@
-import datetime
-import inspect
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 
 import colorlog
 
-LOGFILE_PATH = "logs"
+LOGFILE_PATH = os.getenv('LOGFILE_PATH', "log.log")
+# the log file is rotated once it reaches this size, keeping this many old files
+LOGFILE_MAX_BYTES = int(os.getenv('LOGFILE_MAX_BYTES', 10 * 1000 * 1000))
+LOGFILE_BACKUP_COUNT = int(os.getenv('LOGFILE_BACKUP_COUNT', 5))
 LEVELS = {
     1: 'TTRACE',
     5: 'TRACE',
@@ -16,14 +20,16 @@ LEVELS = {
     50: 'CRITICAL',
 }
 LOGGING_LEVEL = 'TTRACE'
+FORMAT = "[%(asctime)s.%(msecs)03d][%(levelname)s][%(process)d][%(pathname)s:%(lineno)d] -- %(message)s"
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 loggers = {}
 
 logging.addLevelName(1, LEVELS[1])
 logging.addLevelName(5, LEVELS[5])
 handler = logging.StreamHandler()
 handler.setFormatter(colorlog.ColoredFormatter(
-    "%(log_color)s%(message)s",
-    datefmt='%Y-%d-%m %H:%M:%S',
+    "%(log_color)s" + FORMAT,
+    datefmt=DATE_FORMAT,
     reset=True,
     log_colors={
         'TTRACE': 'purple',
@@ -38,11 +44,43 @@ handler.setFormatter(colorlog.ColoredFormatter(
     style='%'
 ))
 
-file_handler = logging.FileHandler(f"log.log", encoding='utf-8')
+file_handler = logging.handlers.RotatingFileHandler(LOGFILE_PATH, maxBytes=LOGFILE_MAX_BYTES,
+                                                    backupCount=LOGFILE_BACKUP_COUNT, encoding='utf-8', delay=True)
+file_handler.setFormatter(logging.Formatter(FORMAT, datefmt=DATE_FORMAT))
 
+# records are formatted and written by a listener thread, the logging thread only puts them in the queue
+log_queue = queue.SimpleQueue()
+queue_handler = logging.handlers.QueueHandler(log_queue)
+listener = logging.handlers.QueueListener(log_queue, handler, file_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
 
-def format_message(msg, func, level):
-    return f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}][{LEVELS[level]}][{os.getpid()}][{func.co_filename}:{func.co_firstlineno}] -- {msg}"
+
+def restart_listener_after_fork():
+    """
+    The listener thread does not survive a fork, so a forked process gets its own.
+    Only the original process rotates the log file, forked ones reopen it after it was rotated.
+    """
+    global log_queue, listener
+    log_queue = queue.SimpleQueue()
+    queue_handler.queue = log_queue
+    child_file_handler = logging.handlers.WatchedFileHandler(LOGFILE_PATH, encoding='utf-8', delay=True)
+    child_file_handler.setFormatter(file_handler.formatter)
+    listener = logging.handlers.QueueListener(log_queue, handler, child_file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+os.register_at_fork(after_in_child=restart_listener_after_fork)
+
+
+def stop_listener():
+    """
+    Writes out the queued records and stops the listener thread. Worker processes of multiprocessing end through
+    os._exit, which skips atexit, so they have to call this before exiting or the records still queued are lost.
+    """
+    if listener._thread is not None:
+        listener.stop()
 
 
 # Yes, very hacky, but it does what I need it to do
@@ -51,9 +89,14 @@ def getLogger(name: str):
         return loggers[name]
 
     logger = colorlog.getLogger(name)
+    log = logger.log
 
     def lmw(msg, level, *args, **kwargs):
-        logger.log(msg=format_message(msg, inspect.currentframe().f_back.f_back.f_code, level), level=level, *args, **kwargs)
+        # bail out before logging looks up the caller or anything gets formatted
+        if not logger.isEnabledFor(level):
+            return
+        # the caller is the one calling the level function that called this one
+        log(level, msg, *args, stacklevel=3, **kwargs)
 
     def ttrace(msg, *args, **kwargs):
         lmw(msg, 1, *args, **kwargs)
@@ -83,8 +126,7 @@ def getLogger(name: str):
     logger.warning = warning
     logger.error = error
     logger.critical = critical
-    logger.addHandler(handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(queue_handler)
     logger.setLevel(LOGGING_LEVEL)
     loggers[name] = logger
     return logger
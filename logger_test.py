@@ -0,0 +1,29 @@
+import multiprocessing
+import multiprocessing.util
+import unittest
+import uuid
+
+import logger
+
+l = logger.getLogger("main")
+
+
+def log_in_worker(marker: str, count: int):
+    multiprocessing.util.Finalize(None, logger.stop_listener, exitpriority=-100)
+    for i in range(count):
+        l.debug("%s %s", marker, i)
+
+
+class TestLogger(unittest.TestCase):
+
+    def test_worker_writes_queued_records(self):
+        marker = uuid.uuid4().hex
+        process = multiprocessing.get_context("fork").Process(target=log_in_worker, args=(marker, 5000))
+        process.start()
+        process.join()
+        with open(logger.LOGFILE_PATH, encoding="utf-8") as f:
+            self.assertEqual(sum(1 for line in f if marker in line), 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
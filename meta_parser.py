@@ -0,0 +1,108 @@
+import threading
+from typing import Optional
+
+from ruamel.yaml import YAML, YAMLError
+from ruamel.yaml.error import MarkedYAMLError
+
+from logger import getLogger
+
+l = getLogger("main")
+
+# YAML(typ="safe") uses the C parser of ruamel.yaml.clib when it is installed, building one per meta file is costly
+_yaml = YAML(typ="safe")
+_yaml_lock = threading.Lock()
+l.debug("parsing YAML meta files with %s", _yaml.Parser.__name__)
+
+
+class MetaParseError(Exception):
+    """A meta file that can't be parsed, with the 1-based line and column of the problem if it is known."""
+
+    def __init__(self, message: str, line: Optional[int] = None, column: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.line = line
+        self.column = column
+
+    def __str__(self) -> str:
+        if self.line is None:
+            return self.message
+        return f"{self.message} (line {self.line}, column {self.column})"
+
+
+def parse_meta(filename: str, data: bytes) -> dict:
+    """
+    Parses the meta file `filename` of a curation from its contents, either YAML or the legacy txt format.
+    Raises MetaParseError with a message for the curator if it can't be parsed.
+    """
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        line, column = position(data[:e.start].decode("utf-8", errors="replace"))
+        raise MetaParseError("The meta file is not valid UTF-8.", line, column) from e
+    if filename.endswith(".yaml") or filename.endswith(".yml"):
+        return parse_yaml(text)
+    if filename.endswith(".txt"):
+        return parse_txt(text)
+    raise MetaParseError(
+        "Meta file is either missing or its filename is incorrect. Are you using Flashpoint Core for curating?")
+
+
+def parse_yaml(text: str) -> dict:
+    try:
+        with _yaml_lock:
+            props = _yaml.load(text)
+    except MarkedYAMLError as e:
+        mark = e.problem_mark or e.context_mark
+        if mark is None:
+            raise MetaParseError("Unable to load meta YAML file") from e
+        raise MetaParseError("Unable to load meta YAML file", mark.line + 1, mark.column + 1) from e
+    except YAMLError as e:
+        raise MetaParseError("Unable to load meta YAML file") from e
+    except ValueError as e:
+        raise MetaParseError("Invalid release date. Ensure entered date is valid.") from e
+    if props is None:
+        raise MetaParseError("The meta file seems to be empty.")
+    if not isinstance(props, dict):
+        raise MetaParseError("Unable to load meta YAML file, it should be a list of `Field: value` lines.")
+    return props
+
+
+def parse_txt(text: str) -> dict:
+    """
+    Parses the legacy meta.txt format in a single pass over its lines. Every line is `Field: value`, split on the
+    first colon, and a value of `|` starts a multiline value made of the tab indented lines that follow it.
+    """
+    props: dict = {}
+    multiline_key: Optional[str] = None
+    multiline: list[str] = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if multiline_key is not None:
+            if line.startswith("\t"):
+                multiline.append(line.strip(" \t"))
+                continue
+            props[multiline_key] = "\n".join(multiline)
+            multiline_key = None
+        if not line.strip():
+            continue
+        key, colon, value = line.partition(":")
+        if not colon:
+            raise MetaParseError("Unable to load meta txt file, every line should be `Field: value`.",
+                                 number, len(line) - len(line.lstrip()) + 1)
+        key = key.strip()
+        value = value.strip()
+        if value == "|":
+            multiline_key = key
+            multiline = []
+        else:
+            props[key] = value
+    if multiline_key is not None:
+        props[multiline_key] = "\n".join(multiline)
+    if "Genre" in props:
+        props["Tags"] = props["Genre"]
+    return props
+
+
+def position(text: str) -> tuple[int, int]:
+    """The 1-based line and column right after `text`."""
+    line = text.count("\n") + 1
+    return line, len(text) - (text.rfind("\n") + 1) + 1
@@ -0,0 +1,54 @@
+import unittest
+
+from meta_parser import MetaParseError, parse_meta
+
+LEGACY_META = """Title: Some Game
+Developer: Someone
+Launch Command: http://www.example.com/game.swf
+
+Original Description: |
+\tA game about things.
+\tIt has: colons too.
+Genre: Arcade; Action
+Notes: |
+\tThe last multiline value.
+"""
+
+
+class TestMetaParser(unittest.TestCase):
+
+    def test_legacy_txt(self):
+        props = parse_meta("meta.txt", LEGACY_META.encode())
+        self.assertEqual(props, {
+            "Title": "Some Game",
+            "Developer": "Someone",
+            "Launch Command": "http://www.example.com/game.swf",
+            "Original Description": "A game about things.\nIt has: colons too.",
+            "Genre": "Arcade; Action",
+            "Tags": "Arcade; Action",
+            "Notes": "The last multiline value.",
+        })
+
+    def test_legacy_txt_error_position(self):
+        with self.assertRaises(MetaParseError) as context:
+            parse_meta("meta.txt", b"Title: Some Game\n  no colon here\n")
+        self.assertEqual((context.exception.line, context.exception.column), (2, 3))
+
+    def test_yaml(self):
+        self.assertEqual(parse_meta("meta.yaml", b"Title: Some Game\nTags: Arcade\n"),
+                         {"Title": "Some Game", "Tags": "Arcade"})
+        with self.assertRaises(MetaParseError) as context:
+            parse_meta("meta.yml", b"Title: Some Game\nTags: [Arcade\n")
+        self.assertEqual(context.exception.message, "Unable to load meta YAML file")
+        self.assertEqual(context.exception.line, 3)
+        with self.assertRaisesRegex(MetaParseError, "empty"):
+            parse_meta("meta.yaml", b"")
+
+    def test_invalid_utf8(self):
+        with self.assertRaises(MetaParseError) as context:
+            parse_meta("meta.yaml", b"Title: Some Game\nNotes: \xff\n")
+        self.assertEqual(str(context.exception), "The meta file is not valid UTF-8. (line 2, column 8)")
+
+
+if __name__ == '__main__':
+    unittest.main()
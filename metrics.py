@@ -0,0 +1,116 @@
+import functools
+import threading
+import time
+from typing import Optional
+
+from cachetools import cached as cachetools_cached
+from cachetools.keys import hashkey
+from prometheus_client import Counter, Gauge, Histogram, start_http_server, generate_latest, CONTENT_TYPE_LATEST
+
+from logger import getLogger
+
+l = getLogger("main")
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+VALIDATION_STAGE_SECONDS = Histogram("curation_validation_stage_seconds",
+                                     "Time spent in each stage of validating a curation.",
+                                     ["stage"], buckets=SECONDS_BUCKETS)
+VALIDATION_RULE_SECONDS = Histogram("curation_validation_rule_seconds",
+                                    "Time spent in each rule of validating a curation.",
+                                    ["rule"], buckets=SECONDS_BUCKETS)
+VALIDATION_SECONDS = Histogram("curation_validation_seconds", "Time spent validating a curation.",
+                               ["archive_type"], buckets=SECONDS_BUCKETS)
+VALIDATIONS = Counter("curation_validations_total", "Validated curations by outcome and archive type.",
+                      ["outcome", "archive_type"])
+ARCHIVE_SIZE_BYTES = Histogram("curation_archive_uncompressed_bytes", "Uncompressed size of validated archives.",
+                               ["archive_type"], buckets=[2 ** 10 * 4 ** i for i in range(13)])
+ARCHIVE_MEMBERS = Histogram("curation_archive_members", "Number of members of validated archives.",
+                            ["archive_type"], buckets=[10 ** i for i in range(7)])
+CACHE_REQUESTS = Counter("curation_validator_cache_requests_total", "Cache lookups by cache and result.",
+                         ["cache", "result"])
+REFERENCE_DATA_FETCH_SECONDS = Histogram("curation_reference_data_fetch_seconds",
+                                         "Time spent fetching a reference data source.",
+                                         ["source", "outcome"], buckets=SECONDS_BUCKETS)
+VALIDATION_QUEUE_DEPTH = Gauge("curation_validation_queue_depth", "Curations waiting for a validation worker.")
+VALIDATION_IN_FLIGHT = Gauge("curation_validation_in_flight", "Curations being validated right now.")
+
+_metrics = {metric._name: metric for metric in
+            [VALIDATION_STAGE_SECONDS, VALIDATION_RULE_SECONDS, VALIDATION_SECONDS, VALIDATIONS, ARCHIVE_SIZE_BYTES, ARCHIVE_MEMBERS,
+             CACHE_REQUESTS, REFERENCE_DATA_FETCH_SECONDS]}
+
+# set in validation worker processes, whose metrics are sent to the process that serves them
+_buffer: Optional[list[tuple[str, float, dict]]] = None
+_buffer_lock = threading.Lock()
+
+
+def record(metric, value: float = 1, **labels):
+    """Observes the value if the metric is a histogram, increments the metric by the value otherwise."""
+    if _buffer is not None:
+        with _buffer_lock:
+            _buffer.append((metric._name, value, labels))
+        return
+    apply(metric._name, value, labels)
+
+
+def apply(name: str, value: float, labels: dict):
+    """Records a metric taken from another process with `take_records`."""
+    metric = _metrics[name]
+    if labels:
+        metric = metric.labels(**labels)
+    if isinstance(metric, Histogram):
+        metric.observe(value)
+    else:
+        metric.inc(value)
+
+
+def buffer_records():
+    """Keeps the metrics recorded from now on in this process until they are taken with `take_records`."""
+    global _buffer
+    _buffer = []
+
+
+def take_records() -> list[tuple[str, float, dict]]:
+    global _buffer
+    with _buffer_lock:
+        records, _buffer = _buffer, []
+    return records
+
+
+class StageTimer:
+    """Records the time between laps as the duration of the stage named by the lap."""
+
+    def __init__(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        record(VALIDATION_STAGE_SECONDS, now - self.last, stage=stage)
+        self.last = now
+
+
+def cached(name: str, cache):
+    """Like `cachetools.cached`, but counts the hits and misses of the cache."""
+
+    def decorator(func):
+        cached_func = cachetools_cached(cache)(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            hit = hashkey(*args, **kwargs) in cache
+            record(CACHE_REQUESTS, 1, cache=name, result="hit" if hit else "miss")
+            return cached_func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_metrics_server(port: int, addr: str = "127.0.0.1"):
+    l.info("serving metrics on http://%s:%s/metrics", addr, port)
+    start_http_server(port, addr=addr)
+
+
+def latest_metrics() -> tuple[bytes, str]:
+    """Returns the metrics in the Prometheus text format and their content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,47 @@
+import unittest
+
+from cachetools import TTLCache
+from prometheus_client import REGISTRY
+
+import metrics
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counts_cache_hits_and_misses(self):
+        calls = []
+
+        @metrics.cached("test", TTLCache(maxsize=1, ttl=3600))
+        def load():
+            calls.append(True)
+            return 1
+
+        misses = sample("curation_validator_cache_requests_total", cache="test", result="miss")
+        hits = sample("curation_validator_cache_requests_total", cache="test", result="hit")
+        load()
+        load()
+        load()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sample("curation_validator_cache_requests_total", cache="test", result="miss"), misses + 1)
+        self.assertEqual(sample("curation_validator_cache_requests_total", cache="test", result="hit"), hits + 2)
+
+    def test_buffered_records_are_applied_elsewhere(self):
+        count = sample("curation_validation_stage_seconds_count", stage="test")
+        metrics.buffer_records()
+        try:
+            metrics.StageTimer().lap("test")
+            records = metrics.take_records()
+        finally:
+            metrics._buffer = None
+        self.assertEqual(sample("curation_validation_stage_seconds_count", stage="test"), count)
+        for name, value, labels in records:
+            metrics.apply(name, value, labels)
+        self.assertEqual(sample("curation_validation_stage_seconds_count", stage="test"), count + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
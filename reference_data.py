@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional
+
+import requests
+from bs4 import BeautifulSoup
+
+from launch_command_index import LaunchCommandIndex, get_launch_command_index, get_launch_command_index_writer, \
+    digest_launch_commands
+from logger import getLogger
+import metrics
+
+l = getLogger("main")
+
+BLUEBOT_URL = os.getenv('BLUEBOT_URL', "https://bluebot.unstable.life")
+WIKI_TAGS_URL = os.getenv('WIKI_TAGS_URL', "https://bluemaxima.org/flashpoint/datahub/Tags")
+SNAPSHOT_FORMAT = 1
+
+
+class ReferenceDataUnavailable(Exception):
+    pass
+
+
+class ReferenceDataSource(NamedTuple):
+    name: str
+    fetch: Callable[[], list[str]]
+    # seconds between two fetches of the source
+    interval: float
+
+
+class ReferenceData(NamedTuple):
+    tags: frozenset[str]
+    launch_commands: LaunchCommandIndex
+    # digest of the tags and launch commands
+    version: str
+
+
+def fetch_launch_commands_bluebot() -> list[str]:
+    l.debug("getting launch commands from bluebot...")
+    resp = requests.get(url=f"{BLUEBOT_URL}/launch-commands", timeout=60)
+    resp.raise_for_status()
+    return resp.json()["launch_commands"]
+
+
+def sync_launch_command_index() -> list[str]:
+    """
+    Updates the shared launch command index from bluebot if this process is its writer.
+    Returns the digest of the launch commands in the index.
+    """
+    writer = get_launch_command_index_writer()
+    if writer.try_acquire():
+        snapshot_dir = get_snapshot_dir()
+        if writer.launch_commands is None and snapshot_dir:
+            # the previous launch commands are the baseline for delta updates of the index
+            snapshot = read_snapshot(snapshot_dir, LAUNCH_COMMAND_LIST_SNAPSHOT)
+            index = get_launch_command_index()
+            if snapshot is not None and index.exists():
+                baseline = set(snapshot["values"])
+                if digest_launch_commands(baseline).hex() == index.digest():
+                    writer.launch_commands = baseline
+        launch_commands = fetch_launch_commands_bluebot()
+        writer.update(launch_commands)
+        if snapshot_dir:
+            write_snapshot(snapshot_dir, LAUNCH_COMMAND_LIST_SNAPSHOT, launch_commands, time.time())
+    index = get_launch_command_index()
+    if not index.exists():
+        raise ReferenceDataUnavailable("the launch command index was not built yet")
+    return [index.digest()]
+
+
+def fetch_tag_list_bluebot() -> list[str]:
+    l.debug("getting tags from bluebot...")
+    resp = requests.get(url=f"{BLUEBOT_URL}/tags", timeout=60)
+    resp.raise_for_status()
+    return resp.json()["tags"]
+
+
+def fetch_tag_list_file() -> list[str]:
+    l.debug("getting tags from file...")
+    with open("data/category_tags.json", "r", encoding="utf-8") as f:
+        data = json.load(f)
+        return data["tags"]
+
+
+def fetch_tag_list_wiki() -> list[str]:
+    l.debug("getting tags from wiki...")
+    tags = []
+    resp = requests.get(url=WIKI_TAGS_URL, timeout=60)
+    resp.raise_for_status()
+    soup = BeautifulSoup(resp.text, "html.parser")
+    tables = soup.find_all("table")
+    for table in tables:
+        rows = table.find_all("tr")
+        for row in rows:
+            cols = row.find_all('td')
+            if len(cols) > 0:
+                col = cols[0]
+                links = row.find_all('a')
+                if len(links) > 0:
+                    tags.append(links[0].contents[0].strip())
+                else:
+                    tags.append(col.contents[0].strip())
+    return tags
+
+
+def get_snapshot_dir() -> str:
+    return os.getenv('REFERENCE_DATA_SNAPSHOT_DIR', "data/snapshots")
+
+
+def read_snapshot(snapshot_dir: str, name: str) -> Optional[dict]:
+    """Reads a snapshot written by `write_snapshot`, None if there is none or it has an unknown format."""
+    path = os.path.join(snapshot_dir, f"{name}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        l.warning("ignoring broken reference data snapshot '%s': %s", path, e)
+        return None
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        l.warning("ignoring reference data snapshot '%s' with unknown format %s", path, snapshot.get('format'))
+        return None
+    return snapshot
+
+
+def write_snapshot(snapshot_dir: str, name: str, values: list[str], fetched_at: float):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = os.path.join(snapshot_dir, f"{name}.json")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "format": SNAPSHOT_FORMAT,
+            "source": name,
+            "fetched_at": fetched_at,
+            "version": hashlib.sha256(json.dumps(values).encode("utf-8")).hexdigest(),
+            "values": values,
+        }, f)
+    os.replace(temp_path, path)
+
+
+LAUNCH_COMMAND_LIST_SNAPSHOT = "bluebot_launch_commands"
+TAG_SOURCES = ["bluebot_tags", "file_tags", "wiki_tags"]
+LAUNCH_COMMAND_SOURCE = "launch_commands"
+SOURCES = [
+    ReferenceDataSource("bluebot_tags", fetch_tag_list_bluebot, 600),
+    ReferenceDataSource("file_tags", fetch_tag_list_file, 3600),
+    ReferenceDataSource("wiki_tags", fetch_tag_list_wiki, 60),
+    ReferenceDataSource(LAUNCH_COMMAND_SOURCE, sync_launch_command_index, 600),
+]
+
+
+def fetch_timed(source: ReferenceDataSource) -> list[str]:
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        values = source.fetch()
+        outcome = "ok"
+        return values
+    finally:
+        metrics.record(metrics.REFERENCE_DATA_FETCH_SECONDS, time.perf_counter() - start,
+                       source=source.name, outcome=outcome)
+
+
+class ReferenceDataRefresher:
+    """
+    Keeps the last good tag list in memory, keeps the shared launch command index up to date and refreshes both
+    in a background thread. Every fetched source is persisted to the snapshot directory, and a new process starts
+    from those snapshots instead of waiting for the network.
+    Due sources are fetched concurrently and the prebuilt snapshot is swapped in at once, so readers never wait
+    on the network after the first snapshot was built. A source that fails to refresh keeps its last good value.
+    Only the process that created the refresher runs the background thread, forked validation workers reload
+    the snapshots it writes every tick instead and share its launch command index.
+    """
+
+    def __init__(self, sources: list[ReferenceDataSource], tick: float = 10, snapshot_dir: Optional[str] = None):
+        self.sources = sources
+        self.tick = tick
+        self.snapshot_dir = snapshot_dir
+        # monotonic time the persisted snapshots were last loaded at, None if they never were
+        self._snapshots_loaded_at: Optional[float] = None
+        self._forked = False
+        self._values: dict[str, list[str]] = {}
+        self._fetched_at: dict[str, float] = {}
+        self._snapshot: Optional[ReferenceData] = None
+        # the sources the served snapshot was last logged to be missing
+        self._reported_missing: list[str] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self, force: bool = False):
+        """Fetches all sources that are due, or all of them if `force` is set, and swaps in a new snapshot."""
+        with self._lock:
+            now = time.time()
+            due = [source for source in self.sources
+                   if force or now - self._fetched_at.get(source.name, 0) >= source.interval]
+            if not due and self._snapshot is not None:
+                return
+            changed = False
+            with ThreadPoolExecutor(max_workers=len(due) or 1, thread_name_prefix="reference_data") as executor:
+                futures = [(source, executor.submit(fetch_timed, source)) for source in due]
+                for source, future in futures:
+                    try:
+                        values = future.result()
+                    except Exception as e:
+                        l.warning("could not refresh reference data source '%s', keeping the last good value: %s",
+                                  source.name, e)
+                        continue
+                    self._fetched_at[source.name] = time.time()
+                    if self.snapshot_dir:
+                        try:
+                            write_snapshot(self.snapshot_dir, source.name, values, self._fetched_at[source.name])
+                        except OSError as e:
+                            l.warning("could not write reference data snapshot of '%s': %s", source.name, e)
+                    if self._values.get(source.name) != values:
+                        self._values[source.name] = values
+                        changed = True
+            if changed or (self._snapshot is None and self._values):
+                self._snapshot = self._build_snapshot()
+
+    def load_snapshots(self):
+        """
+        Loads the persisted snapshots of all sources that are newer than the values in memory, sources are then
+        refreshed once their snapshot is due. The launch command snapshot only holds the digest of the shared
+        index, so it is ignored when the index itself is gone.
+        """
+        with self._lock:
+            self._snapshots_loaded_at = time.monotonic()
+            if not self.snapshot_dir:
+                return
+            loaded = []
+            for source in self.sources:
+                snapshot = read_snapshot(self.snapshot_dir, source.name)
+                if snapshot is None or snapshot["fetched_at"] <= self._fetched_at.get(source.name, 0):
+                    continue
+                if source.name == LAUNCH_COMMAND_SOURCE and not get_launch_command_index().exists():
+                    l.debug("ignoring launch command snapshot, the launch command index doesn't exist")
+                    continue
+                self._fetched_at[source.name] = snapshot["fetched_at"]
+                if self._values.get(source.name) != snapshot["values"]:
+                    self._values[source.name] = snapshot["values"]
+                    loaded.append(source.name)
+            if loaded:
+                l.debug("loaded reference data snapshots of %s from '%s'", loaded, self.snapshot_dir)
+                self._snapshot = self._build_snapshot()
+
+    def _build_snapshot(self) -> ReferenceData:
+        tags = frozenset(tag for name in TAG_SOURCES for tag in self._values.get(name, []))
+        digest = hashlib.sha256()
+        for values in (tags, self._values.get(LAUNCH_COMMAND_SOURCE, [])):
+            for value in sorted(values):
+                digest.update(value.encode("utf-8"))
+                digest.update(b"\0")
+            digest.update(b"\1")
+        l.debug("built reference data snapshot with %s tags", len(tags))
+        return ReferenceData(tags, get_launch_command_index(), digest.hexdigest())
+
+    def get(self) -> ReferenceData:
+        """
+        Returns the last good snapshot, blocking only if there is no snapshot at all, neither a built nor a persisted
+        one. Sources missing from the snapshot are left to the background thread to fetch.
+        """
+        if self._snapshots_loaded_at is None or \
+                (self._forked and time.monotonic() - self._snapshots_loaded_at >= self.tick):
+            self.load_snapshots()
+        self.start()
+        if self._snapshot is None:
+            self.refresh()
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise ReferenceDataUnavailable("no reference data source could be fetched")
+        missing = [source.name for source in self.sources if source.name not in self._fetched_at]
+        if missing != self._reported_missing:
+            self._reported_missing = missing
+            if missing:
+                l.warning("serving reference data without the sources %s, they will be fetched again", missing)
+        return snapshot
+
+    def start(self):
+        """Starts the background refresh thread if it is not running yet, forked processes don't run one."""
+        if self._forked or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, name="reference_data_refresher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            try:
+                self.refresh()
+            except Exception as e:
+                l.error("reference data refresh failed: %s", e)
+
+    def source_ages(self) -> dict[str, Optional[float]]:
+        """Seconds since each source was last fetched successfully, None if it never was."""
+        now = time.time()
+        return {source.name: now - self._fetched_at[source.name] if source.name in self._fetched_at else None
+                for source in self.sources}
+
+    def snapshot_age(self) -> Optional[float]:
+        """Seconds since the least recently refreshed source was fetched, None if any source never was."""
+        ages = self.source_ages().values()
+        return None if None in ages else max(ages, default=0)
+
+    def _after_fork(self):
+        # the lock may have been held by a thread that doesn't exist in the child
+        self._lock = threading.Lock()
+        self._thread = None
+        self._forked = True
+
+
+_refresher = ReferenceDataRefresher(SOURCES, snapshot_dir=get_snapshot_dir())
+os.register_at_fork(after_in_child=_refresher._after_fork)
+
+
+def get_reference_data_refresher() -> ReferenceDataRefresher:
+    return _refresher
+
+
+def get_reference_data() -> ReferenceData:
+    return _refresher.get()
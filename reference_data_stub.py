@@ -0,0 +1,91 @@
+"""
+Stand-in for bluebot and the datahub Tags page that serves recorded reference data snapshots, so the whole
+validation path can be run, tested and benchmarked without network. Point the validator at it with
+BLUEBOT_URL=http://127.0.0.1:8001 and WIKI_TAGS_URL=http://127.0.0.1:8001/datahub/Tags.
+
+Run with `python reference_data_stub.py --port 8001 --snapshot-dir data/snapshots`.
+"""
+import argparse
+import html
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from reference_data import read_snapshot, LAUNCH_COMMAND_LIST_SNAPSHOT
+
+
+class ReferenceDataStub:
+
+    def __init__(self, tags: list[str], launch_commands: list[str], wiki_tags: list[str]):
+        self.tags = tags
+        self.launch_commands = launch_commands
+        self.wiki_tags = wiki_tags
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @classmethod
+    def from_snapshots(cls, snapshot_dir: str) -> "ReferenceDataStub":
+        def values(name: str) -> list[str]:
+            snapshot = read_snapshot(snapshot_dir, name)
+            return snapshot["values"] if snapshot is not None else []
+
+        return cls(values("bluebot_tags"), values(LAUNCH_COMMAND_LIST_SNAPSHOT), values("wiki_tags"))
+
+    def wiki_page(self) -> str:
+        rows = "".join(f"<tr><td><a href=\"#\">{html.escape(tag)}</a></td><td></td></tr>" for tag in self.wiki_tags)
+        return f"<html><body><table><tr><th>Tag</th><th>Description</th></tr>{rows}</table></body></html>"
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serves the snapshots in a background thread and returns the base URL."""
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        threading.Thread(target=self.server.serve_forever, name="reference_data_stub", daemon=True).start()
+        return f"http://{host}:{self.server.server_port}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/tags":
+                    self.respond("application/json", json.dumps({"tags": stub.tags}))
+                elif self.path == "/launch-commands":
+                    self.respond("application/json", json.dumps({"launch_commands": stub.launch_commands}))
+                elif self.path == "/datahub/Tags":
+                    self.respond("text/html", stub.wiki_page())
+                else:
+                    self.send_error(404)
+
+            def respond(self, content_type: str, body: str):
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded reference data snapshots.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--snapshot-dir", default="data/snapshots")
+    args = parser.parse_args()
+    stub = ReferenceDataStub.from_snapshots(args.snapshot_dir)
+    url = stub.start(args.host, args.port)
+    print(f"serving {len(stub.tags)} tags, {len(stub.wiki_tags)} wiki tags and "
+          f"{len(stub.launch_commands)} launch commands on {url}")
+    threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
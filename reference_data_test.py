@@ -0,0 +1,119 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import reference_data
+from launch_command_index import LaunchCommandIndex
+from reference_data import ReferenceDataRefresher, ReferenceDataSource, ReferenceDataUnavailable
+from reference_data_stub import ReferenceDataStub
+
+
+class TestReferenceDataRefresher(unittest.TestCase):
+
+    def test_keeps_last_good_value_when_refresh_fails(self):
+        responses = [["Action"], Exception("wiki is down")]
+
+        def fetch_tags():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        refresher = ReferenceDataRefresher([ReferenceDataSource("wiki_tags", fetch_tags, 0),
+                                            ReferenceDataSource("bluebot_tags", lambda: ["Puzzle"], 3600)],
+                                           tick=3600)
+        snapshot = refresher.get()
+        self.assertEqual(snapshot.tags, frozenset(["Action", "Puzzle"]))
+        refresher.refresh()
+        self.assertIs(refresher.get(), snapshot)
+        self.assertIsNotNone(refresher.snapshot_age())
+
+    def test_unavailable_until_first_fetch(self):
+        def fetch_tags():
+            raise Exception("bluebot is down")
+
+        refresher = ReferenceDataRefresher([ReferenceDataSource("bluebot_tags", fetch_tags, 0)], tick=3600)
+        with self.assertRaises(ReferenceDataUnavailable):
+            refresher.get()
+        self.assertIsNone(refresher.snapshot_age())
+
+    def test_serves_partial_snapshot(self):
+        calls = []
+
+        def fetch_tags():
+            calls.append(None)
+            raise Exception("wiki is down")
+
+        refresher = ReferenceDataRefresher([ReferenceDataSource("wiki_tags", fetch_tags, 0),
+                                            ReferenceDataSource("bluebot_tags", lambda: ["Puzzle"], 3600)],
+                                           tick=3600)
+        with self.assertLogs("main", "WARNING") as logs:
+            self.assertEqual(refresher.get().tags, frozenset(["Puzzle"]))
+            # the missing source is left to the background thread instead of being fetched by every reader
+            self.assertEqual(refresher.get().tags, frozenset(["Puzzle"]))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len([line for line in logs.output if "without the sources ['wiki_tags']" in line]), 1)
+        self.assertIsNone(refresher.snapshot_age())
+
+    def test_starts_from_persisted_snapshots(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            refresher = ReferenceDataRefresher([ReferenceDataSource("bluebot_tags", lambda: ["Action"], 3600)],
+                                               tick=3600, snapshot_dir=snapshot_dir)
+            refresher.get()
+
+            def fetch_tags():
+                raise Exception("bluebot is down")
+
+            restarted = ReferenceDataRefresher([ReferenceDataSource("bluebot_tags", fetch_tags, 3600)],
+                                               tick=3600, snapshot_dir=snapshot_dir)
+            self.assertEqual(restarted.get().tags, frozenset(["Action"]))
+
+    def test_forked_process_reloads_snapshots(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            tags = ["Action"]
+            parent = ReferenceDataRefresher([ReferenceDataSource("bluebot_tags", lambda: list(tags), 0)],
+                                            tick=3600, snapshot_dir=snapshot_dir)
+            parent.get()
+
+            def fetch_tags():
+                raise AssertionError("a forked process doesn't fetch reference data")
+
+            child = ReferenceDataRefresher([ReferenceDataSource("bluebot_tags", fetch_tags, 0)],
+                                           tick=0, snapshot_dir=snapshot_dir)
+            child._after_fork()
+            self.assertEqual(child.get().tags, frozenset(["Action"]))
+            self.assertIsNone(child._thread)
+            tags.append("Puzzle")
+            parent.refresh()
+            self.assertEqual(child.get().tags, frozenset(["Action", "Puzzle"]))
+
+    def test_ignores_launch_command_snapshot_without_index(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            reference_data.write_snapshot(snapshot_dir, "bluebot_tags", ["Action"], time.time())
+            reference_data.write_snapshot(snapshot_dir, reference_data.LAUNCH_COMMAND_SOURCE, ["digest"], time.time())
+            refresher = ReferenceDataRefresher([ReferenceDataSource("bluebot_tags", lambda: ["Action"], 3600),
+                                                ReferenceDataSource(reference_data.LAUNCH_COMMAND_SOURCE,
+                                                                    lambda: ["digest"], 3600)],
+                                               tick=3600, snapshot_dir=snapshot_dir)
+            missing_index = LaunchCommandIndex(os.path.join(snapshot_dir, "launch_commands.index"))
+            with patch("reference_data.get_launch_command_index", return_value=missing_index):
+                refresher.load_snapshots()
+            self.assertEqual(refresher.source_ages()[reference_data.LAUNCH_COMMAND_SOURCE], None)
+            self.assertIsNotNone(refresher.source_ages()["bluebot_tags"])
+
+    def test_fetches_from_stub(self):
+        stub = ReferenceDataStub(["Action"], ["http://a.html"], ["Puzzle", "Arcade"])
+        url = stub.start()
+        try:
+            with patch("reference_data.BLUEBOT_URL", url), patch("reference_data.WIKI_TAGS_URL", f"{url}/datahub/Tags"):
+                self.assertEqual(reference_data.fetch_tag_list_bluebot(), ["Action"])
+                self.assertEqual(reference_data.fetch_launch_commands_bluebot(), ["http://a.html"])
+                self.assertEqual(reference_data.fetch_tag_list_wiki(), ["Puzzle", "Arcade"])
+        finally:
+            stub.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
+from typing import Any, Callable, Generic, NamedTuple, Optional, TypeVar
+
+from logger import getLogger
+from metrics import record, VALIDATION_RULE_SECONDS, VALIDATION_STAGE_SECONDS
+
+l = getLogger("main")
+
+# a rule taking longer than this is logged, so that a slow check shows up before it shows up in the latency
+SLOW_RULE_SECONDS = 1.0
+
+Context = TypeVar("Context")
+
+
+class RuleInput(IntEnum):
+    """What a rule reads, ordered by how much getting it costs."""
+    # the archive listing, read before any rule runs
+    LISTING = 1
+    # the parsed meta file, read from the archive
+    META = 2
+    # the contents of the archive members
+    CONTENT = 3
+    # reference data fetched over the network
+    REMOTE = 4
+
+
+class FatalError(Exception):
+    """Raised by a rule, or while loading an input, when there's no point in running the rules that need more."""
+    pass
+
+
+class RuleResult:
+    def __init__(self):
+        self.errors: list[str] = []
+        self.warnings: list[str] = []
+        self.fatal = False
+
+
+class Rule(NamedTuple):
+    name: str
+    needs: RuleInput
+    # called with the context and the result to add its errors and warnings to
+    check: Callable[[Any, RuleResult], None]
+
+
+class RulePipeline(Generic[Context]):
+    """
+    Runs rules from the cheapest input to the most expensive one, before the rules of an input run its loader
+    prepares it on the context. Once a rule or a loader raises FatalError nothing after it runs or is reported,
+    so the inputs after it aren't loaded. The rules of an input only read the context, so with `threads` they run
+    concurrently, their errors are still reported in the order the rules were given in.
+    """
+
+    def __init__(self, rules: list[Rule], loaders: dict[RuleInput, Callable[[Context], None]], threads: int = 1):
+        self.rules = rules
+        self.loaders = loaders
+        self.threads = threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def run(self, context: Context) -> tuple[list[str], list[str], bool]:
+        """Returns the errors and warnings of the rules that ran, and whether one of them was fatal."""
+        errors: list[str] = []
+        warnings: list[str] = []
+        for needs in RuleInput:
+            loader = self.loaders.get(needs)
+            if loader is not None:
+                start = time.perf_counter()
+                try:
+                    loader(context)
+                except FatalError as e:
+                    errors.append(str(e))
+                    return errors, warnings, True
+                finally:
+                    record(VALIDATION_STAGE_SECONDS, time.perf_counter() - start, stage=needs.name.lower())
+            rules = [rule for rule in self.rules if rule.needs == needs]
+            if self.threads > 1 and len(rules) > 1:
+                results = self.executor().map(lambda rule: self.run_rule(rule, context), rules)
+            else:
+                results = (self.run_rule(rule, context) for rule in rules)
+            for result in results:
+                errors += result.errors
+                warnings += result.warnings
+                if result.fatal:
+                    return errors, warnings, True
+        return errors, warnings, False
+
+    def run_rule(self, rule: Rule, context: Context) -> RuleResult:
+        result = RuleResult()
+        start = time.perf_counter()
+        try:
+            rule.check(context, result)
+        except FatalError as e:
+            result.errors.append(str(e))
+            result.fatal = True
+        finally:
+            seconds = time.perf_counter() - start
+            record(VALIDATION_RULE_SECONDS, seconds, rule=rule.name)
+            if seconds > SLOW_RULE_SECONDS:
+                l.warning("validation rule '%s' took %.2f seconds", rule.name, seconds)
+        return result
+
+    def executor(self) -> ThreadPoolExecutor:
+        # created on first use, so that it isn't inherited by forked validation workers
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="validation_rule")
+            return self._executor
@@ -0,0 +1,66 @@
+import threading
+import unittest
+
+from rule_pipeline import FatalError, Rule, RuleInput, RulePipeline, RuleResult
+
+
+def error(message: str):
+    def check(context: list, result: RuleResult):
+        context.append(message)
+        result.errors.append(message)
+
+    return check
+
+
+def fatal(message: str):
+    def check(context: list, result: RuleResult):
+        context.append(message)
+        raise FatalError(message)
+
+    return check
+
+
+class TestRulePipeline(unittest.TestCase):
+
+    def test_cheap_rules_first(self):
+        pipeline = RulePipeline([Rule("remote", RuleInput.REMOTE, error("remote")),
+                                 Rule("listing", RuleInput.LISTING, error("listing")),
+                                 Rule("meta", RuleInput.META, error("meta"))],
+                                {RuleInput.META: lambda context: context.append("load meta")})
+        context = []
+        self.assertEqual(pipeline.run(context), (["listing", "meta", "remote"], [], False))
+        self.assertEqual(context, ["listing", "load meta", "meta", "remote"])
+
+    def test_fatal_error_skips_the_rest(self):
+        pipeline = RulePipeline([Rule("fatal", RuleInput.LISTING, fatal("fatal")),
+                                 Rule("after", RuleInput.LISTING, error("after")),
+                                 Rule("meta", RuleInput.META, error("meta"))],
+                                {RuleInput.META: lambda context: context.append("load meta")})
+        context = []
+        self.assertEqual(pipeline.run(context), (["fatal"], [], True))
+        self.assertEqual(context, ["fatal"])
+
+    def test_fatal_loader(self):
+        pipeline = RulePipeline([Rule("listing", RuleInput.LISTING, error("listing")),
+                                 Rule("content", RuleInput.CONTENT, error("content"))],
+                                {RuleInput.META: lambda context: fatal("unreadable")(context, RuleResult())})
+        self.assertEqual(pipeline.run([]), (["listing", "unreadable"], [], True))
+
+    def test_concurrent_rules_keep_their_order(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def waiting(message: str):
+            def check(context: list, result: RuleResult):
+                # all three rules have to run at once to get past the barrier
+                barrier.wait()
+                result.warnings.append(message)
+
+            return check
+
+        pipeline = RulePipeline([Rule(name, RuleInput.REMOTE, waiting(name)) for name in ["a", "b", "c"]], {},
+                                threads=3)
+        self.assertEqual(pipeline.run([]), ([], ["a", "b", "c"], False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,31 +1,52 @@
-import zipfile
-
-import py7zr
+import hashlib
+import io
+from typing import BinaryIO, Optional
 
+from archive_backends import get_archive_type, get_backend
 from logger import getLogger
 
 l = getLogger("main")
 max_uncompressed_size = 1000 * 1000 * 1000
 
 
-def get_archive_filenames(path: str) -> list[str]:
-    if path.endswith(".7z"):
-        l.debug(f"reading archive '{path}'...")
-        archive = py7zr.SevenZipFile(path, mode='r')
-        uncompressed_size = archive.archiveinfo().uncompressed
-        if uncompressed_size > max_uncompressed_size:
-            raise ArchiveTooLargeException
-        filenames = archive.getnames()
-    elif path.endswith(".zip"):
-        l.debug(f"reading archive '{path}'...")
-        archive = zipfile.ZipFile(path, mode='r')
-        uncompressed_size = sum([zinfo.file_size for zinfo in archive.filelist])
-        if uncompressed_size > max_uncompressed_size:
-            raise ArchiveTooLargeException
-        filenames = archive.namelist()
-    else:
+def get_archive_filenames(path: str, data: Optional[BinaryIO] = None) -> list[str]:
+    """Lists the archive at the path, or the archive in `data` with the type given by the extension of the path."""
+    archive_type = get_archive_type(path)
+    if archive_type not in ("7z", "zip"):
         raise NotArchiveType
-    return filenames
+    l.debug("reading archive '%s'...", path)
+    members = get_backend(archive_type, file_object=data is not None).list_members(data if data is not None else path)
+    uncompressed_size = sum([member.size for member in members])
+    if uncompressed_size > max_uncompressed_size:
+        raise ArchiveTooLargeException
+    return [member.name for member in members]
+
+
+class HashingWriter(io.BufferedIOBase):
+    """Writes into another file object while computing the SHA-256 of everything written through it."""
+
+    def __init__(self, fp):
+        super().__init__()
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        return self.fp.write(data)
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
+
+def copy_file_and_hash(source, destination, chunk_size: int = 1024 * 1024) -> str:
+    """Copies the source file object into the destination file object and returns the SHA-256 of the copied data."""
+    writer = HashingWriter(destination)
+    while chunk := source.read(chunk_size):
+        writer.write(chunk)
+    return writer.hexdigest()
 
 
 class ArchiveTooLargeException(Exception):
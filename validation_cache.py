@@ -0,0 +1,142 @@
+import base64
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from curation_validator import CurationType, RULESET_VERSION
+from logger import getLogger
+
+l = getLogger("main")
+
+
+class ValidationCache:
+    """
+    Persistent cache of `validate_curation` results, keyed by the SHA-256 of the archive, the validator ruleset
+    version and the reference data version. The least recently used results are evicted once the cache holds more
+    than `max_entries` results or more than `max_bytes` of serialized results.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = 512 * 1000 * 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results ("
+                         "archive_hash TEXT NOT NULL, "
+                         "ruleset_version INTEGER NOT NULL, "
+                         "data_version TEXT NOT NULL, "
+                         "result TEXT NOT NULL, "
+                         "size INTEGER NOT NULL, "
+                         "last_access REAL NOT NULL, "
+                         "PRIMARY KEY (archive_hash, ruleset_version, data_version))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._db.commit()
+
+    def get(self, archive_hash: str, data_version: str) -> Optional[tuple]:
+        with self._lock:
+            row = self._db.execute("SELECT result FROM results "
+                                   "WHERE archive_hash = ? AND ruleset_version = ? AND data_version = ?",
+                                   (archive_hash, RULESET_VERSION, data_version)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE results SET last_access = ? "
+                             "WHERE archive_hash = ? AND ruleset_version = ? AND data_version = ?",
+                             (time.time(), archive_hash, RULESET_VERSION, data_version))
+            self._db.commit()
+        l.debug("validation cache hit for archive %s", archive_hash)
+        return deserialize_result(row[0])
+
+    def put(self, archive_hash: str, data_version: str, result: tuple):
+        serialized = serialize_result(result)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                             (archive_hash, RULESET_VERSION, data_version, serialized, len(serialized), time.time()))
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        evicted = 0
+        for rowid, entry_size in self._db.execute("SELECT rowid, size FROM results ORDER BY last_access, rowid").fetchall():
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM results WHERE rowid = ?", (rowid,))
+            count -= 1
+            size -= entry_size
+            evicted += 1
+        l.debug("evicted %s results from the validation cache", evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def serialize_result(result: tuple) -> str:
+    errors, warnings, is_extreme, curation_type, props, images = result
+    return json.dumps({
+        "errors": errors,
+        "warnings": warnings,
+        "is_extreme": is_extreme,
+        "curation_type": curation_type.name if curation_type is not None else None,
+        "props": props,
+        "images": [{"type": image["type"], "data": base64.b64encode(image["data"]).decode("ascii")} for image in images]
+        if images is not None else None,
+    }, default=encode_value)
+
+
+def encode_value(value) -> object:
+    """Encodes the dates and datetimes YAML meta files can contain, so that `decode_values` restores them."""
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    return str(value)
+
+
+def decode_values(data: dict) -> object:
+    if data.keys() == {"$datetime"}:
+        return datetime.datetime.fromisoformat(data["$datetime"])
+    if data.keys() == {"$date"}:
+        return datetime.date.fromisoformat(data["$date"])
+    return data
+
+
+def deserialize_result(serialized: str) -> tuple:
+    data = json.loads(serialized, object_hook=decode_values)
+    curation_type = CurationType[data["curation_type"]] if data["curation_type"] is not None else None
+    images = [{"type": image["type"], "data": base64.b64decode(image["data"])} for image in data["images"]] \
+        if data["images"] is not None else None
+    return data["errors"], data["warnings"], data["is_extreme"], curation_type, data["props"], images
+
+
+_cache: Optional[ValidationCache] = None
+
+
+def get_validation_cache() -> Optional[ValidationCache]:
+    """Returns the process-wide cache, or None if it was disabled by setting VALIDATION_CACHE_PATH to an empty string."""
+    global _cache
+    path = os.getenv('VALIDATION_CACHE_PATH', "data/cache/validation_cache.sqlite3")
+    if _cache is None and path:
+        _cache = ValidationCache(path,
+                                 max_entries=int(os.getenv('VALIDATION_CACHE_MAX_ENTRIES', 10000)),
+                                 max_bytes=int(os.getenv('VALIDATION_CACHE_MAX_BYTES', 512 * 1000 * 1000)))
+    return _cache
@@ -0,0 +1,48 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from curation_validator import CurationType
+from validation_cache import ValidationCache
+
+
+class TestValidationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ValidationCache(os.path.join(self.temp_dir.name, "cache.sqlite3"), max_entries=2)
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        result = (["error"], ["warning"], True, CurationType.ANIMATION, {"Title": "A"},
+                  [{"type": "logo", "data": b"\x89PNG"}])
+        self.assertIsNone(self.cache.get("hash", "data"))
+        self.cache.put("hash", "data", result)
+        self.assertEqual(self.cache.get("hash", "data"), result)
+        self.assertIsNone(self.cache.get("hash", "other data"))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_round_trip_dates(self):
+        props = {"Title": "A", "Release Date": datetime.date(2020, 1, 2),
+                 "Notes": [datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)]}
+        self.cache.put("hash", "data", ([], [], False, None, props, None))
+        self.assertEqual(self.cache.get("hash", "data")[4], props)
+
+    def test_evicts_least_recently_used(self):
+        result = ([], [], False, None, None, None)
+        self.cache.put("a", "data", result)
+        self.cache.put("b", "data", result)
+        self.cache.get("a", "data")
+        self.cache.put("c", "data", result)
+        self.assertIsNotNone(self.cache.get("a", "data"))
+        self.assertIsNone(self.cache.get("b", "data"))
+        self.assertIsNotNone(self.cache.get("c", "data"))
+
+
+if __name__ == '__main__':
+    unittest.main()
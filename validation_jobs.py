@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+import traceback
+import uuid
+from enum import Enum
+from typing import AsyncIterator, Callable, Optional
+
+from logger import getLogger
+from validation_pool import ValidationPool, get_validation_pool
+
+l = getLogger("api")
+
+
+class JobState(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class ValidationJob:
+    """
+    A curation validated in the background. Progress goes through the stages
+    received, listing, extracting (n out of N members), meta and done.
+    """
+
+    def __init__(self, archive_hash: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.archive_hash = archive_hash
+        self.filename = filename
+        self.state = JobState.queued
+        self.stage = "received"
+        self.done = 0
+        self.total = 0
+        self.result: Optional[tuple] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self._listeners: list[asyncio.Queue] = []
+
+    def update(self, stage: str, done: int, total: int):
+        # reports can arrive from the worker after the job finished
+        if self.finished is not None:
+            return
+        self.state = JobState.running
+        self.stage = stage
+        self.done = done
+        self.total = total
+        self._notify()
+
+    def finish(self, result: tuple):
+        self.result = result
+        self._end(JobState.done)
+
+    def fail(self, error: str):
+        self.error = error
+        self._end(JobState.failed)
+
+    def _end(self, state: JobState):
+        self.state = state
+        self.stage = state.value
+        self.done = self.total = 0
+        self.finished = time.time()
+        self._notify()
+
+    def _notify(self):
+        status = self.status()
+        for listener in self._listeners:
+            listener.put_nowait(status)
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "state": self.state.value,
+            "stage": self.stage,
+            "progress": {"done": self.done, "total": self.total},
+            "elapsed": (self.finished or time.time()) - self.created,
+        }
+
+    async def events(self) -> AsyncIterator[dict]:
+        """Yields the status of the job now and after every change until it is finished."""
+        if self.finished is not None:
+            yield self.status()
+            return
+        listener: asyncio.Queue = asyncio.Queue()
+        self._listeners.append(listener)
+        try:
+            yield self.status()
+            while True:
+                status = await listener.get()
+                yield status
+                if status["state"] in (JobState.done, JobState.failed):
+                    return
+        finally:
+            self._listeners.remove(listener)
+
+
+class ValidationJobs:
+    """
+    Keeps track of the curations validated in the background. Finished jobs are kept for `retention` seconds,
+    a curation submitted again while its job is queued, running or retained is attached to that job.
+    """
+
+    def __init__(self, pool: ValidationPool, retention: float):
+        self.pool = pool
+        self.retention = retention
+        self._jobs: dict[str, ValidationJob] = {}
+        self._by_hash: dict[str, ValidationJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def get(self, job_id: str) -> Optional[ValidationJob]:
+        self.evict_expired()
+        return self._jobs.get(job_id)
+
+    def find(self, archive_hash: str) -> Optional[ValidationJob]:
+        """Returns the job of an archive with the same hash, if there is one to attach to."""
+        self.evict_expired()
+        return self._by_hash.get(archive_hash)
+
+    def submit(self, path: str, filename: str, archive_hash: str, on_finish: Callable[[], None]) -> ValidationJob:
+        """
+        Starts validating the archive at `path` in the background, `on_finish` is called once it is done with it.
+        `filename` is the name the archive was uploaded with.
+        """
+        job = ValidationJob(archive_hash, filename)
+        self._jobs[job.id] = job
+        self._by_hash[archive_hash] = job
+        task = asyncio.create_task(self._run(job, path, on_finish))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        l.debug("submitted validation job %s for '%s'", job.id, filename)
+        return job
+
+    async def _run(self, job: ValidationJob, path: str, on_finish: Callable[[], None]):
+        try:
+            result = await self.pool.validate(path, archive_hash=job.archive_hash, progress=job.update)
+        except Exception as e:
+            l.error("validation job %s failed: %s", job.id, e)
+            # let the archive be submitted again instead of attaching to the failure
+            if self._by_hash.get(job.archive_hash) is job:
+                del self._by_hash[job.archive_hash]
+            job.fail("".join(traceback.format_exception(type(e), value=e, tb=e.__traceback__)))
+        else:
+            job.finish(result)
+        finally:
+            on_finish()
+
+    def evict_expired(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.retention:
+                del self._jobs[job_id]
+                if self._by_hash.get(job.archive_hash) is job:
+                    del self._by_hash[job.archive_hash]
+
+
+_jobs: Optional[ValidationJobs] = None
+
+
+def get_validation_jobs() -> ValidationJobs:
+    global _jobs
+    if _jobs is None:
+        _jobs = ValidationJobs(get_validation_pool(), retention=float(os.getenv('VALIDATION_JOB_RETENTION', 3600)))
+    return _jobs
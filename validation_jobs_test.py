@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+
+from validation_jobs import ValidationJobs, JobState
+
+
+class FakePool:
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.calls = 0
+
+    async def validate(self, filename, archive_hash=None, progress=None):
+        self.calls += 1
+        progress("extracting", 1, 2)
+        await self.release.wait()
+        if filename == "broken.zip":
+            raise ValueError("broken")
+        return [], [], False, None, {"Title": "A"}, []
+
+
+class TestValidationJobs(unittest.IsolatedAsyncioTestCase):
+
+    async def test_reports_progress_and_result(self):
+        pool = FakePool()
+        jobs = ValidationJobs(pool, retention=60)
+        finished = []
+        job = jobs.submit("file.zip", "a.zip", "hash", on_finish=lambda: finished.append(True))
+        self.assertEqual(job.state, JobState.queued)
+        events = job.events()
+        self.assertEqual((await events.__anext__())["stage"], "received")
+        self.assertEqual((await events.__anext__())["progress"], {"done": 1, "total": 2})
+        pool.release.set()
+        self.assertEqual((await events.__anext__())["state"], JobState.done)
+        self.assertEqual(job.result[4], {"Title": "A"})
+        self.assertEqual(finished, [True])
+        self.assertIs(jobs.get(job.id), job)
+
+    async def test_duplicates_attach_to_the_running_job(self):
+        pool = FakePool()
+        jobs = ValidationJobs(pool, retention=60)
+        job = jobs.submit("file.zip", "a.zip", "hash", on_finish=lambda: None)
+        self.assertIs(jobs.find("hash"), job)
+        self.assertIsNone(jobs.find("other hash"))
+        pool.release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(pool.calls, 1)
+
+    async def test_failed_jobs_are_not_attached_to(self):
+        pool = FakePool()
+        pool.release.set()
+        jobs = ValidationJobs(pool, retention=60)
+        job = jobs.submit("broken.zip", "broken.zip", "hash", on_finish=lambda: None)
+        async for _ in job.events():
+            pass
+        self.assertEqual(job.state, JobState.failed)
+        self.assertIn("ValueError", job.error)
+        self.assertIsNone(jobs.find("hash"))
+
+    async def test_expires_finished_jobs(self):
+        pool = FakePool()
+        pool.release.set()
+        jobs = ValidationJobs(pool, retention=0)
+        job = jobs.submit("file.zip", "a.zip", "hash", on_finish=lambda: None)
+        async for _ in job.events():
+            pass
+        job.finished -= 1
+        self.assertIsNone(jobs.get(job.id))
+        self.assertIsNone(jobs.find("hash"))
+
+
+if __name__ == '__main__':
+    unittest.main()
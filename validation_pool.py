@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from curation_validator import validate_curation, get_tag_list, get_launch_commands_bluebot, \
+    get_extreme_tag_list_file, get_bad_system_files_file, get_reference_data_version, ProgressCallback, no_progress
+from language_registry import get_language_registry
+from logger import getLogger, stop_listener
+import metrics
+from validation_cache import get_validation_cache
+
+l = getLogger("main")
+
+
+class ValidationQueueFull(Exception):
+    pass
+
+
+# the queue a worker process sends progress reports of its jobs and its metrics through, set up by `warm_up_worker`
+_progress_queue: Optional[multiprocessing.Queue] = None
+
+
+def warm_up_worker(progress_queue: Optional[multiprocessing.Queue] = None):
+    """Loads the reference data into a fresh worker process so that its first job doesn't have to."""
+    global _progress_queue
+    _progress_queue = progress_queue
+    # run by multiprocessing as the worker exits, after everything else it cleans up so that its logs are written
+    multiprocessing.util.Finalize(None, stop_listener, exitpriority=-100)
+    if progress_queue is not None:
+        metrics.buffer_records()
+    l.debug("warming up validation worker %s...", os.getpid())
+    try:
+        get_tag_list()
+        get_launch_commands_bluebot()
+        get_extreme_tag_list_file()
+        get_bad_system_files_file()
+        get_language_registry().is_alpha2("en")
+    except Exception as e:
+        # the worker is still usable, the data will be fetched again by the first job
+        l.warning("could not warm up validation worker %s: %s", os.getpid(), e)
+
+
+def validate_in_worker(filename: str, job_token: Optional[int]):
+    """Runs `validate_curation` in a worker process, sending its progress to the pool if it asked for it."""
+    if _progress_queue is None:
+        return validate_curation(filename)
+
+    def report(stage: str, done: int, total: int):
+        _progress_queue.put(("progress", job_token, stage, done, total))
+
+    try:
+        return validate_curation(filename, report if job_token is not None else no_progress)
+    finally:
+        _progress_queue.put(("metrics", metrics.take_records()))
+
+
+class ValidationPool:
+    """
+    Runs `validate_curation` in a pool of long-lived worker processes so that the event loop never blocks on it.
+    At most `max_workers` archives are validated at once and at most `max_queued` more are waiting for a worker.
+    """
+
+    def __init__(self, max_workers: int, max_queued: int):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        # jobs that were handed to the executor, either running or waiting in its queue
+        self.pending = 0
+        # jobs that are waiting for room in the queue
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(max_workers + max_queued)
+        self._progress_queue = multiprocessing.Queue()
+        self._progress_listeners: dict[int, tuple[asyncio.AbstractEventLoop, ProgressCallback]] = {}
+        self._job_tokens = itertools.count()
+        self._executor = self._new_executor()
+        self._executor_lock = threading.Lock()
+        threading.Thread(target=self._forward_reports, name="validation-reports", daemon=True).start()
+        metrics.VALIDATION_QUEUE_DEPTH.set_function(lambda: self.queued)
+        metrics.VALIDATION_IN_FLIGHT.set_function(lambda: self.in_flight)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, initializer=warm_up_worker,
+                                   initargs=(self._progress_queue,))
+
+    def _restart_executor(self, broken: ProcessPoolExecutor):
+        """Replaces the broken executor, unless a job that failed along with it already did."""
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            broken.shutdown(wait=False)
+            self._executor = self._new_executor()
+
+    def _forward_reports(self):
+        """
+        Hands the progress reports of the worker processes to the listeners on their event loops
+        and records the metrics of the worker processes in this one.
+        """
+        while True:
+            report = self._progress_queue.get()
+            if report is None:
+                return
+            if report[0] == "metrics":
+                for name, value, labels in report[1]:
+                    metrics.apply(name, value, labels)
+                continue
+            _, job_token, stage, done, total = report
+            listener = self._progress_listeners.get(job_token)
+            if listener is not None:
+                loop, progress = listener
+                loop.call_soon_threadsafe(progress, stage, done, total)
+
+    @property
+    def in_flight(self) -> int:
+        return min(self.pending, self.max_workers)
+
+    @property
+    def queued(self) -> int:
+        return self.pending - self.in_flight + self.waiting
+
+    def is_full(self) -> bool:
+        return self._slots.locked()
+
+    async def validate(self, filename: str, wait: bool = True, archive_hash: Optional[str] = None,
+                       progress: Optional[ProgressCallback] = None):
+        """
+        Validates the archive in a worker process and returns the result of `validate_curation`.
+        If the SHA-256 of the archive is given, the result is looked up in and stored to the validation cache.
+        If the queue is full, waits for room or raises `ValidationQueueFull` when `wait` is False.
+        If `progress` is given, it is called on the event loop with the progress the worker reports.
+        """
+        loop = asyncio.get_running_loop()
+        cache = get_validation_cache() if archive_hash is not None else None
+        data_version = None
+        if cache is not None:
+            try:
+                data_version = await loop.run_in_executor(None, get_reference_data_version)
+            except Exception as e:
+                l.warning("could not compute reference data version, not using the validation cache: %s", e)
+                cache = None
+        if cache is not None:
+            result = await loop.run_in_executor(None, cache.get, archive_hash, data_version)
+            metrics.record(metrics.CACHE_REQUESTS, cache="validation_results",
+                           result="hit" if result is not None else "miss")
+            if result is not None:
+                return result
+
+        if not wait and self.is_full():
+            raise ValidationQueueFull
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.pending += 1
+        job_token = None
+        if progress is not None:
+            job_token = next(self._job_tokens)
+            self._progress_listeners[job_token] = (loop, progress)
+        executor = self._executor
+        try:
+            result = await loop.run_in_executor(executor, validate_in_worker, filename, job_token)
+        except BrokenProcessPool:
+            l.error("validation worker died while validating '%s', restarting the pool...", filename)
+            self._restart_executor(executor)
+            raise
+        finally:
+            self._progress_listeners.pop(job_token, None)
+            self.pending -= 1
+            self._slots.release()
+
+        if cache is not None:
+            await loop.run_in_executor(None, cache.put, archive_hash, data_version, result)
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._progress_queue.put(None)
+
+
+_pool: Optional[ValidationPool] = None
+
+
+def get_validation_pool() -> ValidationPool:
+    global _pool
+    if _pool is None:
+        _pool = ValidationPool(max_workers=int(os.getenv('VALIDATION_WORKERS', os.cpu_count() or 1)),
+                               max_queued=int(os.getenv('VALIDATION_QUEUE_SIZE', 16)))
+    return _pool
@@ -0,0 +1,23 @@
+import unittest
+
+from validation_pool import ValidationPool
+
+
+class TestValidationPool(unittest.TestCase):
+
+    def test_restarts_broken_executor_once(self):
+        pool = ValidationPool(max_workers=1, max_queued=1)
+        try:
+            broken = pool._executor
+            pool._restart_executor(broken)
+            restarted = pool._executor
+            self.assertIsNot(restarted, broken)
+            # another job that failed with the same executor doesn't replace the restarted one
+            pool._restart_executor(broken)
+            self.assertIs(pool._executor, restarted)
+        finally:
+            pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,47 +1,247 @@
+import base64
+import json
 import pathlib
 import tempfile
 import traceback
+from enum import Enum
 
-from fastapi import FastAPI, File, UploadFile, Response, status
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+import os
 import shutil
 
-from curation_validator import validate_curation
+from dotenv import load_dotenv
+
+# the project modules read their settings when they are imported, so .env has to be loaded before them
+load_dotenv()
+
+import util
+from image_store import get_image_store, InvalidImage
 from logger import getLogger
+from metrics import latest_metrics
+from reference_data import get_reference_data_refresher
+from validation_jobs import get_validation_jobs
+from validation_pool import get_validation_pool, ValidationQueueFull
 
 l = getLogger("api")
 
 app = FastAPI()
 
+# seconds a client is asked to wait before retrying when the validation queue is full
+RETRY_AFTER = int(os.getenv('VALIDATOR_RETRY_AFTER', 5))
+
+
+class InlineImages(str, Enum):
+    none = "none"
+    thumbnail = "thumbnail"
+    full = "full"
+
+
+def describe_images(request: Request, images: list[dict], inline_images: InlineImages) -> list[dict]:
+    """Stores the images and returns references to them, with the image data inlined as requested."""
+    image_store = get_image_store()
+    described = []
+    for image in images:
+        image_hash = image_store.put(image["data"])
+        description = {
+            "type": image["type"],
+            "hash": image_hash,
+            "size": len(image["data"]),
+            "url": str(request.url_for("get_image", image_hash=image_hash)),
+            "thumbnail_url": str(request.url_for("get_image_thumbnail", image_hash=image_hash)),
+        }
+        if inline_images == InlineImages.full:
+            description["data"] = base64.b64encode(image["data"])
+        elif inline_images == InlineImages.thumbnail:
+            try:
+                description["data"] = base64.b64encode(image_store.get_thumbnail(image_hash, 256))
+            except InvalidImage as e:
+                # the image is still described, only without its data
+                l.warning("not inlining thumbnail: %s", e)
+        described.append(description)
+    return described
+
 
 @app.post("/upload/")
-async def create_upload_file(response: Response, file: UploadFile = File(...)):
-    l.debug(f"received file '{file.filename}'")
+async def create_upload_file(request: Request, response: Response, file: UploadFile = File(...),
+                             inline_images: InlineImages = InlineImages.none):
+    l.debug("received file '%s'", file.filename)
+    pool = get_validation_pool()
+    if pool.is_full():
+        return shed_load()
     base_path = tempfile.mkdtemp(prefix="curation_validator_")
     new_filepath = base_path + "/file" + pathlib.Path(file.filename).suffix
-    with open(new_filepath, "wb") as dest:
-        l.debug(f"copying file '{file.filename}' into '{new_filepath}'.")
-        shutil.copyfileobj(file.file, dest)
     try:
-        curation_errors, curation_warnings, is_extreme, curation_type, meta, image_dict = validate_curation(new_filepath)
-    except Exception as e:
-        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-        return {
-            "exception": "".join(
-                traceback.format_exception(
-                    etype=type(e), value=e, tb=e.__traceback__
+        l.debug("copying file '%s' into '%s'.", file.filename, new_filepath)
+        archive_hash = await run_in_threadpool(copy_upload, file, new_filepath)
+        try:
+            result = await pool.validate(new_filepath, wait=False, archive_hash=archive_hash)
+        except ValidationQueueFull:
+            return shed_load()
+        except Exception as e:
+            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            return {
+                "exception": "".join(
+                    traceback.format_exception(
+                        type(e), value=e, tb=e.__traceback__
+                    )
                 )
-            )
-        }
-
-    l.debug(f"removing '{new_filepath}'.")
-    shutil.rmtree(base_path)
+            }
+        described = await run_in_threadpool(describe_result, request, result, inline_images)
+    finally:
+        l.debug("removing '%s'.", new_filepath)
+        shutil.rmtree(base_path, True)
     return {
         "filename": file.filename,
         "path": new_filepath,
+        **described,
+    }
+
+
+def describe_result(request: Request, result: tuple, inline_images: InlineImages) -> dict:
+    curation_errors, curation_warnings, is_extreme, curation_type, meta, image_dict = result
+    return {
         "curation_errors": curation_errors,
         "curation_warnings": curation_warnings,
         "is_extreme": is_extreme,
         "curation_type": curation_type,
         "meta": meta,
-        "images": image_dict
+        "images": describe_images(request, image_dict, inline_images) if image_dict is not None else None
+    }
+
+
+def copy_upload(file: UploadFile, filepath: str) -> str:
+    with open(filepath, "wb") as dest:
+        return util.copy_file_and_hash(file.file, dest)
+
+
+def shed_load() -> JSONResponse:
+    l.warning("validation queue is full, rejecting upload")
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers={"Retry-After": str(RETRY_AFTER)},
+                        content={"detail": "The validator is busy, try again later."})
+
+
+def pool_status() -> dict:
+    pool = get_validation_pool()
+    return {
+        "max_workers": pool.max_workers,
+        "max_queued": pool.max_queued,
+        "in_flight": pool.in_flight,
+        "queued": pool.queued,
+        "saturation": pool.pending / (pool.max_workers + pool.max_queued),
+    }
+
+
+@app.post("/jobs/", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(request: Request, file: UploadFile = File(...)):
+    l.debug("received file '%s' for a validation job", file.filename)
+    jobs = get_validation_jobs()
+    base_path = tempfile.mkdtemp(prefix="curation_validator_")
+    new_filepath = base_path + "/file" + pathlib.Path(file.filename).suffix
+    try:
+        archive_hash = await run_in_threadpool(copy_upload, file, new_filepath)
+        job = jobs.find(archive_hash)
+        if job is not None:
+            l.debug("'%s' is already being validated by job %s", file.filename, job.id)
+            shutil.rmtree(base_path, True)
+        elif jobs.pool.is_full():
+            shutil.rmtree(base_path, True)
+            return shed_load()
+        else:
+            job = jobs.submit(new_filepath, file.filename, archive_hash,
+                              on_finish=lambda: shutil.rmtree(base_path, True))
+    except BaseException:
+        shutil.rmtree(base_path, True)
+        raise
+    return describe_job(request, job)
+
+
+def describe_job(request: Request, job) -> dict:
+    return {
+        **job.status(),
+        "url": str(request.url_for("get_job", job_id=job.id)),
+        "events_url": str(request.url_for("get_job_events", job_id=job.id)),
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str, inline_images: InlineImages = InlineImages.none):
+    job = get_validation_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found or expired.")
+    described = describe_job(request, job)
+    if job.result is not None:
+        described["result"] = await run_in_threadpool(describe_result, request, job.result, inline_images)
+    if job.error is not None:
+        described["exception"] = job.error
+    return described
+
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """Streams the status of the job as server-sent events until it is finished."""
+    job = get_validation_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found or expired.")
+
+    async def stream():
+        async for job_status in job.events():
+            yield f"event: {job_status['state']}\ndata: {json.dumps(job_status)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.on_event("shutdown")
+def shutdown_validation_pool():
+    get_validation_pool().shutdown()
+
+
+@app.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness(response: Response):
+    if get_validation_pool().is_full():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+        return {"status": "saturated", "pool": pool_status()}
+    return {"status": "ready", "pool": pool_status()}
+
+
+@app.get("/images/{image_hash}")
+async def get_image(image_hash: str):
+    path = get_image_store().get_path(image_hash)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found or expired.")
+    return FileResponse(path, media_type="image/png")
+
+
+@app.get("/images/{image_hash}/thumbnail")
+async def get_image_thumbnail(image_hash: str, size: int = 256):
+    try:
+        # generating a thumbnail decodes and encodes the image, which would block the event loop
+        data = await run_in_threadpool(get_image_store().get_thumbnail, image_hash, size)
+    except InvalidImage:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="The image can't be decoded.")
+    if data is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found or expired.")
+    return Response(content=data, media_type="image/png")
+
+
+@app.get("/metrics")
+async def get_metrics():
+    data, content_type = latest_metrics()
+    return Response(content=data, media_type=content_type)
+
+
+@app.get("/reference-data/")
+async def reference_data_status():
+    refresher = get_reference_data_refresher()
+    return {
+        "snapshot_age": refresher.snapshot_age(),
+        "source_ages": refresher.source_ages(),
     }
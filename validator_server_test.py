@@ -0,0 +1,52 @@
+import asyncio
+import importlib
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from fastapi.testclient import TestClient
+
+from image_store import ImageStore
+
+validator_server = importlib.import_module("validator-server")
+
+
+class TestValidatorServer(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = ImageStore(self.temp_dir.name, ttl=60)
+        patcher = patch.object(validator_server, "get_image_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_thumbnail_of_invalid_image(self):
+        image_hash = self.store.put(b"not an image")
+        response = TestClient(validator_server.app).get(f"/images/{image_hash}/thumbnail")
+        self.assertEqual(response.status_code, 422)
+
+    def test_thumbnail_off_event_loop(self):
+        def get_thumbnail(image_hash: str, size: int) -> bytes:
+            with self.assertRaises(RuntimeError):
+                asyncio.get_running_loop()
+            return b"thumbnail"
+
+        with patch.object(self.store, "get_thumbnail", side_effect=get_thumbnail):
+            response = TestClient(validator_server.app).get("/images/0/thumbnail")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"thumbnail")
+
+    def test_inline_thumbnail_of_invalid_image(self):
+        request = Mock()
+        request.url_for.return_value = "http://validator/image"
+        described = validator_server.describe_images(request, [{"type": "logo", "data": b"not an image"}],
+                                                     validator_server.InlineImages.thumbnail)
+        self.assertEqual(len(described), 1)
+        self.assertNotIn("data", described[0])
+
+
+if __name__ == '__main__':
+    unittest.main()